@@ -1,7 +1,10 @@
 from flask import Flask
-from .routes import main
+from app_logging import request_timing
+from .routes import main, routes
 
 def create_app():
     app = Flask(__name__)
+    request_timing.install(app)  # per-request parsing/storage/... breakdown, Server-Timing header
     app.register_blueprint(main)
+    app.register_blueprint(routes)
     return app
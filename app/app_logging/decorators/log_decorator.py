@@ -1,13 +1,29 @@
 #  Purpose:
+#     Decorator that logs calls, timing and failures of the wrapped function.
 #
+#     Every call's duration is also recorded in the metrics registry (served at GET /metrics),
+#     whether or not the log line itself was sampled. With phase="storage" (parsing, ...) it
+#     is also added to the current request's phase totals (see app_logging/request_timing.py),
+#     and the time spent writing the log lines themselves counts as the "logging" phase.
 #
 #  Key Attributes:
-#
+#     - debug_enabled: log the call arguments (DEBUG) instead of just the call (INFO)
+#     - metrics: MetricsRegistry the timings go to (app_logging.metrics.registry by default)
 #
 #  Main Methods:
-#
+#     - log_this(func, level, sample_every, max_per_second, phase): the decorator
+#         sample_every=N logs only every Nth call, max_per_second caps the log rate
+#         of a hot function. Failures are always logged.
+#     - time_this(func, phase): the same timing (metrics + phase) without any log lines,
+#         for hot helpers such as parsers or store inserts
 #
 #  Example:
+#     log = LogDecorator(debug_enabled=False)
+#
+#     @log.log_this(sample_every=100, max_per_second=5)
+#     def update_dht22_data(raw_txt): ...
+#
+#     insert = log.time_this(store.insert_dht22, phase="storage")
 
 # File Header: app/decorators/log_decorator.py
 
@@ -31,12 +47,36 @@ Logging.CRITICAL 50 A serious error, indicating that the program itself may be u
 """
 
 import functools  # Provides tools to work with functions
+import itertools  # call counter used for sampling
+import threading
 import time  # used for timestamps (when an event happened)
 import os  # to check environment variables
 from typing import Callable  # Used in this code for readability. Returns something you can call, such a method
 
 import logging
+from app_logging import request_timing
 from app_logging.log_utils import Logger
+from app_logging.metrics import MetricsRegistry, registry
+
+
+class RateLimiter:
+    """Token bucket: allow() returns True at most `rate` times per second (bursts up to `rate`)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
 
 
 class LogDecorator:
@@ -48,51 +88,73 @@ class LogDecorator:
        - logs errors with full traceback
        """
 
-    def __init__(self, debug_enabled: bool = True):
+    def __init__(self, debug_enabled: bool = True, metrics: MetricsRegistry | None = None):
         self.logger = Logger().get_logger()
 
         # Allow debug mode. Its TRUE as of now. False for production level for cleaner logs
         self.debug_enabled = debug_enabled
+        self.metrics = metrics or registry
 
     def start_timer(self):
-        return time.time()  # Timer to track execution time
+        return time.perf_counter()  # Timer to track execution time (monotonic, sub-microsecond)
 
     def end_timer(self, start_time):
-        return (time.time() - start_time) * 1000  # milliseconds (1 ms = 0.001 seconds)
+        return (time.perf_counter() - start_time) * 1000  # milliseconds (1 ms = 0.001 seconds)
 
-    def log_this(self, func=None, level=logging.INFO) -> Callable:  # the parameter is the function you're going to decorate
+    def log_this(self, func=None, level=logging.INFO, sample_every: int = 1,
+                 max_per_second: float | None = None,
+                 phase: str | None = None) -> Callable:  # the parameter is the function you're going to decorate
         """
         Decorator factory: accepts a log level (default is INFO).
         Returns the actual decorator that wraps the targeted function.
+        Messages use lazy %-formatting, so nothing is formatted when the level is filtered out.
         """
 
         def decorator(func):
+            func_name = func.__name__  # stores the function name for cleaner code
+            metric_name = func.__qualname__  # "SensorPipeline.update_dht22_data" rather than just the method
+            calls = itertools.count()
+            limiter = RateLimiter(max_per_second) if max_per_second else None
+
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
-                func_name = func.__name__  # stores the function name for cleaner code
-
-                # If debug mode is True
-                if self.debug_enabled:
-                    self.logger.debug(f"Entering {func_name} with args={args} , kwargs={kwargs}")
-                else:  # Use the stander log message
-                    self.logger.info(f"Calling: {func_name}")
+                logger = self.logger
+                # sampled calls get the entry/completion lines, failures are logged regardless
+                sampled = next(calls) % sample_every == 0 and (limiter is None or limiter.allow())
+
+                if sampled:
+                    log_start = self.start_timer()
+                    # If debug mode is True
+                    if self.debug_enabled:
+                        logger.debug("Entering %s with args=%r , kwargs=%r", func_name, args, kwargs)
+                    else:  # Use the stander log message
+                        logger.info("Calling: %s", func_name)
+                    request_timing.record("logging", self.end_timer(log_start) / 1000)
 
                 start = self.start_timer()
 
                 try:
                     result = func(*args, **kwargs)
                     duration_in_milliseconds = self.end_timer(start)
-
-                    self.logger.log(level, f"{func_name} was completed in {duration_in_milliseconds:.2f}ms")
+                    self.metrics.observe_function(metric_name, duration_in_milliseconds / 1000)
+                    if phase is not None:
+                        request_timing.record(phase, duration_in_milliseconds / 1000)
+                    if sampled and logger.isEnabledFor(level):
+                        log_start = self.start_timer()
+                        logger.log(level, "%s was completed in %.2fms", func_name, duration_in_milliseconds)
+                        request_timing.record("logging", self.end_timer(log_start) / 1000)
 
                     return result
 
                 except Exception as e:
                     duration_in_milliseconds = self.end_timer(start)
-                    self.logger.error(f"{func_name} failed with error {e} after {duration_in_milliseconds:.2f}ms",
-                                      exc_info=True)  # exc_info=True is key for debugging.
-                                                      # shows exactly where the error happened
-                                                      # tells the logger to include the full traceback in the log
+                    self.metrics.observe_function(metric_name, duration_in_milliseconds / 1000, failed=True)
+                    if phase is not None:
+                        request_timing.record(phase, duration_in_milliseconds / 1000)
+                    logger.error("%s failed with error %s after %.2fms", func_name, e, duration_in_milliseconds,
+                                 exc_info=True)  # exc_info=True is key for debugging.
+                                                 # shows exactly where the error happened
+                                                 # tells the logger to include the full traceback in the log
                     raise
 
             return wrapper
@@ -101,3 +163,33 @@ class LogDecorator:
             return decorator
         else:
             return decorator(func)
+
+    def time_this(self, func=None, phase: str | None = None) -> Callable:
+        """
+        Timing half of log_this: metrics histogram and request phase, no log lines at all.
+        Use it on helpers called for every reading, where even sampled logging is noise.
+        """
+
+        def decorator(func):
+            metric_name = func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = self.start_timer()
+                failed = True
+                try:
+                    result = func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    seconds = self.end_timer(start) / 1000
+                    self.metrics.observe_function(metric_name, seconds, failed=failed)
+                    if phase is not None:
+                        request_timing.record(phase, seconds)
+
+            return wrapper
+
+        if func is None:
+            return decorator
+        else:
+            return decorator(func)
@@ -3,23 +3,57 @@
 #     (INFO, WARNING, ERROR) to a file for monitoring and debugging.
 #
 #  Key Attributes:
-#
+#     - log_path: file the records end up in (LOG_FILE env var, default app/logs/log.txt)
+#     - async_mode: when True (or LOG_ASYNC=1) records go through a bounded in-memory queue
+#                   and a background listener thread does the formatting and file writes
+#     - queue_size: bound of that queue; records arriving while it is full are dropped and counted
 #
 #  Main Methods:
 #     info(message): Logs informational messages
 #     warning(message): Logs warning messages
 #     error(message): Logs error messages
+#     get_logger(): returns the configured logging.Logger
+#     shutdown(): drain the queue and stop the listener thread (registered with atexit)
 #
 #  Example:
+#     logger = Logger(async_mode=True).get_logger()
+#     logger.info("sensor %s accepted", "dht22")  # enqueued, written by the listener thread
 
 # File Header: app/app_logging/log_utils.py
 
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import time
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller: a full queue drops the record (and counts it)
+    instead of waiting on the disk. Formatting is left to the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue never leaves this process, so skip the eager format/copy the stdlib does
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
 
 class Logger:
-    def __init__(self, log_file=None):
+    _listeners = {}  # logger name -> running QueueListener, one per process
+
+    def __init__(self, log_file=None, async_mode=None, queue_size=10000, name="AppLogger"):
         base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
         log_path = log_file or os.path.join(base_dir, os.getenv("LOG_FILE", "app/logs/log.txt"))
 
@@ -27,9 +61,14 @@ class Logger:
         os.makedirs(os.path.dirname(log_path), exist_ok=True)
 
         self.log_path = log_path  # Fix: ensure log_path is stored for use in get_logger
+        if async_mode is None:
+            async_mode = os.getenv("LOG_ASYNC", "").lower() in ("1", "true", "yes")
+        self.async_mode = async_mode
+        self.queue_size = queue_size
+        self.name = name
 
     def get_logger(self) -> logging:
-        self.logger = logging.getLogger("AppLogger")
+        self.logger = logging.getLogger(self.name)
         self.logger.setLevel(logging.DEBUG)
 
         if not self.logger.handlers:
@@ -41,6 +80,29 @@ class Logger:
             formatter = logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s",
                                           "%Y-%m-%d %H:%M:%S")  # time format
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+
+            if self.async_mode:
+                log_queue = queue.Queue(maxsize=self.queue_size)
+                listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+                listener.start()
+                Logger._listeners[self.name] = listener
+                self.logger.addHandler(DroppingQueueHandler(log_queue))
+                atexit.register(Logger.shutdown, self.name)
+            else:
+                self.logger.addHandler(file_handler)
 
         return self.logger
+
+    @staticmethod
+    def shutdown(name="AppLogger") -> None:
+        """Write out everything still queued and stop the listener thread."""
+        listener = Logger._listeners.pop(name, None)
+        if listener is not None:
+            while True:
+                try:
+                    listener.stop()  # enqueues a sentinel and joins, so the queue is fully drained
+                    break
+                except queue.Full:
+                    time.sleep(0.01)  # listener is still catching up, room for the sentinel soon
+            for handler in listener.handlers:
+                handler.close()
@@ -0,0 +1,166 @@
+#  Purpose:
+#     In-memory call counters and fixed-bucket latency histograms, fed by LogDecorator
+#     (per function), the Flask request hooks (per route) and request_timing (per route and
+#     phase), exposed in Prometheus text format.
+#     Recording a sample is a bisect plus three additions under a lock, cheap enough to leave on.
+#
+#  Key Attributes:
+#     - DEFAULT_BUCKETS: histogram upper bounds in seconds (+Inf is implicit)
+#     - registry: process-wide MetricsRegistry used by LogDecorator and the routes
+#
+#  Main Methods:
+#     - Histogram.observe(seconds): add one sample
+#     - MetricsRegistry.observe_function(name, seconds, failed): record a decorated call
+#     - MetricsRegistry.observe_request(route, method, status, seconds): record an HTTP request
+#     - MetricsRegistry.observe_phase(route, phase, seconds): time one request spent in parsing, storage, ...
+#     - MetricsRegistry.render(): Prometheus text exposition of everything recorded
+#
+#  Example:
+#     registry.observe_function("SensorPipeline.update_dht22_data", 0.0004)
+#     print(registry.render())
+#
+#  Sources:
+#     - https://prometheus.io/docs/instrumenting/exposition_formats/
+
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)  # first bucket with bound >= seconds
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        """Cumulative bucket counts (Prometheus "le" semantics), sum and count."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = []
+        running = 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th sample (what a bucketed p99 can tell you)."""
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        for bound, running in zip(self.buckets + (float("inf"),), cumulative):
+            if running >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._function_latency = {}  # name -> Histogram
+        self._function_errors = {}  # name -> count
+        self._request_latency = {}  # (route, method) -> Histogram
+        self._request_status = {}  # (route, method, status) -> count
+        self._request_phases = {}  # (route, phase) -> Histogram
+        self._lock = threading.Lock()  # only taken when a new series is created / on counters
+
+    def observe_function(self, name: str, seconds: float, failed: bool = False) -> None:
+        histogram = self._function_latency.get(name) or self._new_series(self._function_latency, name)
+        histogram.observe(seconds)
+        if failed:
+            with self._lock:
+                self._function_errors[name] = self._function_errors.get(name, 0) + 1
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float) -> None:
+        key = (route, method)
+        histogram = self._request_latency.get(key) or self._new_series(self._request_latency, key)
+        histogram.observe(seconds)
+        status_key = (route, method, status)
+        with self._lock:
+            self._request_status[status_key] = self._request_status.get(status_key, 0) + 1
+
+    def observe_phase(self, route: str, phase: str, seconds: float) -> None:
+        key = (route, phase)
+        histogram = self._request_phases.get(key) or self._new_series(self._request_phases, key)
+        histogram.observe(seconds)
+
+    def function_histogram(self, name: str) -> Histogram | None:
+        return self._function_latency.get(name)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._function_latency.clear()
+            self._function_errors.clear()
+            self._request_latency.clear()
+            self._request_status.clear()
+            self._request_phases.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            functions = sorted(self._function_latency.items())
+            errors = sorted(self._function_errors.items())
+            requests = sorted(self._request_latency.items())
+            statuses = sorted(self._request_status.items())
+            phases = sorted(self._request_phases.items())
+
+        self._render_histograms(lines, "localedge_function_duration_seconds",
+                                "Duration of functions wrapped by LogDecorator.",
+                                [({"function": name}, h) for name, h in functions])
+        lines.append("# HELP localedge_function_errors_total Calls that raised, per function.")
+        lines.append("# TYPE localedge_function_errors_total counter")
+        for name, count in errors:
+            lines.append(f"localedge_function_errors_total{_labels({'function': name})} {count}")
+
+        self._render_histograms(lines, "localedge_http_request_duration_seconds",
+                                "Duration of HTTP requests, per route.",
+                                [({"route": route, "method": method}, h) for (route, method), h in requests])
+        lines.append("# HELP localedge_http_requests_total HTTP requests, per route and status.")
+        lines.append("# TYPE localedge_http_requests_total counter")
+        for (route, method, status), count in statuses:
+            labels = _labels({"route": route, "method": method, "status": str(status)})
+            lines.append(f"localedge_http_requests_total{labels} {count}")
+
+        self._render_histograms(lines, "localedge_http_request_phase_seconds",
+                                "Time HTTP requests spent per phase (parsing, storage, ...), per route.",
+                                [({"route": route, "phase": phase}, h) for (route, phase), h in phases])
+        return "\n".join(lines) + "\n"
+
+    def _new_series(self, series: dict, key) -> Histogram:
+        with self._lock:
+            return series.setdefault(key, Histogram(self.buckets))
+
+    @staticmethod
+    def _render_histograms(lines: list, metric: str, help_text: str, series: list) -> None:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, histogram in series:
+            cumulative, total, count = histogram.snapshot()
+            for bound, running in zip(histogram.buckets + (float("inf"),), cumulative):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_labels({**labels, 'le': le})} {running}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+registry = MetricsRegistry()
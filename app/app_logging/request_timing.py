@@ -0,0 +1,89 @@
+#  Purpose:
+#     Per-request breakdown of where the time went: parsing, storage, analysis (alerts /
+#     anomalies), publishing (SSE fan-out) and logging. The numbers come from the timing
+#     LogDecorator already does: a function decorated with a `phase` adds its duration to
+#     the phase totals of the request running on the current thread/task (a ContextVar),
+#     and does nothing extra outside a request. install(app) wires the middleware that
+#     opens/closes those totals, answers them in a Server-Timing header (visible in the
+#     browser's network tab) and records them in the metrics registry.
+#
+#  Key Attributes:
+#     - PHASES: the phase names used across the app (phases must not nest, or time is counted twice)
+#
+#  Main Methods:
+#     - record(phase, seconds): add time to the current request's phase (no-op outside a request)
+#     - begin() / finish(token): open / close the phase totals, returns {phase: seconds}
+#     - install(app, metrics): before/after/teardown hooks on a Flask app
+#
+#  Example:
+#     @log.log_this(phase="storage")
+#     def insert(...): ...
+#
+#     curl -si -X POST localhost:5000/dht22 -d 22.5,60,41.2,OK | grep Server-Timing
+#     Server-Timing: parsing;dur=0.04, storage;dur=0.03, analysis;dur=0.05, publishing;dur=0.01, total;dur=0.61
+#
+#  Sources:
+#     - https://www.w3.org/TR/server-timing/
+#     - https://docs.python.org/3/library/contextvars.html
+
+import contextvars
+import time
+
+from app_logging.metrics import MetricsRegistry, registry
+
+PHASES = ("parsing", "storage", "analysis", "publishing", "logging")
+
+_phases = contextvars.ContextVar("request_phases", default=None)
+
+
+def record(phase: str, seconds: float) -> None:
+    phases = _phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+def begin() -> contextvars.Token:
+    return _phases.set({})
+
+
+def finish(token: contextvars.Token) -> dict:
+    phases = _phases.get() or {}
+    _phases.reset(token)
+    return phases
+
+
+def server_timing(phases: dict, total: float) -> str:
+    entries = [f"{name};dur={phases[name] * 1000:.2f}" for name in PHASES if name in phases]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def install(app, metrics: MetricsRegistry | None = None) -> None:
+    """Per-request phase timings for every route of `app` (header + registry)."""
+    from flask import g, request
+
+    metrics = metrics or registry
+
+    @app.before_request
+    def open_phase_timings() -> None:
+        g.phase_token = begin()
+        g.phase_start = time.perf_counter()
+
+    @app.after_request
+    def close_phase_timings(response):
+        token = g.pop("phase_token", None)
+        if token is None:
+            return response
+        total = time.perf_counter() - g.pop("phase_start")
+        phases = finish(token)
+        response.headers["Server-Timing"] = server_timing(phases, total)
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        for name, seconds in phases.items():
+            metrics.observe_phase(route, name, seconds)
+        return response
+
+    @app.teardown_request
+    def drop_phase_timings(error=None) -> None:
+        token = g.pop("phase_token", None)  # still here only when the view raised
+        if token is not None:
+            _phases.reset(token)
@@ -0,0 +1,237 @@
+#  Purpose:
+#     Asyncio ingest server, an alternative to Flask's threaded dev server for
+#     deployments with many Picos holding connections open. One event loop serves
+#     every connection (HTTP/1.1 keep-alive), no thread per client.
+#
+#  Key Attributes:
+#     - pipeline: the SensorPipeline readings are handed to (shared with the Flask routes)
+#     - executor: single worker thread that runs the pipeline / SqliteDB work off the loop,
+#                 which also makes it the one and only writer
+#     - keepalive_timeout: idle seconds before a kept-alive connection is closed
+#     - body_timeout: seconds a client gets to send the body it announced (408 after that)
+#
+#  Main Methods:
+#     - start(): bind and start accepting connections
+#     - serve_forever(): start() and block until cancelled
+#     - close(): stop accepting, close connections, shut the executor down
+#
+#  Routes:
+#     - GET  /                         -> health text
+#     - POST /dht22, /ens160            -> same behaviour as the Flask routes (text or binary frames)
+#     - POST /dht22/batch, /ens160/batch
+#       (the Pico names itself with an X-Device-Id header or ?device=, see DeviceRegistry,
+#        and numbers text uploads with an X-Sequence header or ?seq=, see SensorPipeline)
+#
+#  Example:
+#     python async_server.py --host 0.0.0.0 --port 5000
+#
+#  Sources:
+#     - https://docs.python.org/3/library/asyncio-stream.html
+#     - https://datatracker.ietf.org/doc/html/rfc9112 (HTTP/1.1 message syntax, persistence)
+
+import argparse
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+from sensor_manager.dedup import parse_sequence
+from sensor_manager.device_registry import normalize_device
+from sensor_manager.sensor_pipeline import SensorPipeline
+from sensor_manager.wire_format import CONTENT_TYPE as FRAME_CONTENT_TYPE
+from storage.write_buffer import BufferFullError
+from storage.writer_process import WriterError, WriterUnavailableError
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncIngestServer:
+    def __init__(self, pipeline: SensorPipeline, host: str = "0.0.0.0", port: int = 5000,
+                 keepalive_timeout: float = 75.0, body_timeout: float = 30.0, max_body: int = 1024 * 1024):
+        self.pipeline = pipeline
+        self.host = host
+        self.port = port
+        self.keepalive_timeout = keepalive_timeout
+        self.body_timeout = body_timeout
+        self.max_body = max_body
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+        self._server = None
+        self._connections = set()
+
+        # (method, path) -> (pipeline method, answer 422 when a batch was fully rejected)
+        self._routes = {
+            ("POST", "/dht22"): (pipeline.update_dht22_data, False),
+            ("POST", "/ens160"): (pipeline.update_ens160_data, False),
+            ("POST", "/dht22/batch"): (pipeline.update_dht22_batch, True),
+            ("POST", "/ens160/batch"): (pipeline.update_ens160_batch, True),
+        }
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  backlog=1024, limit=64 * 1024)
+        self.port = self._server.sockets[0].getsockname()[1]  # resolve port=0 for tests
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return  # idle keep-alive connection or client went away
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, 431, {"error": "request header too large"}, keep_alive=False)
+                    return
+
+                try:
+                    method, path, query, version, headers = self._parse_head(head)
+                    length = int(headers.get("content-length", "0"))
+                    if length > self.max_body:
+                        raise HttpError(413, "request body too large")
+                    # a client that announces a body and stalls must not hold the connection forever
+                    body = await asyncio.wait_for(reader.readexactly(length), self.body_timeout) if length else b""
+                except asyncio.TimeoutError:
+                    await self._write(writer, 408, {"error": "request body not received in time"}, keep_alive=False)
+                    return
+                except HttpError as e:
+                    await self._write(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    return
+                except (ValueError, asyncio.IncompleteReadError):
+                    await self._write(writer, 400, {"error": "malformed request"}, keep_alive=False)
+                    return
+
+                keep_alive = self._wants_keep_alive(version, headers)
+                content_type = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+                params = parse_qs(query)
+                device = headers.get("x-device-id") or params.get("device", [None])[0]
+                seq = headers.get("x-sequence") or params.get("seq", [None])[0]
+                status, payload, extra = await self._dispatch(method, path, body, content_type, device, seq)
+                await self._write(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    return
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _parse_head(head: bytes) -> tuple[str, str, str, str, dict]:
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            raise HttpError(411, "chunked bodies are not supported, send Content-Length")
+        path, _, query = target.partition("?")
+        return method.upper(), path, query, version, headers
+
+    @staticmethod
+    def _wants_keep_alive(version: str, headers: dict) -> bool:
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    async def _dispatch(self, method: str, path: str, body: bytes, content_type: str = "",
+                        device: str | None = None, seq: str | None = None) -> tuple[int, object, dict]:
+        if path == "/":
+            if method != "GET":
+                return 405, {"error": "method not allowed"}, {}
+            return 200, "LocalEdge is up and running!", {}
+
+        route = self._routes.get((method, path))
+        if route is None:
+            if any(p == path for _, p in self._routes):
+                return 405, {"error": "method not allowed"}, {}
+            return 404, {"error": "not found"}, {}
+
+        handler, is_batch = route
+        try:
+            device = normalize_device(device) if device else None
+            seq = parse_sequence(seq)
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+        if content_type == FRAME_CONTENT_TYPE and path in ("/dht22", "/ens160"):
+            # binary frame: hand the bytes over untouched, see wire_format
+            handler, is_batch, payload = functools.partial(self.pipeline.update_frame, path[1:]), True, body
+            handler = functools.partial(handler, device=device)  # None: the frame header's device id
+        else:
+            payload = body.decode("utf-8", errors="replace")
+            if device is not None:
+                handler = functools.partial(handler, device=device)
+            if seq is not None:
+                handler = functools.partial(handler, seq=seq)  # frames number their own records
+        loop = asyncio.get_running_loop()
+        try:
+            # parsing is cheap but storage isn't: keep every pipeline call on the writer thread
+            result = await loop.run_in_executor(self.executor, handler, payload)
+        except (BufferFullError, WriterUnavailableError, WriterError) as e:
+            return 503, {"error": str(e)}, {"Retry-After": "1"}
+        except ValueError as e:  # bad frame, payload, device id or sequence: 400 like the Flask routes
+            return 400, {"error": str(e)}, {}
+        except Exception as e:
+            return 500, {"error": f"internal error: {e}"}, {}
+
+        if is_batch and result["rejected"] and not result["accepted"] and not result["duplicates"]:
+            return 422, result, {}
+        return 200, result, {}
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, status: int, payload: object, keep_alive: bool,
+                     extra_headers: dict | None = None) -> None:
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/html; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+
+        headers = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                   f"Content-Type: {content_type}",
+                   f"Content-Length: {len(body)}",
+                   f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        headers += [f"{name}: {value}" for name, value in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LocalEdge asyncio ingest server")
+    parser.add_argument("--host", default="0.0.0.0")  # 0.0.0.0 for remote access
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    from routes.routes import pipeline  # same pipeline, store and write buffer as the Flask app
+
+    server = AsyncIngestServer(pipeline, host=args.host, port=args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
 #  Purpose:
-#
+#     Publish sensor readings to AWS IoT Core over MQTT. With a spool directory configured,
+#     messages are written to a durable on-disk spool first and a background drain loop
+#     packs them into batched payloads, so uplink outages and restarts lose nothing.
 #
 #  Key Attributes:
-#
+#     - topic: MQTT topic readings are published to
+#     - spool: optional DiskSpool holding messages not yet acknowledged by the broker
+#     - batch_size: max messages packed into one MQTT payload
+#     - max_in_flight: max batches published before waiting for their acknowledgements
+#     - retry_base / retry_max: exponential backoff (seconds) after a failed drain
 #
 #  Main Methods:
+#     - connect(): connect to the broker, start the network loop and the drain thread
+#     - publish(message): spool the message (or publish it directly without a spool)
+#     - drain_once(): publish one round of spooled batches, returns how many messages were acked
+#     - backup_db(db_path, bucket): incremental snapshot of the SQLite database to S3 (aws/s3_backup.py)
+#     - disconnect(): stop the drain thread and the network loop
 #
+#  Startup cost:
+#     boto3 and paho are imported on first use (s3 property / building the paho client),
+#     not when this module is imported: boto3 alone costs seconds on a Pi booting from SD.
 #
 #  Example:
+#     client = MqttClient("pi5", endpoint, 8883, cert, key, ca, "localedge/readings",
+#                         spool_dir="app/data/mqtt_spool")
+#     client.connect()
+#     client.publish('{"temperature": 22.5}')
 """
 # ==============================================================================
 # Useful Functions for Interacting with SQLite and AWS
@@ -19,13 +37,13 @@
 # 3. fetchone(query, params)     - Get a single row from SELECT.
 # 4. fetchall(query, params)     - Get all rows from SELECT.
 # 5. executemany(query, list)    - Efficient batch inserts/updates.
-# 6. backup_db(dest_path)        - Copy the SQLite file (for upload or sync).
+# 6. backup_db(db_path, bucket)  - Snapshot the SQLite file and upload changed chunks to S3 (MqttClient.backup_db).
 # 7. close_connection()          - Cleanly close DB connection (if not using context manager).
 
 # AWS Interaction (S3, RDS, etc.):
 # --------------------------------
-# 8. upload_to_s3(bucket, key, file_path)        - Push local DB or file to AWS S3.
-# 9. download_from_s3(bucket, key, dest_path)    - Pull SQLite DB or any file from S3.
+# 8. upload_to_s3(bucket, key, file_path)        - Push local DB or file to AWS S3 (SnapshotBackup.run).
+# 9. download_from_s3(bucket, key, dest_path)    - Pull SQLite DB or any file from S3 (SnapshotBackup.restore).
 # 10. connect_to_rds(host, user, pass, db)       - (If using AWS RDS) Connect to hosted SQL DB.
 # ==============================================================================
 # Sources:
@@ -47,16 +65,24 @@
 #       - https://pymysql.readthedocs.io/
 """
 
-import paho.mqtt.client as mqtt
+import json
+import os
 import ssl
-import boto3
+import threading
+import time
 
-class MqttClient:
-    def __init__(self, client_id, endpoint, port, cert_path, key_path, ca_path, topic):
-        self.s3 = boto3.resource("s3") # s3 object manager
+from app_logging.log_utils import Logger
+from aws.s3_backup import SnapshotBackup
+from aws.spool import DiskSpool
 
+MQTT_ERR_SUCCESS = 0  # paho.mqtt.client.MQTT_ERR_SUCCESS, without importing paho for it
 
 
+class MqttClient:
+    def __init__(self, client_id, endpoint, port, cert_path, key_path, ca_path, topic,
+                 spool_dir=None, batch_size=50, max_in_flight=4, qos=1, ack_timeout=10.0,
+                 retry_base=1.0, retry_max=60.0, client=None):
+        self._s3 = None  # s3 object manager, created by the s3 property on first use
 
         self.client_id = client_id
         self.endpoint = endpoint # example: a1b2c3d4e5f6g7-ats.iot.us-west-2.amazonaws.com
@@ -65,6 +91,25 @@ class MqttClient:
         self.key_path = key_path
         self.ca_path = ca_path
         self.topic = topic
+        self.logger = Logger().get_logger()
+
+        # batching / delivery settings
+        self.spool = DiskSpool(spool_dir) if spool_dir else None
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.qos = qos
+        self.ack_timeout = ack_timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._drain_thread = None
+
+        if client is not None:  # injected client (tests, local broker stand-in)
+            self.client = client
+            return
+
+        import paho.mqtt.client as mqtt  # deferred: only a real broker connection needs paho
 
         self.client = mqtt.Client(client_id=self.client_id)
         self.client.tls_set(ca_certs=self.ca_path,
@@ -72,23 +117,116 @@ class MqttClient:
                             keyfile=self.key_path,
                             tls_version=ssl.PROTOCOL_TLSv1_2)
 
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3  # deferred to the first backup, see "Startup cost" above
+            self._s3 = boto3.resource("s3")
+        return self._s3
+
     def connect(self):
         try:
             self.client.connect(self.endpoint, self.port)
             self.client.loop_start()
-            print("Connected to AWS IoT")
+            self.logger.info("Connected to AWS IoT")
         except Exception as e:
-            print(f"[MQTT ERROR] Failed to connect: {e}")
+            self.logger.error(f"[MQTT ERROR] Failed to connect: {e}")
+
+        # the drain loop keeps retrying on its own, so start it even if the first connect failed
+        if self.spool is not None and self._drain_thread is None:
+            self._stop.clear()
+            self._drain_thread = threading.Thread(target=self._drain_loop, name="MqttDrain", daemon=True)
+            self._drain_thread.start()
 
     def publish(self, message):
+        if self.spool is not None:
+            payload = message.encode() if isinstance(message, str) else message
+            self.spool.append(payload)  # durable before we return
+            self._wake.set()
+            return
+
         try:
             self.client.publish(self.topic, message)
-            print(f"Published: {message}")
+            self.logger.debug(f"Published: {message}")
         except Exception as e:
-            print(f"[MQTT ERROR] Failed to publish: {e}")
+            self.logger.error(f"[MQTT ERROR] Failed to publish: {e}")
+
+    def drain_once(self) -> int:
+        """
+        Publish up to max_in_flight batches from the spool, then wait for the broker to
+        acknowledge them. Only the acknowledged prefix is removed from the spool; the rest is
+        retried on the next call. Returns the number of messages acknowledged.
+        """
+        in_flight = []  # (message info, cursor after this batch, batch length)
+        cursor = None
+        for _ in range(self.max_in_flight):
+            records, next_cursor = self.spool.read_batch(self.batch_size, start=cursor)
+            if not records:
+                break
+            info = self.client.publish(self.topic, self.pack(records), qos=self.qos)
+            if info.rc != MQTT_ERR_SUCCESS:
+                break
+            in_flight.append((info, next_cursor, len(records)))
+            cursor = next_cursor
+
+        acked = 0
+        for info, batch_cursor, count in in_flight:
+            try:
+                info.wait_for_publish(timeout=self.ack_timeout)
+            except (RuntimeError, ValueError):
+                break  # connection dropped while waiting
+            if not info.is_published():
+                break
+            self.spool.ack(batch_cursor, count)  # in order, so the spool never skips a batch
+            acked += count
+
+        if in_flight and acked == 0:
+            raise ConnectionError("broker did not acknowledge any batch")
+        return acked
+
+    @staticmethod
+    def pack(records: list[bytes]) -> bytes:
+        """
+        Several spooled messages in one MQTT payload: {"count": n, "messages": [...]}.
+        Messages that are JSON themselves are embedded as objects, anything else as text.
+        """
+        messages = []
+        for record in records:
+            text = record.decode("utf-8", errors="replace")
+            try:
+                messages.append(json.loads(text))
+            except ValueError:
+                messages.append(text)
+        return json.dumps({"count": len(messages), "messages": messages}, separators=(",", ":")).encode()
+
+    def backup_db(self, db_path, bucket, prefix="localedge", state_dir=None) -> dict:
+        """Snapshot the database and upload what changed since the last backup (resumes an interrupted one)."""
+        state_dir = state_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "backup")
+        backup = SnapshotBackup(db_path, bucket, prefix, state_dir, s3=self.s3.meta.client)
+        return backup.run()
+
+    def _drain_loop(self):
+        delay = self.retry_base
+        while not self._stop.is_set():
+            try:
+                acked = self.drain_once() if self.spool.pending() else 0
+                delay = self.retry_base
+            except Exception as e:
+                self.logger.warning(f"[MQTT] drain failed, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.retry_max)
+                continue
+
+            if not acked:  # spool is empty, sleep until publish() wakes us
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
 
     def disconnect(self):
+        self._stop.set()
+        self._wake.set()
+        if self._drain_thread is not None:
+            self._drain_thread.join()
+            self._drain_thread = None
         self.client.loop_stop()
         self.client.disconnect()
-        print("Disconnected")
-
+        self.logger.info("Disconnected from AWS IoT")
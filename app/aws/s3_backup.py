@@ -0,0 +1,322 @@
+#  Purpose:
+#     Off-site backup of the SQLite database to S3 without re-sending the whole file.
+#     A consistent snapshot is taken with SQLite's online backup API, cut into fixed-size
+#     chunks and hashed. Each snapshot becomes one S3 object built by a multipart upload:
+#     chunks whose sha256 matches the previous snapshot are copied server-side from it
+#     (UploadPartCopy, no uplink traffic), only changed chunks are uploaded. Every finished
+#     part is recorded in a local state file, so an interrupted backup resumes where it stopped.
+#     Closed partitions live outside SQLite, in the column archive (storage/archive.py): each
+#     archived period is uploaded once per content hash, so only new or re-merged periods are
+#     sent, and latest.json lists the periods that belong with the snapshot.
+#
+#  Key Attributes:
+#     - db_path: database to back up
+#     - bucket / prefix: where snapshots go, "<prefix>/snapshots/<UTC time>.db" plus "<prefix>/latest.json"
+#     - archive_dir: the column archive next to the database, "<prefix>/archive/<sensor>/<day>/<sha256>/<file>"
+#     - state_dir: local snapshot file and backup_state.json (last snapshot + upload in progress)
+#     - chunk_bytes: part size; S3 needs >= 5 MiB for every part but the last
+#     - s3: boto3 S3 *client* (or a stand-in with the same methods)
+#
+#  Main Methods:
+#     - run(): resume the pending upload or take a new snapshot and upload it, returns a summary
+#     - snapshot(dest_path): consistent copy of the live database
+#     - restore(dest_path, key=None, archive_dir=None): download a snapshot (latest by default)
+#       and, with archive_dir, the archived periods listed in latest.json
+#
+#  Example:
+#     backup = SnapshotBackup("app/data/localedge.db", "my-bucket", "localedge/pi5", "app/data/backup",
+#                             s3=boto3.client("s3"))
+#     backup.run()  # -> {"key": ..., "parts": 12, "uploaded": 1, "copied": 11, "bytes_uploaded": 8388608}
+#
+#     python aws/s3_backup.py --bucket my-bucket --prefix localedge/pi5   (e.g. from cron)
+#
+#  Sources:
+#     - https://sqlite.org/backup.html
+#     - https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.backup
+#     - https://docs.aws.amazon.com/AmazonS3/latest/userguide/mpuoverview.html
+#     - https://docs.aws.amazon.com/AmazonS3/latest/API/API_UploadPartCopy.html
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+from app_logging.log_utils import Logger
+
+
+class SnapshotBackup:
+    def __init__(self, db_path: str, bucket: str, prefix: str, state_dir: str, s3,
+                 chunk_bytes: int = 8 * 1024 * 1024, backup_pages: int = 1024, archive_dir: str | None = None):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.state_dir = state_dir
+        self.s3 = s3
+        self.chunk_bytes = chunk_bytes
+        self.backup_pages = backup_pages  # pages per backup step when the database isn't in WAL mode
+        self.logger = Logger().get_logger()
+
+        os.makedirs(state_dir, exist_ok=True)
+        self.snapshot_path = os.path.join(state_dir, "snapshot.db")
+        self._state_path = os.path.join(state_dir, "backup_state.json")
+
+    def snapshot(self, dest_path: str) -> None:
+        """
+        Copy the live database with the online backup API. In WAL mode the whole copy runs in
+        one read transaction, which never blocks writers. Otherwise it copies backup_pages at a
+        time and sleeps in between, so a writer only waits for one step, not for the whole copy.
+        """
+        tmp_path = dest_path + ".tmp"
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+            source.backup(target, pages=-1 if wal else self.backup_pages, sleep=0.005)
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_path, dest_path)
+
+    def run(self) -> dict:
+        state = self._load_state()
+        pending = state.get("pending")
+        if pending is not None and os.path.exists(self.snapshot_path):
+            parts = self._uploaded_parts(pending)
+            if parts is None:
+                pending = self._start_upload(state)  # the upload expired or was aborted on the S3 side
+            else:
+                pending["parts"] = parts  # S3's view wins: also covers a part sent just before a crash
+                self.logger.info(f"[BACKUP] resuming {pending['key']} ({len(parts)} parts already done)")
+        else:
+            pending = self._start_upload(state)
+
+        last = state.get("last") or {}
+        last_hashes = last.get("hashes", []) if last.get("chunk_bytes") == pending["chunk_bytes"] else []
+        uploaded = copied = bytes_uploaded = 0
+
+        with open(self.snapshot_path, "rb") as f:
+            for index, digest in enumerate(pending["hashes"]):
+                part_number = str(index + 1)
+                if part_number in pending["parts"]:
+                    continue
+                if index < len(last_hashes) and last_hashes[index] == digest:
+                    start = index * pending["chunk_bytes"]
+                    end = min(start + pending["chunk_bytes"], last["size"]) - 1
+                    response = self.s3.upload_part_copy(
+                        Bucket=self.bucket, Key=pending["key"], UploadId=pending["upload_id"],
+                        PartNumber=index + 1, CopySource={"Bucket": self.bucket, "Key": last["key"]},
+                        CopySourceRange=f"bytes={start}-{end}")
+                    etag = response["CopyPartResult"]["ETag"]
+                    copied += 1
+                else:
+                    f.seek(index * pending["chunk_bytes"])
+                    body = f.read(pending["chunk_bytes"])
+                    response = self.s3.upload_part(Bucket=self.bucket, Key=pending["key"],
+                                                   UploadId=pending["upload_id"], PartNumber=index + 1, Body=body)
+                    etag = response["ETag"]
+                    uploaded += 1
+                    bytes_uploaded += len(body)
+                pending["parts"][part_number] = etag
+                self._save_state(state)  # a crash from here on resumes at the next part
+
+        parts = [{"PartNumber": int(n), "ETag": etag} for n, etag in sorted(pending["parts"].items(), key=lambda p: int(p[0]))]
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=pending["key"], UploadId=pending["upload_id"],
+                                          MultipartUpload={"Parts": parts})
+        latest = {"key": pending["key"], "size": pending["size"], "chunk_bytes": pending["chunk_bytes"],
+                  "hashes": pending["hashes"], "created": pending["created"]}
+        # after the snapshot: a partition compacted since is in the archive by now (it's written
+        # there before its rows leave SQLite), so the pair never misses a period
+        archive_uploaded = 0
+        if self.archive_dir is not None:
+            latest["archive"], archive_uploaded = self._upload_archive(state)
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}/latest.json",
+                           Body=json.dumps(latest).encode(), ContentType="application/json")
+
+        state["last"] = latest
+        state["pending"] = None
+        self._save_state(state)
+        os.remove(self.snapshot_path)
+
+        summary = {"key": pending["key"], "parts": len(parts), "uploaded": uploaded, "copied": copied,
+                   "bytes_uploaded": bytes_uploaded, "archive_periods_uploaded": archive_uploaded}
+        self.logger.info(f"[BACKUP] {summary}")
+        return summary
+
+    def restore(self, dest_path: str, key: str | None = None, archive_dir: str | None = None) -> str:
+        """
+        Download a snapshot to dest_path (the latest by default). With archive_dir, the archived
+        periods latest.json lists are downloaded into it as well, one directory per period.
+        """
+        latest = {}
+        if key is None or archive_dir is not None:
+            latest = json.loads(self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/latest.json")["Body"].read())
+        key = key or latest["key"]
+        self._download(key, dest_path)
+
+        archived = latest.get("archive") or {} if archive_dir is not None else {}
+        for period, entry in archived.items():
+            final_dir = os.path.join(archive_dir, *period.split("/"))
+            tmp_dir = final_dir + ".tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for name in entry["files"]:
+                self._download(self._archive_key(period, entry["digest"], name), os.path.join(tmp_dir, name))
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(tmp_dir, final_dir)
+        return key
+
+    def _download(self, key: str, dest_path: str) -> None:
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+        tmp_path = dest_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: body.read(1024 * 1024), b""):
+                f.write(chunk)
+        os.replace(tmp_path, dest_path)
+
+    def _upload_archive(self, state: dict) -> tuple[dict, int]:
+        """
+        Upload the archived periods S3 doesn't hold yet. A period directory is immutable once
+        written (re-archiving swaps in a new directory), so it's only re-hashed when its inode
+        or mtime changed, and only uploaded when its hash is new. Returns (manifest, uploaded).
+        """
+        known = state.setdefault("archive", {})  # "sensor/day" -> {"version", "digest", "files"}
+        manifest = {}
+        uploaded = 0
+        for sensor in sorted(os.listdir(self.archive_dir)):
+            sensor_dir = os.path.join(self.archive_dir, sensor)
+            if not os.path.isdir(sensor_dir):
+                continue
+            for day in sorted(os.listdir(sensor_dir)):
+                if not (len(day) == 8 and day.isdigit()):
+                    continue  # .tmp / .old: a write in progress, picked up next run
+                period, period_dir = f"{sensor}/{day}", os.path.join(sensor_dir, day)
+                entry = known.get(period)
+                try:
+                    stat = os.stat(period_dir)
+                    version = [stat.st_ino, stat.st_mtime_ns]
+                    if entry is None or entry["version"] != version:
+                        digest, files = _hash_directory(period_dir)
+                        if entry is None or entry["digest"] != digest:
+                            entry = {"digest": digest, "files": files, "uploaded": False}
+                        entry["version"] = version
+                    if not entry["uploaded"]:
+                        for name in entry["files"]:
+                            with open(os.path.join(period_dir, name), "rb") as f:
+                                self.s3.put_object(Bucket=self.bucket, Body=f.read(),
+                                                   Key=self._archive_key(period, entry["digest"], name))
+                        entry["uploaded"] = True
+                        uploaded += 1
+                except FileNotFoundError:
+                    continue  # dropped by retention while we looked at it
+                known[period] = entry
+                self._save_state(state)
+                manifest[period] = {"digest": entry["digest"], "files": entry["files"]}
+        for period in set(known) - set(manifest):
+            del known[period]  # expired locally; its objects stay until the bucket's lifecycle rule
+        return manifest, uploaded
+
+    def _archive_key(self, period: str, digest: str, name: str) -> str:
+        return f"{self.prefix}/archive/{period}/{digest}/{name}"
+
+    def _start_upload(self, state: dict) -> dict:
+        stale = state.get("pending")
+        if stale is not None:  # its snapshot file is gone (or the upload is), start from scratch
+            self._abort(stale)
+
+        self.snapshot(self.snapshot_path)
+        hashes = []
+        with open(self.snapshot_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_bytes), b""):
+                hashes.append(hashlib.sha256(chunk).hexdigest())
+
+        now = time.time()
+        created = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f".{int(now % 1 * 1000):03d}Z"
+        key = f"{self.prefix}/snapshots/{created}.db"
+        upload = self.s3.create_multipart_upload(Bucket=self.bucket, Key=key,
+                                                 ContentType="application/vnd.sqlite3")
+        pending = {"key": key, "upload_id": upload["UploadId"], "created": created,
+                   "size": os.path.getsize(self.snapshot_path), "chunk_bytes": self.chunk_bytes,
+                   "hashes": hashes, "parts": {}}
+        state["pending"] = pending
+        self._save_state(state)
+        return pending
+
+    def _uploaded_parts(self, pending: dict) -> dict | None:
+        """{part number: ETag} S3 already holds for the pending upload, None if the upload is gone."""
+        parts = {}
+        marker = 0
+        while True:
+            try:
+                response = self.s3.list_parts(Bucket=self.bucket, Key=pending["key"],
+                                              UploadId=pending["upload_id"], PartNumberMarker=marker)
+            except Exception as e:
+                if getattr(e, "response", {}).get("Error", {}).get("Code") == "NoSuchUpload":
+                    return None
+                raise
+            for part in response.get("Parts", []):
+                parts[str(part["PartNumber"])] = part["ETag"]
+            if not response.get("IsTruncated"):
+                return parts
+            marker = response["NextPartNumberMarker"]
+
+    def _abort(self, pending: dict) -> None:
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=pending["key"], UploadId=pending["upload_id"])
+        except Exception as e:
+            self.logger.warning(f"[BACKUP] could not abort stale upload {pending['upload_id']}: {e}")
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self._state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"last": None, "pending": None}
+
+    def _save_state(self, state: dict) -> None:
+        tmp_path = self._state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._state_path)  # atomic, like the spool cursor
+
+
+def _hash_directory(path: str) -> tuple[str, list[str]]:
+    """sha256 over a directory's file names and contents, and the sorted file names."""
+    files = sorted(os.listdir(path))
+    digest = hashlib.sha256()
+    for name in files:
+        digest.update(name.encode() + b"\0")
+        with open(os.path.join(path, name), "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest(), files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental SQLite snapshot backup to S3")
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--prefix", default="localedge")
+    parser.add_argument("--db", default=None, help="defaults to DB_PATH or app/data/localedge.db")
+    parser.add_argument("--state-dir", default=None, help="defaults to <db dir>/backup")
+    parser.add_argument("--archive-dir", default=None, help="defaults to <db dir>/archive (see store_layout)")
+    args = parser.parse_args()
+
+    import boto3
+    from configbox.configuration import Configuration
+
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    db_path = args.db or Configuration().get("DB_PATH") or os.path.join(base_dir, "app/data/localedge.db")
+    state_dir = args.state_dir or os.path.join(os.path.dirname(db_path), "backup")
+    archive_dir = args.archive_dir or os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")
+    backup = SnapshotBackup(db_path, args.bucket, args.prefix, state_dir, s3=boto3.client("s3"),
+                            archive_dir=archive_dir if os.path.isdir(archive_dir) else None)
+    print(json.dumps(backup.run()))
+
+
+if __name__ == "__main__":
+    main()
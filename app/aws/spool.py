@@ -0,0 +1,158 @@
+#  Purpose:
+#     Durable, append-only on-disk queue for outgoing MQTT messages. Messages are written
+#     here first and only removed once the broker has acknowledged them, so an uplink
+#     outage or a restart never loses data.
+#
+#  Key Attributes:
+#     - directory: where segment files and the read cursor live
+#     - segment_bytes: a new segment file is started once the current one exceeds this size
+#
+#  Main Methods:
+#     - append(payload) / append_many(payloads): durably add records (one fsync per call)
+#     - read_batch(max_records): oldest unacknowledged records + the cursor just past them
+#     - ack(cursor, count): mark the `count` records before cursor as delivered, delete finished segments
+#     - pending(): number of unacknowledged records
+#
+#  Example:
+#     spool = DiskSpool("app/data/mqtt_spool")
+#     spool.append(b'{"temperature": 22.5}')
+#     records, cursor = spool.read_batch(50)
+#     ...publish...
+#     spool.ack(cursor, len(records))
+#
+#  On-disk format:
+#     segment-<n>.log : repeated [4-byte big-endian length][4-byte crc32][payload]
+#     cursor          : "<segment n> <byte offset>" of the first unacknowledged record
+#     A record torn by a crash mid-write fails its length/crc check and is truncated on open.
+
+import os
+import struct
+import threading
+import zlib
+
+HEADER = struct.Struct(">II")  # length, crc32
+
+
+class DiskSpool:
+    def __init__(self, directory: str, segment_bytes: int = 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._cursor_path = os.path.join(directory, "cursor")
+        self._read_segment, self._read_offset = self._load_cursor()
+
+        segments = self._segments()
+        self._write_segment = segments[-1] if segments else self._read_segment
+        self._pending = 0
+        for segment in segments:
+            if segment >= self._read_segment:
+                start = self._read_offset if segment == self._read_segment else 0
+                self._pending += self._recover(segment, start)
+        self._writer = open(self._segment_path(self._write_segment), "ab")
+
+    def append(self, payload: bytes) -> None:
+        self.append_many([payload])
+
+    def append_many(self, payloads: list[bytes]) -> None:
+        if not payloads:
+            return
+        with self._lock:
+            for payload in payloads:
+                self._writer.write(HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._writer.flush()
+            os.fsync(self._writer.fileno())  # one fsync for the whole call
+            self._pending += len(payloads)
+
+            if self._writer.tell() >= self.segment_bytes:
+                self._writer.close()
+                self._write_segment += 1
+                self._writer = open(self._segment_path(self._write_segment), "ab")
+
+    def read_batch(self, max_records: int, start: tuple[int, int] | None = None) -> tuple[list[bytes], tuple[int, int]]:
+        """
+        Up to max_records unacknowledged records, oldest first, starting at `start`
+        (default: the acknowledged cursor). Returns them with the cursor just past the last one.
+        """
+        with self._lock:
+            segment, offset = start or (self._read_segment, self._read_offset)
+            records = []
+            while len(records) < max_records and segment <= self._write_segment:
+                path = self._segment_path(segment)
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        while len(records) < max_records:
+                            header = f.read(HEADER.size)
+                            if len(header) < HEADER.size:
+                                break
+                            length, _crc = HEADER.unpack(header)
+                            records.append(f.read(length))
+                            offset += HEADER.size + length
+                if len(records) < max_records and segment < self._write_segment:
+                    segment, offset = segment + 1, 0
+                else:
+                    break
+            return records, (segment, offset)
+
+    def ack(self, cursor: tuple[int, int], count: int) -> None:
+        """Acknowledge `count` records, everything before `cursor` (as returned by read_batch)."""
+        with self._lock:
+            segment, offset = cursor
+            tmp_path = self._cursor_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(f"{segment} {offset}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._cursor_path)  # atomic: a crash leaves the old or the new cursor
+
+            for old in self._segments():
+                if old < segment:
+                    os.remove(self._segment_path(old))
+            self._read_segment, self._read_offset = segment, offset
+            self._pending = max(0, self._pending - count)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def close(self) -> None:
+        with self._lock:
+            self._writer.close()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:08d}.log")
+
+    def _segments(self) -> list[int]:
+        names = (n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".log"))
+        return sorted(int(n[len("segment-"):-len(".log")]) for n in names)
+
+    def _load_cursor(self) -> tuple[int, int]:
+        try:
+            with open(self._cursor_path) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (FileNotFoundError, ValueError):
+            segments = self._segments()
+            return (segments[0] if segments else 0), 0
+
+    def _recover(self, segment: int, start: int) -> int:
+        """Count the valid records from `start` and cut off a torn tail left by a crash."""
+        path = self._segment_path(segment)
+        count = 0
+        with open(path, "r+b") as f:
+            f.seek(start)
+            good_end = start
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                count += 1
+                good_end = f.tell()
+            f.truncate(good_end)
+        return count
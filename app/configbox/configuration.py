@@ -3,15 +3,33 @@
 #      Provides a centralized configuration interface
 #      for secrets, endpoints, and paths.
 #
+#      The .env file and the environment are read once per env_path: Configuration() hands
+#      back the same cached, read-only object every time, so creating one is a dict lookup
+#      instead of a file read. Configuration.reload() re-reads explicitly and replaces the
+#      cached object; code that kept the old one keeps consistent old values.
+#
 #  Key Attributes:
 #      - AWS_ENDPOINT: str –> AWS MQTT broker endpoint
 #      - PI_API_URL: str –> Flask server endpoint on Pi5
 #      - SECRET_KEY: str –> App-level secret key
 #      - DB_PATH: str –> Path to SQLite database file
+#      - RETENTION_DAYS: str –> Days of raw readings kept (whole partitions are dropped past it)
+#      - ALERT_RULES: str –> ";"-separated alert rules (see sensor_manager/alerts.py), defaults built in
+#      - ADMIN_TOKEN: str –> Bearer token for the /admin endpoints (they are disabled while unset)
+#      - WRITER_SOCKET: str –> Unix socket of the storage writer process; when set, workers send writes there
 #
 #  Main Methods:
-#      - load(): Loads environment variables (supports .env files)
-#      - get(attr: str): Fetches a specific configuration value
+#      - Configuration(env_path): the cached configuration (read on first use)
+#      - Configuration.reload(env_path): re-read the .env file and the environment, returns the new object
+#      - load(): the pre-cache name for reload() on this object's env_path (returns the new object,
+#                the read-only instance itself keeps its values)
+#      - get(attr: str): Fetches a specific configuration value. FIELDS come from the cached snapshot,
+#                any other name (env_path, a variable only added to .env) falls back to the
+#                attribute or to os.environ, where the .env file was exported
+#
+#  Example:
+#      Configuration().get("DB_PATH")
+#      Configuration.reload()  # after editing .env
 #
 
 """
@@ -20,30 +38,71 @@
        - https://pypi.org/project/python-dotenv/
 """
 import os
-from dotenv import load_dotenv
-import sys
+import threading
+from types import MappingProxyType
+
+from dotenv import dotenv_values
+
 
 class Configuration:
-    def __init__(self, env_path=".env"):
-        self.env_path = env_path
-        self._loaded = False
-        self.load()
+    FIELDS = ("AWS_ENDPOINT", "PI_API_URL", "SECRET_KEY", "DB_PATH", "RETENTION_DAYS", "ALERT_RULES",
+              "ADMIN_TOKEN", "WRITER_SOCKET")
+
+    _cache = {}  # env_path -> Configuration
+    _from_file = set()  # variables this class put into os.environ, a reload may replace them
+    _lock = threading.Lock()
+
+    def __new__(cls, env_path=".env"):
+        config = cls._cache.get(env_path)
+        if config is None:
+            with cls._lock:
+                config = cls._cache.get(env_path)
+                if config is None:
+                    config = cls._cache[env_path] = cls._read(env_path)
+        return config
 
-    def load(self):
+    @classmethod
+    def reload(cls, env_path=".env") -> "Configuration":
+        with cls._lock:
+            config = cls._cache[env_path] = cls._read(env_path)
+        return config
+
+    @classmethod
+    def _read(cls, env_path) -> "Configuration":
         """
         Loads environment variables from a .env file or system environment.
+        Like load_dotenv, file values are exported to os.environ (LOG_FILE, LOG_ASYNC, ... are read
+        from there) and variables set by the real environment win over the file.
         """
-        load_dotenv(dotenv_path=self.env_path)
-        self.AWS_ENDPOINT = os.getenv("AWS_ENDPOINT")
-        self.PI_API_URL = os.getenv("PI_API_URL")
-        self.SECRET_KEY = os.getenv("SECRET_KEY")
-        self.DB_PATH = os.getenv("DB_PATH")
-        self._loaded = True
+        for name, value in dotenv_values(env_path).items():
+            if value is not None and (name not in os.environ or name in cls._from_file):
+                os.environ[name] = value
+                cls._from_file.add(name)
+
+        config = object.__new__(cls)
+        object.__setattr__(config, "env_path", env_path)
+        object.__setattr__(config, "_values", MappingProxyType({name: os.getenv(name) for name in cls.FIELDS}))
+        return config
+
+    def __getattr__(self, name):
+        # only reached for names that aren't real attributes: the configuration fields
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Configuration is read-only, change the environment and call Configuration.reload()")
+
+    def load(self) -> "Configuration":
+        return type(self).reload(self.env_path)
 
     def get(self, attr: str):
         """
         Fetch a specific configuration value using attribute name.
         """
-        if not self._loaded:
-            raise RuntimeError("Environment variables not loaded.")
-        return getattr(self, attr, None)
\ No newline at end of file
+        if attr in self._values:
+            return self._values[attr]
+        if not attr.startswith("_") and attr in self.__dict__:
+            return self.__dict__[attr]
+        return os.getenv(attr)
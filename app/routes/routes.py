@@ -14,6 +14,27 @@
 # Main Methods:
 #   - GET /sensor/dht22 → Fetch latest DHT22 readings
 #   - GET /sensor/ens160 → Fetch latest ENS160 readings
+#   - POST /dht22/batch → Ingest many newline-delimited DHT22 readings in one request
+#   - POST /ens160/batch → Ingest many newline-delimited ENS160 readings in one request
+#   - POST /dht22, /ens160 with Content-Type application/vnd.localedge.frame → binary frames (wire_format)
+#   - GET /dht22/latest, /ens160/latest → Latest reading from the in-memory ring buffer
+#   - GET /dht22/window?seconds=N, /ens160/window?seconds=N → Last N seconds from the ring buffer
+#     (ingest and live reads are per device: X-Device-Id header or ?device=, "default" when absent;
+#      text ingest takes an optional sequence number, X-Sequence header or ?seq=, so retries aren't stored twice)
+#   - GET /devices → every Pico seen recently, with first/last seen times and reading counts
+#   - GET /dht22/history?field=temperature&start=&end=&points= → min/max/mean/count/last buckets from the rollups
+#   - GET /resample?series=dht22.temperature,ens160.eco2&start=&end=&step=1m&agg=mean|min|max|last
+#       &fill=none|ffill|linear&max_gap=5m&format=json|csv → raw readings on one regular grid, sensors joined
+#     (both are cached per query, invalidated by ingests into their range, and carry an ETag:
+#      If-None-Match with unchanged data answers 304; without end= they run until "now" rounded up to the minute)
+#   - GET /alerts → alerts currently firing and the rules being evaluated
+#   - GET /anomalies → the most recent spikes / drift / stuck-sensor detections
+#   - GET /metrics → Prometheus counters and latency histograms (functions + routes + request phases)
+#   - GET /admin/profile?seconds=N&interval=0.01&format=collapsed|json → sampling profile of the running
+#     server, collapsed stacks for a flame graph (Authorization: Bearer $ADMIN_TOKEN)
+#   - GET /stream?sensors=dht22,ens160 → Server-Sent Events with every accepted reading
+#   (with WRITER_SOCKET set, e.g. under gunicorn -w 4, writes go through the storage writer process
+#    and a writer that can't be reached answers 503 + Retry-After like a full write buffer)
 
 
 """
@@ -21,8 +42,29 @@ Flask Blueprint for sensor-related API routes.
 """
 
 
-from flask import Blueprint, request, jsonify, Response
+import atexit
+import hmac
+import os
+import time
+
+import numpy as np
+from flask import Blueprint, request, jsonify, Response, g
+from app_logging.metrics import registry
+from app_logging.profiler import ProfilerBusyError, SamplingProfiler, collapse
+from configbox.configuration import Configuration
+from sensor_manager.alerts import AlertEngine, DEFAULT_RULES, parse_duration
+from sensor_manager.anomaly import AnomalyDetector
+from sensor_manager.broadcaster import ReadingBroadcaster, SENSOR_KINDS
+from sensor_manager.dedup import parse_sequence
+from sensor_manager.device_registry import DEFAULT_DEVICE, normalize_device
 from sensor_manager.sensor_pipeline import SensorPipeline
+from storage.maintenance import StoreMaintenance
+from storage.query_cache import QueryCache
+from storage.reading_store import ReadingStore, store_layout
+from storage.sqlite_db import SqliteDB
+from storage.write_buffer import WriteBuffer, BufferFullError
+from storage.writer_process import RemoteStore, WriterError, WriterUnavailableError
+from sensor_manager.wire_format import CONTENT_TYPE as FRAME_CONTENT_TYPE, FrameError
 
 main = Blueprint("main", __name__)
 
@@ -33,19 +75,297 @@ def home():
 
 routes = Blueprint("routes", __name__)
 
-pipeline = SensorPipeline(api_key ="124", server_url="https://localhost")
+base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+config = Configuration()
+db_path = config.get("DB_PATH") or os.path.join(base_dir, "app/data/localedge.db")
+os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+# dashboards re-request the same windows: /history and /resample answers are cached until an
+# ingest lands in their range (or ttl passes, for writes made by other worker processes)
+query_cache = QueryCache(max_bytes=32 * 2 ** 20, ttl=30.0, bucket_seconds=60.0)
+# day partitions + column archive, the same layout the writer process opens (see store_layout)
+layout = store_layout(db_path, config.get("RETENTION_DAYS"))
+if config.get("WRITER_SOCKET"):
+    # several worker processes: reads stay local, writes go to the one writer process (storage/writer_process.py)
+    secret = config.get("SECRET_KEY")
+    store = RemoteStore(SqliteDB(db_path=db_path, pooled=True), config.get("WRITER_SOCKET"),
+                        authkey=secret.encode() if secret else None, cache=query_cache, **layout)
+else:
+    store = ReadingStore(SqliteDB(db_path=db_path, pooled=True), cache=query_cache, **layout)
+    # retention and compaction on the server clock, off the request threads (the writer process does its own)
+    maintenance = StoreMaintenance(store, interval=3600.0)
+    atexit.register(maintenance.close)
+write_buffer = WriteBuffer(store, max_batch=200, max_age=1.0)
+atexit.register(write_buffer.close)  # flush whatever is still queued at shutdown
+
+broadcaster = ReadingBroadcaster(max_queue=256)
+STREAM_HEARTBEAT_SECONDS = 15  # comment line sent when idle so proxies keep the stream open
+HISTORY_DEFAULT_SECONDS = 86400  # /history without start= covers the last day
+HISTORY_MAX_POINTS = 5000
+PROFILE_MAX_SECONDS = 60
+RESAMPLE_MAX_POINTS = 10000  # grid steps per /resample answer
+
+alert_rules = config.get("ALERT_RULES")
+alerts = AlertEngine([r for r in alert_rules.split(";") if r.strip()] if alert_rules else DEFAULT_RULES)
+
+pipeline = SensorPipeline(api_key ="124", server_url="https://localhost",
+                          store=store, buffer=write_buffer, broadcaster=broadcaster, alerts=alerts,
+                          anomalies=AnomalyDetector())
+
+
+@routes.before_app_request
+def start_request_timer() -> None:
+    g.request_start = time.perf_counter()
+
+@routes.after_app_request
+def record_request_metrics(response: Response) -> Response:
+    start = g.pop("request_start", None)
+    if start is not None:
+        # the rule ("/<any(dht22, ens160):kind>/latest"), not the URL, keeps the label set small
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        registry.observe_request(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
+
+
+def busy_response(error: Exception) -> Response:
+    # storage is behind or the write failed (WriterError): tell the Pico to back off and resend
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def request_device(default: str | None = None) -> str | None:
+    # which Pico is talking: header for firmware, query string for people poking at the API
+    device = request.headers.get("X-Device-Id") or request.args.get("device")
+    return normalize_device(device) if device else default
+
+
+def request_sequence() -> int | None:
+    # per-device sequence number of a single reading, or of a batch's first line (see SensorPipeline)
+    return parse_sequence(request.headers.get("X-Sequence") or request.args.get("seq"))
+
+
+def accepted_status(result: dict) -> int:
+    # 422 only when nothing in the upload was usable (a retransmit's duplicates count as usable)
+    return 422 if result["rejected"] and not result["accepted"] and not result["duplicates"] else 200
+
+
+def bad_request(error: ValueError) -> Response:
+    return jsonify({"error": str(error)}), 400
+
+
+def query_end() -> float:
+    # "until now" is rounded up to the cache bucket, so every tab asking this minute shares one cache entry
+    return request.args.get("end", type=float) or query_cache.align(time.time())
+
+
+def conditional(response: Response) -> Response:
+    # ETag over the body: a client revalidating unchanged data gets 304 without the payload
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def receive_frame(kind: str) -> Response:
+    # binary uploads skip text decoding entirely, the raw request bytes go to the decoder
+    try:
+        result = pipeline.update_frame(kind, request.get_data(), device=request_device())
+    except (WriterUnavailableError, WriterError) as e:
+        return busy_response(e)
+    except (FrameError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result), accepted_status(result)
 
 
 @routes.route("/dht22", methods=["POST"])
 def receive_dht22() -> Response:
+    if request.mimetype == FRAME_CONTENT_TYPE:
+        return receive_frame("dht22")
     raw = request.get_data(as_text=True) # tell Flask the coming data is a text
-    data = pipeline.update_dht22_data(raw)
+    try:
+        data = pipeline.update_dht22_data(raw, request_device(DEFAULT_DEVICE), request_sequence())
+    except (BufferFullError, WriterUnavailableError, WriterError) as e:
+        return busy_response(e)
+    except ValueError as e:
+        return bad_request(e)
     return jsonify(data)
 
 @routes.route("/ens160", methods=["POST"])
 def receive_ens160() -> Response:
+    if request.mimetype == FRAME_CONTENT_TYPE:
+        return receive_frame("ens160")
     raw = request.get_data(as_text=True)
-    data =pipeline.update_ens160_data(raw)
+    try:
+        data =pipeline.update_ens160_data(raw, request_device(DEFAULT_DEVICE), request_sequence())
+    except (BufferFullError, WriterUnavailableError, WriterError) as e:
+        return busy_response(e)
+    except ValueError as e:
+        return bad_request(e)
     return jsonify(data)
 
+@routes.route("/dht22/batch", methods=["POST"])
+def receive_dht22_batch() -> Response:
+    raw = request.get_data(as_text=True)
+    try:
+        result = pipeline.update_dht22_batch(raw, request_device(DEFAULT_DEVICE), request_sequence())
+    except (WriterUnavailableError, WriterError) as e:
+        return busy_response(e)
+    except ValueError as e:
+        return bad_request(e)
+    # the Pico only resends the rejected lines
+    return jsonify(result), accepted_status(result)
+
+@routes.route("/ens160/batch", methods=["POST"])
+def receive_ens160_batch() -> Response:
+    raw = request.get_data(as_text=True)
+    try:
+        result = pipeline.update_ens160_batch(raw, request_device(DEFAULT_DEVICE), request_sequence())
+    except (WriterUnavailableError, WriterError) as e:
+        return busy_response(e)
+    except ValueError as e:
+        return bad_request(e)
+    return jsonify(result), accepted_status(result)
+
+@routes.route("/<any(dht22, ens160):kind>/latest", methods=["GET"])
+def latest_reading(kind: str) -> Response:
+    try:
+        reading = pipeline.latest(kind, request_device(DEFAULT_DEVICE))
+    except ValueError as e:
+        return bad_request(e)
+    if reading is None:
+        return jsonify({"error": f"no {kind} readings yet"}), 404
+    return jsonify(reading)
+
+@routes.route("/<any(dht22, ens160):kind>/window", methods=["GET"])
+def reading_window(kind: str) -> Response:
+    seconds = request.args.get("seconds", type=float)
+    if seconds is None or seconds <= 0:
+        return jsonify({"error": "seconds must be a positive number"}), 400
+
+    try:
+        window = pipeline.window(kind, seconds, device=request_device(DEFAULT_DEVICE))
+    except ValueError as e:
+        return bad_request(e)
+    return jsonify({name: values.tolist() for name, values in window.items()})
+
+@routes.route("/<any(dht22, ens160):kind>/history", methods=["GET"])
+def reading_history(kind: str) -> Response:
+    end = query_end()
+    start = request.args.get("start", type=float)
+    if start is None:
+        start = end - HISTORY_DEFAULT_SECONDS
+    points = request.args.get("points", 500, type=int)
+    if start >= end or not 0 < points <= HISTORY_MAX_POINTS:
+        return jsonify({"error": f"start must be before end and points in 1..{HISTORY_MAX_POINTS}"}), 400
+
+    try:
+        history = pipeline.history(kind, request.args.get("field", ""), start, end, points)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return conditional(jsonify(history))
+
+@routes.route("/resample", methods=["GET"])
+def resampled_readings() -> Response:
+    series = [name.strip() for name in request.args.get("series", "").split(",") if name.strip()]
+    try:
+        end = query_end()
+        start = request.args.get("start", type=float)
+        if start is None:
+            start = end - HISTORY_DEFAULT_SECONDS
+        step = parse_duration(request.args.get("step", "1m"))
+        max_gap = request.args.get("max_gap")
+        max_gap = parse_duration(max_gap) if max_gap else None
+    except (ValueError, IndexError):
+        return jsonify({"error": "step and max_gap must be durations like 30, 30s, 5m, 2h or 1d"}), 400
+    if not series or step <= 0 or start >= end or (end - start) / step > RESAMPLE_MAX_POINTS:
+        return jsonify({"error": f"series is required, start must be before end and the grid at most "
+                                 f"{RESAMPLE_MAX_POINTS} steps"}), 400
+
+    try:
+        result = pipeline.resample(series, start, end, step, request.args.get("agg", "mean"),
+                                   request.args.get("fill", "none"), max_gap)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # NaN isn't JSON: steps without a value become null (an empty CSV cell)
+    columns = {name: np.where(np.isnan(values), None, values).tolist() for name, values in result.items()}
+    if request.args.get("format") == "csv":
+        lines = [",".join(columns)]
+        lines += [",".join("" if value is None else repr(value) for value in row) for row in zip(*columns.values())]
+        return conditional(Response("\n".join(lines) + "\n", mimetype="text/csv"))
+    return conditional(jsonify({"step": step, "agg": request.args.get("agg", "mean"),
+                                "fill": request.args.get("fill", "none"), "max_gap": max_gap, "series": columns}))
+
+@routes.route("/devices", methods=["GET"])
+def known_devices() -> Response:
+    return jsonify({"devices": pipeline.devices.devices()})
+
+@routes.route("/alerts", methods=["GET"])
+def active_alerts() -> Response:
+    engine = pipeline.alerts
+    if engine is None:
+        return jsonify({"active": [], "rules": []})
+    return jsonify({"active": engine.active(), "rules": [rule.text for rule in engine.rules]})
+
+@routes.route("/anomalies", methods=["GET"])
+def recent_anomalies() -> Response:
+    detector = pipeline.anomalies
+    return jsonify({"recent": detector.recent() if detector is not None else []})
+
+@routes.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+def admin_denied() -> Response | None:
+    token = Configuration().get("ADMIN_TOKEN")  # cached, picks up Configuration.reload()
+    if not token:
+        return jsonify({"error": "admin endpoints are disabled, set ADMIN_TOKEN to enable them"}), 403
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        response = jsonify({"error": "missing or wrong admin token"})
+        response.status_code = 401
+        response.headers["WWW-Authenticate"] = "Bearer"
+        return response
+    return None
+
+@routes.route("/admin/profile", methods=["GET"])
+def admin_profile() -> Response:
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    seconds = request.args.get("seconds", 10.0, type=float)
+    interval = request.args.get("interval", 0.01, type=float)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.001 <= interval <= 1:
+        return jsonify({"error": f"seconds must be in (0, {PROFILE_MAX_SECONDS}] and interval in [0.001, 1]"}), 400
+
+    try:
+        stacks = SamplingProfiler(interval=interval).profile(seconds)  # blocks this request thread only
+    except ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    if request.args.get("format") == "json":
+        return jsonify({"seconds": seconds, "interval": interval, "samples": sum(stacks.values()),
+                        "stacks": stacks})
+    return Response(collapse(stacks), mimetype="text/plain")
+
+@routes.route("/stream", methods=["GET"])
+def stream() -> Response:
+    kinds = request.args.get("sensors", ",".join(sorted(SENSOR_KINDS)))
+    try:
+        subscription = broadcaster.subscribe(k.strip() for k in kinds.split(",") if k.strip())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"  # browser reconnect delay
+            while True:
+                frames = subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                yield "".join(frames) if frames else ": heartbeat\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)  # client went away (GeneratorExit)
 
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
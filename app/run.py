@@ -1,5 +1,6 @@
 from flask import Flask, render_template
 from dotenv import load_dotenv
+from app_logging import request_timing
 from routes import routes, main
 import os
 
@@ -7,6 +8,7 @@ load_dotenv()
 
 def create_app() -> Flask:
     app = Flask(__name__)
+    request_timing.install(app)  # per-request parsing/storage/... breakdown, Server-Timing header
 
     @app.route("/")
     def index():
@@ -19,4 +21,9 @@ def create_app() -> Flask:
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0") # 0.0.0.0 for remote access
+    if os.getenv("INGEST_MODE") == "async":
+        # event-loop server for many concurrent Picos, see async_server.py
+        from async_server import main as serve_async
+        serve_async()
+    else:
+        app.run(debug=True, host="0.0.0.0") # 0.0.0.0 for remote access
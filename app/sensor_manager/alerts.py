@@ -0,0 +1,306 @@
+#  Purpose:
+#  - Server-side threshold rules evaluated on every accepted reading, so alerting no longer
+#    depends on the status string the Pico sends. Rules are parsed and compiled once; each
+#    reading then costs O(1) amortised per rule: rolling windows keep running sums,
+#    monotonic deques for min/max and a time-aware EWMA, nothing is re-read from SQLite.
+#
+#  Rule syntax (one rule per string):
+#      <sensor>.<field> [<stat>(<window>)] <op> <threshold> [for <duration>] [clear <level>]
+#      stat:     mean | min | max | ewma | rate   (rate = change per minute across the window)
+#      op:       > >= < <=
+#      for:      the condition must hold continuously this long before the alert fires
+#      clear:    hysteresis, a firing alert only resolves once the value is back past this level
+#      duration/window: 30s, 5m, 2h, 1d (plain numbers are seconds)
+#  e.g. "ens160.eco2 > 1200 for 5m clear 1000", "dht22.humidity rate(5m) > 2"
+#
+#  Key Attributes:
+#  - rules: compiled AlertRule objects
+#  - DEFAULT_RULES: what the app runs with when ALERT_RULES isn't configured
+#
+#  Main Methods:
+#  - parse_rule(text): text -> AlertRule (raises RuleError)
+#  - AlertEngine.evaluate(sensor, row, device): feed one (ts, v1, v2, v3, status) row, returns new alert events
+#  - AlertEngine.active(): alerts currently firing
+#  - AlertEngine.forget(device): drop a device's windows and alerts (it was evicted from the DeviceRegistry)
+#
+#  Example:
+#      engine = AlertEngine(["ens160.eco2 > 1200 for 5m clear 1000"])
+#      engine.evaluate("ens160", (1717000000.0, 1300.0, 200.0, 3.0, "OK"))  # -> [] (not held long enough yet)
+#      ...5 minutes of eco2 > 1200 later...
+#      # -> [{"state": "firing", "rule": "ens160.eco2 > 1200 for 5m clear 1000", "value": 1310.0, ...}]
+
+import math
+import operator
+import re
+import threading
+from collections import deque
+
+from sensor_manager.device_registry import StripedLock
+from sensor_manager.payload_parser import DHT22_SCHEMA, ENS160_SCHEMA
+
+FIELDS = {"dht22": DHT22_SCHEMA.fields, "ens160": ENS160_SCHEMA.fields}
+
+DEFAULT_RULES = (
+    "ens160.eco2 > 1200 for 5m clear 1000",
+    "ens160.tvoc > 500 for 5m clear 400",
+    "dht22.temperature mean(5m) > 30 clear 29",
+    "dht22.humidity rate(5m) > 5",
+)
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+RULE_PATTERN = re.compile(
+    r"^\s*(?P<sensor>\w+)\.(?P<field>\w+)"
+    r"(?:\s+(?P<stat>mean|min|max|ewma|rate)\((?P<window>[\d.]+[smhd]?)\))?"
+    r"\s*(?P<op>>=|<=|>|<)\s*(?P<threshold>-?[\d.]+)"
+    r"(?:\s+for\s+(?P<hold>[\d.]+[smhd]?))?"
+    r"(?:\s+clear\s+(?P<clear>-?[\d.]+))?\s*$")
+
+
+class RuleError(ValueError):
+    """A rule string that doesn't parse or names an unknown sensor/field."""
+
+
+def parse_duration(text: str) -> float:
+    unit = text[-1] if text[-1] in UNITS else "s"
+    number = text[:-1] if text[-1] in UNITS else text
+    return float(number) * UNITS[unit]
+
+
+class AlertRule:
+    def __init__(self, text: str, sensor: str, field: str, op: str, threshold: float, stat: str = "value",
+                 window: float = 0.0, hold: float = 0.0, clear: float | None = None):
+        self.text = text
+        self.sensor = sensor
+        self.field = field
+        self.op = op
+        self.threshold = threshold
+        self.stat = stat
+        self.window = window
+        self.hold = hold
+        self.clear = threshold if clear is None else clear
+        self.triggered = OPERATORS[op]
+        # the alert resolves once the value is past `clear` on the other side of the threshold
+        self.resolved = operator.le if op in (">", ">=") else operator.ge
+        self.tracker_key = (field, stat, window)  # rules with the same key share one rolling window
+
+    def __repr__(self) -> str:
+        return f"AlertRule({self.text!r})"
+
+
+def parse_rule(text: str) -> AlertRule:
+    match = RULE_PATTERN.match(text)
+    if match is None:
+        raise RuleError(f"Can't parse alert rule: {text!r}")
+    sensor, field = match["sensor"], match["field"]
+    if field not in FIELDS.get(sensor, ()):
+        raise RuleError(f"Unknown sensor field in rule {text!r}: {sensor}.{field}")
+    try:
+        threshold = float(match["threshold"])
+        clear = float(match["clear"]) if match["clear"] else None
+        window = parse_duration(match["window"]) if match["window"] else 0.0
+        hold = parse_duration(match["hold"]) if match["hold"] else 0.0
+    except ValueError:
+        raise RuleError(f"Bad number in alert rule: {text!r}") from None
+
+    op = match["op"]
+    if clear is not None and ((op in (">", ">=") and clear > threshold) or (op in ("<", "<=") and clear < threshold)):
+        raise RuleError(f"clear level must be on the safe side of the threshold: {text!r}")
+    if match["stat"] and window <= 0:
+        raise RuleError(f"{match['stat']}() needs a positive window: {text!r}")
+    return AlertRule(text.strip(), sensor, field, op, threshold, stat=match["stat"] or "value",
+                     window=window, hold=hold, clear=clear)
+
+
+# --- rolling statistics, one update per reading --------------------------------------------------
+
+class LastValue:
+    def update(self, ts: float, value: float) -> float:
+        return value
+
+
+class RollingMean:
+    def __init__(self, window: float):
+        self.window = window
+        self.samples = deque()
+        self.total = 0.0
+
+    def update(self, ts: float, value: float) -> float:
+        self.samples.append((ts, value))
+        self.total += value
+        cutoff = ts - self.window
+        while self.samples[0][0] <= cutoff:
+            self.total -= self.samples.popleft()[1]
+        if len(self.samples) == 1:
+            self.total = value  # drop accumulated float error whenever the window drains
+        return self.total / len(self.samples)
+
+
+class RollingExtreme:
+    """Sliding-window min or max with a monotonic deque: every sample is pushed and popped once."""
+
+    def __init__(self, window: float, is_max: bool):
+        self.window = window
+        self.dominates = operator.ge if is_max else operator.le
+        self.candidates = deque()  # (ts, value), values monotonic from the front
+
+    def update(self, ts: float, value: float) -> float:
+        while self.candidates and self.dominates(value, self.candidates[-1][1]):
+            self.candidates.pop()
+        self.candidates.append((ts, value))
+        cutoff = ts - self.window
+        while self.candidates[0][0] <= cutoff:
+            self.candidates.popleft()
+        return self.candidates[0][1]
+
+
+class Ewma:
+    """Exponentially weighted mean with time constant `window`, correct for irregular sampling."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.value = None
+        self.last_ts = None
+
+    def update(self, ts: float, value: float) -> float:
+        if self.value is None:
+            self.value = value
+        else:
+            alpha = 1.0 - math.exp(-max(ts - self.last_ts, 0.0) / self.window)
+            self.value += alpha * (value - self.value)
+        self.last_ts = ts
+        return self.value
+
+
+class RateOfChange:
+    """Change per minute between the oldest sample still in the window and the newest one."""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples = deque()
+
+    def update(self, ts: float, value: float) -> float | None:
+        self.samples.append((ts, value))
+        cutoff = ts - self.window
+        while self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        first_ts, first_value = self.samples[0]
+        if ts <= first_ts:
+            return None  # a single sample has no slope yet
+        return (value - first_value) / (ts - first_ts) * 60.0
+
+
+def make_tracker(stat: str, window: float):
+    if stat == "value":
+        return LastValue()
+    if stat == "mean":
+        return RollingMean(window)
+    if stat in ("min", "max"):
+        return RollingExtreme(window, is_max=stat == "max")
+    if stat == "ewma":
+        return Ewma(window)
+    return RateOfChange(window)
+
+
+# --- engine --------------------------------------------------------------------------------------
+
+class _RuleState:
+    __slots__ = ("pending_since", "active", "fired_at")
+
+    def __init__(self):
+        self.pending_since = None  # ts the condition first held, for "for <duration>"
+        self.active = False
+        self.fired_at = None
+
+
+class AlertEngine:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = [rule if isinstance(rule, AlertRule) else parse_rule(rule) for rule in rules]
+
+        # compiled per sensor: the distinct rolling windows, and for each rule the tracker it reads
+        self._plans = {}
+        for sensor in FIELDS:
+            rules = [rule for rule in self.rules if rule.sensor == sensor]
+            keys = list(dict.fromkeys(rule.tracker_key for rule in rules))
+            trackers = [(FIELDS[sensor].index(field), stat, window) for field, stat, window in keys]
+            self._plans[sensor] = (trackers, [(rule, keys.index(rule.tracker_key)) for rule in rules])
+
+        self._devices = {}  # (device, sensor) -> (trackers, rule states)
+        self._active = {}  # (device, rule text) -> firing event
+        self._device_locks = StripedLock(64)  # rolling state: devices don't wait on each other
+        self._lock = threading.Lock()  # _active only, taken when an alert fires or resolves
+
+    def evaluate(self, sensor: str, row: tuple, device: str = "default") -> list[dict]:
+        """Feed one accepted (ts, v1, v2, v3, status) row. Returns firing/resolved events (usually none)."""
+        trackers, rules = self._plans[sensor]
+        if not rules:
+            return []
+        ts, values = row[0], row[1:4]
+        events = []
+        with self._device_locks.for_key(device):
+            state = self._devices.get((device, sensor))
+            if state is None:
+                state = ([make_tracker(stat, window) for _, stat, window in trackers], [_RuleState() for _ in rules])
+                self._devices[(device, sensor)] = state
+            instances, rule_states = state
+
+            current = []
+            for (index, _, _), tracker in zip(trackers, instances):
+                value = values[index]
+                if value is None or value != value:  # NaN: skip, keep the window as it was
+                    current.append(None)
+                else:
+                    current.append(tracker.update(ts, value))
+
+            for (rule, slot), rule_state in zip(rules, rule_states):
+                value = current[slot]
+                if value is None:
+                    continue
+                event = self._step(rule, rule_state, ts, value, device)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def active(self) -> list[dict]:
+        with self._lock:
+            return list(self._active.values())
+
+    def forget(self, device: str) -> None:
+        with self._device_locks.for_key(device):
+            for sensor in FIELDS:
+                self._devices.pop((device, sensor), None)
+        with self._lock:
+            for key in [key for key in self._active if key[0] == device]:
+                del self._active[key]
+
+    def _step(self, rule: AlertRule, state: _RuleState, ts: float, value: float, device: str) -> dict | None:
+        if state.active:
+            if rule.resolved(value, rule.clear):
+                state.active = False
+                state.pending_since = None
+                with self._lock:
+                    self._active.pop((device, rule.text), None)
+                return self._event("resolved", rule, ts, value, device, since=state.fired_at)
+            return None  # still firing: deduplicated, no repeat event
+
+        if not rule.triggered(value, rule.threshold):
+            state.pending_since = None
+            return None
+        if state.pending_since is None:
+            state.pending_since = ts
+        if ts - state.pending_since < rule.hold:
+            return None
+
+        state.active = True
+        state.fired_at = ts
+        event = self._event("firing", rule, ts, value, device, since=state.pending_since)
+        with self._lock:
+            self._active[(device, rule.text)] = event
+        return event
+
+    @staticmethod
+    def _event(kind: str, rule: AlertRule, ts: float, value: float, device: str, since: float) -> dict:
+        return {"state": kind, "rule": rule.text, "sensor": rule.sensor, "field": rule.field, "device": device,
+                "value": value, "threshold": rule.threshold if kind == "firing" else rule.clear,
+                "since": since, "timestamp": ts}
@@ -0,0 +1,235 @@
+#  Purpose:
+#  - Catch misbehaving sensors without fixed thresholds: sudden spikes, slow drift away
+#    from the long-run baseline, and stuck sensors repeating one value for hours.
+#    Each (device, sensor, field) stream keeps a few floats of state (Welford mean/variance,
+#    EWMA mean/variance, current run of identical values), so a reading costs O(1) time and
+#    the memory per stream never grows. score_columns() replays the same maths vectorized
+#    over historical columns (ring buffer, archive, parse_block) for backtesting.
+#
+#  Detectors:
+#  - spike: |x - ewma| > z_threshold * ewm std (scored against the state *before* x is folded in)
+#  - drift: |ewma - long-run mean| > drift_threshold * long-run std, reported once per excursion
+#  - stuck: the same value for >= stuck_seconds and >= stuck_min_count readings, reported once per run
+#
+#  Key Attributes:
+#  - alpha: EWMA smoothing per reading (0.05 ~ last 20 readings)
+#  - warmup: readings per stream before spike/drift are scored
+#  - WATCHED_FIELDS: fields monitored by default (AQI is a 1-5 index that legitimately sits still)
+#
+#  Main Methods:
+#  - observe(sensor, row, device): fold one (ts, v1, v2, v3, status) row in, returns anomaly events
+#  - score_columns(sensor, columns, device): vectorized backtest, returns the events observe() would have
+#  - recent(): the last anomalies seen, newest last
+#  - forget(device): drop a device's streams (it was evicted from the DeviceRegistry)
+#
+#  Example:
+#      detector = AnomalyDetector()
+#      detector.observe("dht22", (1717000000.0, 22.5, 60.0, 41.2, "OK"))  # -> []
+#      detector.score_columns("dht22", store.archive.query("dht22", start, end))
+
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+from sensor_manager.device_registry import StripedLock
+from sensor_manager.payload_parser import DHT22_SCHEMA, ENS160_SCHEMA
+
+FIELDS = {"dht22": DHT22_SCHEMA.fields, "ens160": ENS160_SCHEMA.fields}
+WATCHED_FIELDS = {"dht22": ("temperature", "humidity"), "ens160": ("eco2", "tvoc")}
+
+
+class _StreamState:
+    __slots__ = ("count", "mean", "m2", "ewma", "ewvar", "last", "run_start", "run_count", "stuck", "drifting")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0  # Welford long-run mean
+        self.m2 = 0.0  # Welford sum of squared deviations
+        self.ewma = 0.0
+        self.ewvar = 0.0
+        self.last = None
+        self.run_start = 0.0  # ts of the first reading in the current run of identical values
+        self.run_count = 0
+        self.stuck = False
+        self.drifting = False
+
+
+class AnomalyDetector:
+    def __init__(self, alpha: float = 0.05, z_threshold: float = 6.0, drift_threshold: float = 3.0,
+                 warmup: int = 30, stuck_seconds: float = 2 * 3600, stuck_min_count: int = 10,
+                 fields: dict | None = None, history: int = 100):
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be between 0 and 1")
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.drift_threshold = drift_threshold
+        self.warmup = warmup
+        self.stuck_seconds = stuck_seconds
+        self.stuck_min_count = stuck_min_count
+        self.fields = fields or WATCHED_FIELDS
+        self._indexes = {sensor: [(field, FIELDS[sensor].index(field)) for field in watched]
+                         for sensor, watched in self.fields.items()}
+
+        self._streams = {}  # device -> {(sensor, field): _StreamState}
+        self._recent = deque(maxlen=history)
+        self._device_locks = StripedLock(64)  # per-stream state: devices don't wait on each other
+        self._lock = threading.Lock()  # _recent only
+
+    def observe(self, sensor: str, row: tuple, device: str = "default") -> list[dict]:
+        ts, values = row[0], row[1:4]
+        events = []
+        with self._device_locks.for_key(device):
+            streams = self._streams.get(device)
+            if streams is None:
+                streams = self._streams[device] = {}
+            for field, index in self._indexes.get(sensor, ()):
+                value = values[index]
+                if value is None or value != value:
+                    continue
+                state = streams.get((sensor, field))
+                if state is None:
+                    state = streams[(sensor, field)] = _StreamState()
+                for kind, score in self._step(state, ts, value):
+                    event = {"type": kind, "sensor": sensor, "field": field, "device": device,
+                             "value": value, "score": score, "timestamp": ts}
+                    events.append(event)
+        if events:
+            with self._lock:
+                self._recent.extend(events)
+        return events
+
+    def recent(self) -> list[dict]:
+        with self._lock:
+            return list(self._recent)
+
+    def forget(self, device: str) -> None:
+        with self._device_locks.for_key(device):
+            self._streams.pop(device, None)
+
+    def _step(self, state: _StreamState, ts: float, x: float) -> list[tuple[str, float]]:
+        found = []
+        a = self.alpha
+
+        # stuck: length and duration of the current run of identical values
+        if state.last is not None and x == state.last:
+            state.run_count += 1
+        else:
+            state.run_start, state.run_count, state.stuck = ts, 1, False
+        state.last = x
+        if (not state.stuck and state.run_count >= self.stuck_min_count
+                and ts - state.run_start >= self.stuck_seconds):
+            state.stuck = True
+            found.append(("stuck", ts - state.run_start))
+
+        if state.count == 0:
+            state.ewma = x
+        # spike: score against the baseline as it was before this reading
+        deviation = x - state.ewma
+        if state.count >= self.warmup and state.ewvar > 0:
+            z = abs(deviation) / math.sqrt(state.ewvar)
+            if z > self.z_threshold:
+                found.append(("spike", z))
+        state.ewma += a * deviation
+        state.ewvar = (1 - a) * (state.ewvar + a * deviation * deviation)
+
+        # Welford long-run mean/variance
+        state.count += 1
+        delta = x - state.mean
+        state.mean += delta / state.count
+        state.m2 += delta * (x - state.mean)
+
+        if state.count > self.warmup and state.m2 > 0:
+            drift = abs(state.ewma - state.mean) / math.sqrt(state.m2 / (state.count - 1))
+            if drift > self.drift_threshold and not state.drifting:
+                state.drifting = True
+                found.append(("drift", drift))
+            elif drift <= self.drift_threshold:
+                state.drifting = False
+        return found
+
+    def score_columns(self, sensor: str, columns: dict, device: str = "backtest") -> list[dict]:
+        """
+        Score a whole history at once: {"timestamp": ts, <field>: values, ...} arrays, oldest first.
+        Same maths as observe() on a fresh stream, but as array operations; doesn't touch live state.
+        """
+        ts = np.asarray(columns["timestamp"], dtype=np.float64)
+        events = []
+        for field, _ in self._indexes.get(sensor, ()):
+            x = np.asarray(columns[field], dtype=np.float64)
+            keep = ~np.isnan(x)
+            if not keep.all():
+                ts_f, x = ts[keep], x[keep]
+            else:
+                ts_f = ts
+            if not len(x):
+                continue
+            for kind, index, score in self._score_field(ts_f, x):
+                events.append({"type": kind, "sensor": sensor, "field": field, "device": device,
+                               "value": float(x[index]), "score": float(score), "timestamp": float(ts_f[index])})
+        events.sort(key=lambda event: event["timestamp"])
+        return events
+
+    def _score_field(self, ts: np.ndarray, x: np.ndarray) -> list[tuple[str, int, float]]:
+        a = self.alpha
+        n = len(x)
+        found = []
+
+        # stuck: runs of identical values, first index of each run that is long enough
+        new_run = np.empty(n, dtype=bool)
+        new_run[0] = True
+        new_run[1:] = x[1:] != x[:-1]
+        run_id = np.cumsum(new_run) - 1
+        run_first = np.flatnonzero(new_run)
+        run_count = np.arange(n) - run_first[run_id] + 1
+        run_age = ts - ts[run_first[run_id]]
+        long_enough = (run_count >= self.stuck_min_count) & (run_age >= self.stuck_seconds)
+        flagged = np.flatnonzero(long_enough)
+        if len(flagged):
+            first_per_run = flagged[np.r_[True, run_id[flagged][1:] != run_id[flagged][:-1]]]
+            found += [("stuck", int(i), run_age[i]) for i in first_per_run]
+
+        # EWMA and EW variance: first-order linear recurrences, evaluated blockwise
+        ewma = _recurrence(a * x, 1 - a, x[0])
+        previous = np.r_[x[0], ewma[:-1]]  # baseline each reading is scored against
+        deviation = x - previous
+        ewvar = _recurrence((1 - a) * a * deviation * deviation, 1 - a, 0.0)
+        previous_var = np.r_[0.0, ewvar[:-1]]
+        scored = (np.arange(n) >= self.warmup) & (previous_var > 0)
+        z = np.zeros(n)
+        z[scored] = np.abs(deviation[scored]) / np.sqrt(previous_var[scored])
+        found += [("spike", int(i), z[i]) for i in np.flatnonzero(z > self.z_threshold)]
+
+        # long-run mean/variance, shifted by x[0] to keep the running sums well conditioned
+        counts = np.arange(1, n + 1, dtype=np.float64)
+        shifted = x - x[0]
+        s1 = np.cumsum(shifted)
+        s2 = np.cumsum(shifted * shifted)
+        mean = s1 / counts + x[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var = (s2 - s1 * s1 / counts) / (counts - 1)
+            drift = np.abs(ewma - mean) / np.sqrt(var)
+        active = (counts > self.warmup) & (var > 0) & (drift > self.drift_threshold)
+        starts = np.flatnonzero(active & ~np.r_[False, active[:-1]])  # once per excursion
+        found += [("drift", int(i), drift[i]) for i in starts]
+        return found
+
+
+def _recurrence(inputs: np.ndarray, decay: float, initial: float) -> np.ndarray:
+    """
+    y[t] = decay * y[t-1] + inputs[t] with y[-1] = initial, without a Python loop per element.
+    Inside a block y[t] = decay^(t+1) * (y_prev + cumsum(inputs[i] / decay^(i+1))); blocks are
+    sized so decay^-block stays far from overflow.
+    """
+    n = len(inputs)
+    out = np.empty(n)
+    block = max(1, int(500 / -math.log(decay)))
+    powers = decay ** np.arange(1, min(block, n) + 1)
+    previous = initial
+    for start in range(0, n, block):
+        chunk = inputs[start:start + block]
+        p = powers[:len(chunk)]
+        out[start:start + len(chunk)] = p * (previous + np.cumsum(chunk / p))
+        previous = out[start + len(chunk) - 1]
+    return out
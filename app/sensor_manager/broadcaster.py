@@ -0,0 +1,81 @@
+#  Purpose:
+#  - Fan out every accepted reading to all connected dashboards (Server-Sent Events).
+#    Each subscriber has its own bounded queue with a drop-oldest policy, so a slow
+#    browser loses old frames instead of stalling ingest.
+#
+#  Key Attributes:
+#  - max_queue: frames kept per subscriber before the oldest ones are dropped
+#
+#  Main Methods:
+#  - subscribe(kinds): register a subscriber for any of "dht22", "ens160", "alert" and "anomaly"
+#  - unsubscribe(subscription): remove it (called when the HTTP stream closes)
+#  - publish(kind, reading): encode the reading once and push it to every matching subscriber
+#
+#  Example:
+#      broadcaster = ReadingBroadcaster()
+#      sub = broadcaster.subscribe({"dht22"})
+#      broadcaster.publish("dht22", {"timestamp": 1717000000.0, "temperature": 22.5})
+#      sub.get(timeout=15)  # -> ['event: dht22\ndata: {...}\n\n']
+
+import json
+import threading
+from collections import deque
+
+SENSOR_KINDS = frozenset({"dht22", "ens160"})
+STREAM_KINDS = SENSOR_KINDS | {"alert", "anomaly"}  # AlertEngine / AnomalyDetector events ride the same streams
+
+
+class Subscription:
+    def __init__(self, kinds: frozenset, max_queue: int):
+        self.kinds = kinds
+        self.dropped = 0
+        self._frames = deque(maxlen=max_queue)  # a full deque discards from the left: drop-oldest
+        self._cond = threading.Condition()
+
+    def push(self, frame: str) -> None:
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def get(self, timeout: float) -> list[str]:
+        """Every queued frame, waiting up to `timeout` seconds for one. Empty list means heartbeat time."""
+        with self._cond:
+            if not self._frames:
+                self._cond.wait(timeout)
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+
+class ReadingBroadcaster:
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers = ()  # replaced, never mutated: publish() iterates without a lock
+        self._lock = threading.Lock()
+
+    def subscribe(self, kinds=SENSOR_KINDS) -> Subscription:
+        kinds = frozenset(kinds)
+        if not kinds or not kinds <= STREAM_KINDS:
+            raise ValueError(f"kinds must be a non-empty subset of {sorted(STREAM_KINDS)}")
+        subscription = Subscription(kinds, self.max_queue)
+        with self._lock:
+            self._subscribers = self._subscribers + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, kind: str, reading: dict) -> None:
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        frame = f"event: {kind}\ndata: {json.dumps(reading, separators=(',', ':'))}\n\n"  # encoded once
+        for subscription in subscribers:
+            if kind in subscription.kinds:
+                subscription.push(frame)
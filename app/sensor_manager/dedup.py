@@ -0,0 +1,108 @@
+#  Purpose:
+#  - Idempotent ingest: Picos retry a POST when Wi-Fi times out before the answer arrives,
+#    and after a reconnect they resend whatever is still in their spool. Readings that
+#    carry a per-device sequence number are checked here before they reach storage, in
+#    O(1) and without touching SQLite: each (device, sensor) stream keeps a sliding window
+#    of its last `window` sequence numbers, indexed by seq % window (a direct-mapped table,
+#    so no search and no rehashing). Anything older than the window falls through to the
+#    unique index in ReadingStore (insert_sequenced), the on-disk backstop.
+#
+#    A slot remembers the sequence number and the Pico's timestamp of the reading that
+#    claimed it. A retransmit has both the same, so a Pico that restarts its counter after
+#    a reboot isn't mistaken for a retry: its new readings reuse old numbers with new
+#    timestamps. Single readings have no Pico timestamp (the server stamps them); for those
+#    a slot only counts as a duplicate within retry_seconds of being claimed.
+#
+#  Key Attributes:
+#  - window: sequence numbers remembered per device and sensor (3 x 8 bytes each)
+#  - retry_seconds: how long an untimestamped single reading's number stays claimed
+#  - duplicates: readings rejected so far
+#
+#  Main Methods:
+#  - parse_sequence(text): sequence number from a header / query string (None when absent), raises ValueError
+#  - claim(device, sensor, seqs, timestamps, now): True for each reading seen for the first time, marks those
+#  - release(device, sensor, seqs): un-claim readings whose write failed, so the Pico's retry is accepted
+#  - forget(device): drop a device's windows (it was evicted from the DeviceRegistry)
+#
+#  Example:
+#      dedup = DedupIndex(window=512)
+#      dedup.claim("pico-3f2a", "dht22", [41, 42], [1717000041.0, 1717000042.0])  # -> [True, True]
+#      dedup.claim("pico-3f2a", "dht22", [42, 43], [1717000042.0, 1717000043.0])  # -> [False, True]
+
+import math
+import time
+from array import array
+
+from sensor_manager.device_registry import RING_FIELDS, StripedLock
+
+NO_TIMESTAMP = -math.inf  # single readings: the Pico didn't send a timestamp
+SEQ_MAX = 2 ** 32 - 1  # frame records carry a uint32, text uploads use the same range
+
+
+def parse_sequence(text: str | None) -> int | None:
+    if text is None or text == "":
+        return None
+    text = text.strip()
+    if not (text.isascii() and text.isdigit()) or int(text) > SEQ_MAX:
+        raise ValueError(f"sequence number must be an integer from 0 to {SEQ_MAX}")
+    return int(text)
+
+
+class SequenceWindow:
+    __slots__ = ("seqs", "timestamps", "claimed")
+
+    def __init__(self, window: int):
+        self.seqs = array("q", [-1]) * window  # -1: empty slot (sequence numbers are unsigned)
+        self.timestamps = array("d", [0.0]) * window
+        self.claimed = array("d", [0.0]) * window  # server time the slot was claimed
+
+    def claim(self, seq: int, ts: float, now: float, retry_seconds: float) -> bool:
+        slot = seq % len(self.seqs)
+        if self.seqs[slot] == seq and self.timestamps[slot] == ts and (
+                ts != NO_TIMESTAMP or now - self.claimed[slot] < retry_seconds):
+            return False
+        self.seqs[slot] = seq
+        self.timestamps[slot] = ts
+        self.claimed[slot] = now
+        return True
+
+    def release(self, seq: int) -> None:
+        slot = seq % len(self.seqs)
+        if self.seqs[slot] == seq:
+            self.seqs[slot] = -1
+
+
+class DedupIndex:
+    def __init__(self, window: int = 512, retry_seconds: float = 300.0):
+        if window < 1:
+            raise ValueError("window must be >= 1.")
+        self.window = window
+        self.retry_seconds = retry_seconds
+        self.duplicates = 0
+        self._streams = {}  # (device, sensor) -> SequenceWindow
+        self._device_locks = StripedLock(64)
+
+    def claim(self, device: str, sensor: str, seqs: list[int], timestamps: list[float] | None = None,
+              now: float | None = None) -> list[bool]:
+        """One flag per reading: True if it is new (and now claimed), False for a duplicate."""
+        now = time.time() if now is None else now
+        timestamps = timestamps or [NO_TIMESTAMP] * len(seqs)
+        with self._device_locks.for_key(device):
+            stream = self._streams.get((device, sensor))
+            if stream is None:
+                stream = self._streams[(device, sensor)] = SequenceWindow(self.window)
+            fresh = [stream.claim(seq, ts, now, self.retry_seconds) for seq, ts in zip(seqs, timestamps)]
+        self.duplicates += len(fresh) - sum(fresh)  # a statistic, a lost update under a race doesn't matter
+        return fresh
+
+    def release(self, device: str, sensor: str, seqs: list[int]) -> None:
+        with self._device_locks.for_key(device):
+            stream = self._streams.get((device, sensor))
+            if stream is not None:
+                for seq in seqs:
+                    stream.release(seq)
+
+    def forget(self, device: str) -> None:
+        with self._device_locks.for_key(device):
+            for sensor in RING_FIELDS:
+                self._streams.pop((device, sensor), None)
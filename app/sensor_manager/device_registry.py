@@ -0,0 +1,160 @@
+#  Purpose:
+#  - Live state for a fleet of Picos, kept per device: ring buffers, latest readings and
+#    last-seen time, so one Pico's post never overwrites another's. Devices are spread
+#    over `shards` buckets, each guarded by its own lock (lock striping): posts from two
+#    devices only contend when they hash to the same shard, never on one global lock.
+#    Devices that have been silent for idle_seconds are evicted, so memory follows the
+#    fleet that is actually reporting rather than every id ever seen.
+#
+#  Key Attributes:
+#  - shards: number of lock stripes / buckets (a power of two well above the worker count)
+#  - ring_capacity: readings kept per device and sensor (allocated on that device's first reading)
+#  - idle_seconds: a device is evicted once it hasn't posted for this long
+#  - on_evict: optional callback(device) run after eviction, e.g. to drop alert/anomaly state
+#
+#  Main Methods:
+#  - touch(device, now, readings, kind, duplicates): the device's DeviceState, created on first sight, marked as seen
+#  - get(device): the DeviceState or None, without creating or touching it
+#  - evict_idle(now): evict every idle device now (touch() also sweeps its own shard now and then)
+#  - devices(): a summary per known device
+#
+#  Example:
+#      registry = DeviceRegistry(shards=64, ring_capacity=3600, idle_seconds=3600)
+#      state = registry.touch("pico-3f2a", time.time(), readings=1, kind="dht22")
+#      state.rings["dht22"].append(ts, (22.5, 60.0))
+#      registry.get("pico-3f2a").latest["dht22"]
+
+import re
+import threading
+
+from sensor_manager.ring_buffer import SensorRingBuffer
+
+DEFAULT_DEVICE = "default"  # Picos that don't identify themselves share this one
+DEVICE_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+RING_FIELDS = {"dht22": ("temperature", "humidity"), "ens160": ("eco2", "tvoc", "aqi")}  # "average" isn't charted
+
+
+def normalize_device(device: str | int | None) -> str:
+    """Device id from a header, query string or frame header; raises ValueError for unusable ids."""
+    if device is None or device == "":
+        return DEFAULT_DEVICE
+    device = str(device).strip()
+    if not DEVICE_PATTERN.match(device):
+        raise ValueError("device id must be 1-64 characters of letters, digits, '_', '.', ':' or '-'")
+    return device
+
+
+class StripedLock:
+    """A fixed set of locks picked by key hash: same key, same lock; different keys rarely share."""
+
+    def __init__(self, stripes: int = 64):
+        if stripes < 1:
+            raise ValueError("stripes must be >= 1.")
+        self._locks = tuple(threading.Lock() for _ in range(stripes))
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def for_key(self, key) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+
+class DeviceState:
+    __slots__ = ("device", "ring_capacity", "rings", "latest", "first_seen", "last_seen", "readings", "duplicates")
+
+    def __init__(self, device: str, ring_capacity: int, now: float):
+        self.device = device
+        self.ring_capacity = ring_capacity
+        self.rings = {}  # kind -> SensorRingBuffer, only for sensors this device actually has
+        self.latest = {}  # kind -> last reading as answered to the Pico
+        self.first_seen = now
+        self.last_seen = now
+        self.readings = 0
+        self.duplicates = 0  # retransmitted readings that were acknowledged but not stored again
+
+    def ring(self, kind: str) -> SensorRingBuffer:
+        ring = self.rings.get(kind)
+        if ring is None:
+            ring = self.rings[kind] = SensorRingBuffer(RING_FIELDS[kind], self.ring_capacity)
+        return ring
+
+    def summary(self) -> dict:
+        return {"device": self.device, "first_seen": self.first_seen, "last_seen": self.last_seen,
+                "readings": self.readings, "duplicates": self.duplicates, "sensors": sorted(self.rings)}
+
+
+class _Shard:
+    __slots__ = ("lock", "devices", "next_sweep")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.next_sweep = 0.0
+
+
+class DeviceRegistry:
+    def __init__(self, shards: int = 64, ring_capacity: int = 3600, idle_seconds: float = 3600.0,
+                 on_evict=None):
+        if shards < 1:
+            raise ValueError("shards must be >= 1.")
+        self.ring_capacity = ring_capacity
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self._shards = tuple(_Shard() for _ in range(shards))
+
+    def __len__(self) -> int:
+        return sum(len(shard.devices) for shard in self._shards)
+
+    def _shard(self, device: str) -> _Shard:
+        return self._shards[hash(device) % len(self._shards)]
+
+    def get(self, device: str) -> DeviceState | None:
+        return self._shard(device).devices.get(device)  # a single dict lookup is atomic, no lock needed
+
+    def touch(self, device: str, now: float, readings: int = 0, kind: str | None = None,
+              duplicates: int = 0) -> DeviceState:
+        """Mark the device as seen (creating it if new); `kind` makes sure its ring for that sensor exists."""
+        shard = self._shard(device)
+        evicted = ()
+        with shard.lock:
+            state = shard.devices.get(device)
+            if state is None:
+                state = shard.devices[device] = DeviceState(device, self.ring_capacity, now)
+            state.last_seen = now
+            state.readings += readings
+            state.duplicates += duplicates
+            if kind is not None:
+                state.ring(kind)  # created under the shard lock, two concurrent posts can't both allocate it
+            if now >= shard.next_sweep:
+                # amortised eviction: each shard looks at its own devices at most a few times per idle period
+                evicted = self._sweep(shard, now)
+        self._notify(evicted)
+        return state
+
+    def evict_idle(self, now: float) -> list[str]:
+        evicted = []
+        for shard in self._shards:
+            with shard.lock:
+                evicted += self._sweep(shard, now)
+        self._notify(evicted)
+        return evicted
+
+    def devices(self) -> list[dict]:
+        summaries = []
+        for shard in self._shards:
+            with shard.lock:
+                summaries += [state.summary() for state in shard.devices.values()]
+        return sorted(summaries, key=lambda summary: summary["device"])
+
+    def _sweep(self, shard: _Shard, now: float) -> list[str]:
+        shard.next_sweep = now + self.idle_seconds / 4
+        cutoff = now - self.idle_seconds
+        idle = [device for device, state in shard.devices.items() if state.last_seen < cutoff]
+        for device in idle:
+            del shard.devices[device]
+        return idle
+
+    def _notify(self, evicted) -> None:
+        if self.on_evict is not None:
+            for device in evicted:  # outside the shard lock, the callback may take its own locks
+                self.on_evict(device)
@@ -0,0 +1,209 @@
+#  Purpose:
+#  - Typed parsing of the CSV payloads the Pico sends, so measurements are numbers
+#    once and only once. One declared schema per sensor, a fast path for a single
+#    reading and a vectorized path that turns a whole block of lines into NumPy columns.
+#
+#  Key Attributes:
+#  - Status: enum of the status strings the Pico reports
+#  - SensorSchema: measurement names and JSON labels for one sensor
+#  - DHT22_SCHEMA / ENS160_SCHEMA: the two schemas used by SensorPipeline
+#  - MAX_FUTURE_SECONDS / MAX_AGE_SECONDS: the plausible window around the server clock for Pico
+#    timestamps; anything outside it (a clock that never synced, milliseconds instead of seconds)
+#    is rejected before it can create partitions or skew retention
+#
+#  Main Methods:
+#  - parse_reading(schema, raw_txt, timestamped): one line -> (ts, *floats, Status), raises PayloadError
+#  - parse_block(schema, raw_txt, now): many "ts,..." lines -> ParsedBlock (columns + per-line errors)
+#  - timestamp_error(ts, now): why a Pico timestamp is implausible, None when it's fine
+#
+#  Example:
+#      parse_reading(DHT22_SCHEMA, "22.5,60,41.2,OK")
+#          -> (None, 22.5, 60.0, 41.2, Status.OK)
+#      block = parse_block(ENS160_SCHEMA, "1717000000,400,150,2,OK\n1717000001,410,150,2,OK")
+#      block.columns["eco2"]  # -> np.array([400., 410.], dtype=float32)
+
+import math
+import time
+from enum import Enum
+
+import numpy as np
+
+
+class Status(str, Enum):
+    OK = "OK"
+    WARNING = "WARNING"
+    ALERT = "ALERT"
+    ERROR = "ERROR"
+    UNKNOWN = "UNKNOWN"  # anything the Pico sends that we don't recognise
+
+
+MAX_FUTURE_SECONDS = 86400  # a Pico clock running ahead of the Pi
+MAX_AGE_SECONDS = 7 * 86400  # spooled readings after an outage; as long as ReadingStore keeps sequence numbers
+MILLISECONDS_THRESHOLD = 1e11  # year 5138 in seconds, 1973 in milliseconds
+
+STATUS_CODES = {status: code for code, status in enumerate(Status)}  # Status -> uint8 column value
+STATUSES = list(Status)  # uint8 column value -> Status
+
+
+def to_status(text: str) -> Status:
+    try:
+        return Status(text.strip().upper())
+    except ValueError:
+        return Status.UNKNOWN
+
+
+class PayloadError(ValueError):
+    """A payload line that doesn't match its sensor schema."""
+
+
+def timestamp_error(ts: float, now: float) -> str | None:
+    if ts >= MILLISECONDS_THRESHOLD:
+        return "timestamp looks like milliseconds, send seconds since the epoch"
+    if not now - MAX_AGE_SECONDS <= ts <= now + MAX_FUTURE_SECONDS:
+        return (f"timestamp {ts:.0f} is outside the accepted window "
+                f"(server time - {MAX_AGE_SECONDS // 86400} d to + {MAX_FUTURE_SECONDS // 86400} d)")
+    return None
+
+
+class SensorSchema:
+    def __init__(self, name: str, fields: tuple[str, ...], labels: tuple[str, ...] | None = None):
+        self.name = name
+        self.fields = tuple(fields)  # float32 measurements, in wire order
+        self.labels = tuple(labels or fields)  # keys used in JSON responses
+        self.width = len(self.fields) + 1  # measurements + status
+
+    def to_dict(self, values: tuple[float, ...], status: Status, ts: float | None = None) -> dict:
+        reading = {} if ts is None else {"timestamp": ts}
+        reading.update(zip(self.labels, values))
+        reading["status"] = status
+        return reading
+
+
+DHT22_SCHEMA = SensorSchema("dht22", ("temperature", "humidity", "average"))
+ENS160_SCHEMA = SensorSchema("ens160", ("eco2", "tvoc", "aqi"),
+                             labels=("eCO2 level", "total TVOC", "air quality"))
+
+
+def parse_reading(schema: SensorSchema, raw_txt: str, timestamped: bool = False) -> tuple:
+    """
+    Fast path for one reading. Returns (ts, *measurements, status); ts is None unless timestamped.
+    """
+    values = raw_txt.strip().split(",")
+    expected = schema.width + (1 if timestamped else 0)
+    if len(values) != expected:
+        raise PayloadError(f"{schema.name}: expected {expected} fields, got {len(values)}")
+
+    try:
+        numbers = list(map(float, values[:-1]))
+    except ValueError:
+        raise PayloadError(f"{schema.name}: measurements must be numeric") from None
+    # the sum is nan/inf as soon as one value is, one check instead of one per field
+    if not math.isfinite(sum(numbers)):
+        raise PayloadError(f"{schema.name}: measurements must be finite")
+
+    ts = numbers.pop(0) if timestamped else None
+    return (ts, *numbers, to_status(values[-1]))
+
+
+class ParsedBlock:
+    """
+    Columnar result of parse_block. `columns` holds "timestamp" (float64), one float32 array
+    per schema field and "status" (uint8 codes into STATUSES), for the analytics. `measurements`
+    keeps the float64 values rows() hands to storage, so a stored 22.6 stays 22.6 (the same
+    value parse_reading produces), not its float32 neighbour 22.600000381469727. `errors` lists the rejected
+    lines as {"index": 0-based line position, blank lines included, "error": reason}. `lines` holds
+    the 1-based line number of every accepted row (what a sequence number counts, see SensorPipeline).
+    """
+
+    def __init__(self, schema: SensorSchema, columns: dict[str, np.ndarray], errors: list[dict],
+                 lines: list[int] | None = None, measurements: np.ndarray | None = None):
+        self.schema = schema
+        self.columns = columns
+        self.measurements = (measurements if measurements is not None
+                             else np.zeros((len(columns["timestamp"]), len(schema.fields)), dtype=np.float64))
+        self.errors = errors
+        self.lines = lines if lines is not None else []
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def rows(self) -> list[tuple]:
+        """(ts, *measurements, status) tuples, the shape ReadingStore.insert_* expects."""
+        statuses = [STATUSES[code].value for code in self.columns["status"].tolist()]
+        return list(zip(self.columns["timestamp"].tolist(), *self.measurements.T.tolist(), statuses))
+
+
+def parse_block(schema: SensorSchema, raw_txt: str, now: float | None = None) -> ParsedBlock:
+    """
+    Vectorized path for newline-delimited "ts,measurement...,status" lines.
+    The text is only split into fields; the float conversion of every number in the
+    block happens in a single NumPy call. Malformed lines are reported, never dropped silently,
+    and so are lines whose timestamp is outside the window around `now` (see timestamp_error).
+    """
+    now = time.time() if now is None else now
+    n_numeric = schema.width  # timestamp + measurements
+    numeric_parts = []
+    statuses = []
+    line_numbers = []
+    errors = []
+
+    for line_no, line in enumerate(raw_txt.splitlines(), start=1):
+        line = line.strip()
+        if not line:  # tolerate blank lines / trailing newline
+            continue
+        head, _, status = line.rpartition(",")
+        if head.count(",") != n_numeric - 1:
+            errors.append({"index": line_no - 1, "error": f"expected {n_numeric + 1} fields, got {line.count(',') + 1}"})
+            continue
+        numeric_parts.append(head)
+        statuses.append(status)
+        line_numbers.append(line_no)
+
+    if not numeric_parts:
+        return ParsedBlock(schema, _empty_columns(schema), errors)
+
+    try:
+        matrix = np.array(",".join(numeric_parts).split(","), dtype=np.float64).reshape(-1, n_numeric)
+        good = np.isfinite(matrix).all(axis=1)
+    except ValueError:
+        # at least one value isn't a number: find the offending lines the slow way
+        matrix, good = _parse_rows_slowly(numeric_parts, n_numeric)
+    finite = good
+    good = finite & (matrix[:, 0] >= now - MAX_AGE_SECONDS) & (matrix[:, 0] <= now + MAX_FUTURE_SECONDS)
+
+    if not good.all():
+        for i in np.flatnonzero(~good).tolist():
+            error = timestamp_error(matrix[i, 0], now) if finite[i] else None
+            error = error or "timestamp and measurements must be finite numbers"
+            errors.append({"index": line_numbers[i] - 1, "error": error})
+        errors.sort(key=lambda e: e["index"])
+        matrix = matrix[good]
+        statuses = [s for s, ok in zip(statuses, good.tolist()) if ok]
+        line_numbers = [n for n, ok in zip(line_numbers, good.tolist()) if ok]
+
+    # map the (few) distinct status strings once instead of once per line
+    uniques, inverse = np.unique(np.array(statuses, dtype=str), return_inverse=True)
+    codes = np.array([STATUS_CODES[to_status(u)] for u in uniques.tolist()], dtype=np.uint8)
+
+    columns = {"timestamp": np.ascontiguousarray(matrix[:, 0])}
+    for i, field in enumerate(schema.fields, start=1):
+        columns[field] = matrix[:, i].astype(np.float32)
+    columns["status"] = codes[inverse.reshape(-1)] if len(statuses) else np.zeros(0, dtype=np.uint8)
+    return ParsedBlock(schema, columns, errors, line_numbers, measurements=matrix[:, 1:])
+
+
+def _parse_rows_slowly(numeric_parts: list[str], n_numeric: int) -> tuple[np.ndarray, np.ndarray]:
+    matrix = np.full((len(numeric_parts), n_numeric), np.nan, dtype=np.float64)
+    for i, head in enumerate(numeric_parts):
+        try:
+            matrix[i] = [float(v) for v in head.split(",")]
+        except ValueError:
+            pass  # row stays NaN and is reported by the caller
+    return matrix, np.isfinite(matrix).all(axis=1)
+
+
+def _empty_columns(schema: SensorSchema) -> dict[str, np.ndarray]:
+    columns = {"timestamp": np.zeros(0, dtype=np.float64)}
+    columns.update({field: np.zeros(0, dtype=np.float32) for field in schema.fields})
+    columns["status"] = np.zeros(0, dtype=np.uint8)
+    return columns
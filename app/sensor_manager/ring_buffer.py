@@ -0,0 +1,86 @@
+#  Purpose:
+#  - Fixed-capacity, array-backed history of recent readings for the live dashboard.
+#    Memory is allocated once up front, so a week of 1 Hz data never grows the process.
+#
+#  Key Attributes:
+#  - capacity: number of readings kept per sensor
+#  - fields: measurement names stored next to the timestamp (one float32 column each)
+#
+#  Main Methods:
+#  - append(ts, values): O(1) insert of one reading
+#  - latest(): most recent reading as a dict, or None
+#  - window(seconds, now): NumPy copies of the readings from the last N seconds, taken under the lock
+#
+#  Example:
+#      ring = SensorRingBuffer(("temperature", "humidity"), capacity=86400)
+#      ring.append(time.time(), (22.5, 60.0))
+#      ring.window(300, time.time())["temperature"]  # -> np.ndarray, one memcpy
+#
+#  Note:
+#  Every value is written twice, at i and i + capacity. Any run of up to `capacity`
+#  consecutive readings is then one contiguous slice, so window() copies it with a single
+#  memcpy per column even when the ring has wrapped. The price is 2x memory, still constant.
+
+import threading
+
+import numpy as np
+
+
+class SensorRingBuffer:
+    def __init__(self, fields: tuple[str, ...], capacity: int = 86400):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1.")
+        self.fields = tuple(fields)
+        self.capacity = capacity
+
+        self._ts = np.zeros(2 * capacity, dtype=np.float64)  # epoch seconds need float64 precision
+        self._columns = {field: np.zeros(2 * capacity, dtype=np.float32) for field in self.fields}
+        self._head = 0  # next write position in [0, capacity)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, values: tuple[float, ...]) -> bool:
+        """
+        Store one reading. Readings older than the newest one (e.g. a Pico replaying its
+        buffer after an outage) are skipped so timestamps stay sorted; they still reach SQLite.
+        """
+        with self._lock:
+            if self._size and ts < self._ts[self._head + self.capacity - 1]:
+                return False
+
+            head, mirror = self._head, self._head + self.capacity
+            self._ts[head] = self._ts[mirror] = ts
+            for field, value in zip(self.fields, values):
+                column = self._columns[field]
+                column[head] = column[mirror] = value
+
+            self._head = (head + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            return True
+
+    def latest(self) -> dict | None:
+        with self._lock:
+            if not self._size:
+                return None
+            i = self._head + self.capacity - 1
+            reading = {"timestamp": float(self._ts[i])}
+            reading.update({field: float(column[i]) for field, column in self._columns.items()})
+            return reading
+
+    def window(self, seconds: float, now: float) -> dict[str, np.ndarray]:
+        """
+        Readings with timestamp >= now - seconds, oldest first.
+        The arrays are copied while the lock is held, so a concurrent append can't tear them.
+        """
+        with self._lock:
+            end = self._head + self.capacity  # one past the newest reading
+            start = end - self._size
+            ts = self._ts[start:end]
+            offset = int(np.searchsorted(ts, now - seconds, side="left"))
+
+            window = {"timestamp": ts[offset:].copy()}
+            window.update({field: column[start + offset:end].copy() for field, column in self._columns.items()})
+            return window
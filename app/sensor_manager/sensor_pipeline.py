@@ -4,34 +4,287 @@
 #  Key Attributes:
 #  - api_key: shared secret for validation (if needed)
 #  - server_url: optional reference to sender, (Pico)
-#  - dht22_data: latest DHT22 reading as text
-#  - ens160_data: latest ENS160 reading as text
+#  - store: optional ReadingStore used to persist batches
+#  - buffer: optional WriteBuffer that group-commits single readings
+#  - devices: DeviceRegistry holding each Pico's latest readings and ring buffers (typed, see payload_parser);
+#             every update_* method takes a device id, Picos that send none share DEFAULT_DEVICE
+#  - broadcaster: optional ReadingBroadcaster pushing every accepted reading to /stream clients
+#  - alerts: optional AlertEngine evaluating threshold rules on every accepted reading
+#  - anomalies: optional AnomalyDetector flagging spikes, drift and stuck sensors as readings arrive
+#  - dedup: DedupIndex dropping retransmitted readings (those that carry a per-device sequence number)
+#
+#  Sequence numbers (optional for text, always present in binary frames):
+#  - single reading: `seq` is the reading's number
+#  - batch: `seq` is the number of the first line, line n has seq + n - 1 (blank and bad lines count too)
+#  - frame: every record carries its own
+#  A duplicate is acknowledged like a stored reading (so the Pico stops resending) but not stored,
+#  published or evaluated again; batch and frame answers count them under "duplicates".
+#
+#  Rejected batch lines and frame records are answered as {"index": 0-based position in the upload,
+#  "error": reason} in the response's "errors" list, whichever endpoint received them.
+#
+#  Pico timestamps (batches and frames) must lie within the window around the server clock, see
+#  payload_parser.timestamp_error; the parsers reject the rest and _ingest_rows checks again before storage.
 #
 #  Main Methods:
-#  - update_dht22_data(raw_txt): parse and store DHT22 data
-#  - update_ens160_data(raw_txt): parse and store ENS160 data
+#  - update_dht22_data(raw_txt, device, seq): parse and store DHT22 data (queued on the write buffer if numeric)
+#  - update_ens160_data(raw_txt, device, seq): parse and store ENS160 data (queued on the write buffer if numeric)
+#  - update_dht22_batch(raw_txt, device, seq): parse many "ts,temp,hum,avg,status" lines and persist them in one write
+#  - update_ens160_batch(raw_txt, device, seq): parse many "ts,eco2,tvoc,aqi,status" lines and persist them in one write
+#  - update_frame(kind, data, device): decode a binary wire_format frame and persist its records in one write
+#  - latest(kind, device) / window(kind, seconds, device): recent readings straight from that device's rings
+#  - history(kind, field, start, end, max_points): long-range buckets from the store's rollups
+#  - resample(series, start, end, step, how, fill, max_gap): "sensor.field" series on one regular grid (raw readings)
+#  - backtest_anomalies(kind, start, end, detector): score stored history with a (fresh) AnomalyDetector
 #
 #  Example:
 #      manager = SensorManger(api_key="123", server_url="http://localhost")
-#      manager.update_dht22_data("22.5,60,41.2,OK")
+#      manager.update_dht22_data("22.5,60,41.2,OK", device="pico-3f2a", seq=1041)
+#      manager.update_dht22_batch("1717000000,22.5,60,41.2,OK\n1717000001,22.6,60,41.3,OK")
+
+import time
+
+import numpy as np
+
+from app_logging.decorators.log_decorator import LogDecorator
+from app_logging.log_utils import Logger
+from sensor_manager.alerts import AlertEngine
+from sensor_manager.anomaly import AnomalyDetector
+from sensor_manager.broadcaster import ReadingBroadcaster
+from sensor_manager.dedup import DedupIndex
+from sensor_manager.device_registry import DEFAULT_DEVICE, RING_FIELDS, DeviceRegistry, DeviceState
+from sensor_manager.payload_parser import (DHT22_SCHEMA, ENS160_SCHEMA, MAX_AGE_SECONDS, MAX_FUTURE_SECONDS,
+                                            PayloadError, SensorSchema, Status, parse_block, parse_reading,
+                                            timestamp_error)
+from sensor_manager.wire_format import decode_frame
+from storage.reading_store import ReadingStore
+from storage.write_buffer import BufferFullError, WriteBuffer
+
+
+log = LogDecorator(debug_enabled=False)  # payloads stay out of the log, 1 in 100 calls is logged
+
+# timed per request phase as well (Server-Timing header, see app_logging/request_timing.py)
+timed_parse_reading = log.time_this(parse_reading, phase="parsing")
+timed_parse_block = log.time_this(parse_block, phase="parsing")
+timed_decode_frame = log.time_this(decode_frame, phase="parsing")
+
+SCHEMAS = {"dht22": DHT22_SCHEMA, "ens160": ENS160_SCHEMA}
 
 
 class SensorPipeline:
-    def __init__(self, api_key: str, server_url: str):
+    def __init__(self, api_key: str, server_url: str, store: ReadingStore | None = None,
+                 buffer: WriteBuffer | None = None, ring_capacity: int = 3600,
+                 broadcaster: ReadingBroadcaster | None = None, alerts: AlertEngine | None = None,
+                 anomalies: AnomalyDetector | None = None, shards: int = 64, idle_seconds: float = 3600.0,
+                 dedup_window: int = 512):
         self.api_key = api_key
         self.server_url = server_url
+        self.store = store
+        self.buffer = buffer
+        self.broadcaster = broadcaster
+        self.alerts = alerts
+        self.anomalies = anomalies
+        self.logger = Logger().get_logger()
+
+        # ring_capacity is per device and sensor: a few hundred Picos x 1 h at 1 Hz stays in the tens of MB
+        self.devices = DeviceRegistry(shards=shards, ring_capacity=ring_capacity, idle_seconds=idle_seconds,
+                                      on_evict=self._forget_device)
+        self.dedup = DedupIndex(window=dedup_window)
+        # the collaborators' hot calls, wrapped once so each request's storage / analysis / publishing time adds up
+        self._inserts = {"dht22": log.time_this(store.insert_dht22, phase="storage"),
+                         "ens160": log.time_this(store.insert_ens160, phase="storage")} if store else {}
+        self._insert_sequenced = log.time_this(store.insert_sequenced, phase="storage") if store else None
+        self._submit = log.time_this(buffer.submit, phase="storage") if buffer is not None else None
+        self._publish = log.time_this(broadcaster.publish, phase="publishing") if broadcaster is not None else None
+        self._evaluate_alerts = log.time_this(alerts.evaluate, phase="analysis") if alerts is not None else None
+        self._observe_anomalies = log.time_this(anomalies.observe, phase="analysis") if anomalies is not None else None
+
+    @log.log_this(sample_every=100)
+    def update_dht22_data(self, raw_txt: str, device: str = DEFAULT_DEVICE, seq: int | None = None) -> dict:
+        return self._update_single(DHT22_SCHEMA, raw_txt, device, seq)
+
+    @log.log_this(sample_every=100)
+    def update_ens160_data(self, raw_txt: str, device: str = DEFAULT_DEVICE, seq: int | None = None) -> dict:
+        return self._update_single(ENS160_SCHEMA, raw_txt, device, seq)
+
+    def _update_single(self, schema: SensorSchema, raw_txt: str, device: str, seq: int | None = None) -> dict:
+        """
+        Parse one "value,value,value,status" reading, stamp it with the server time, push it
+        into the ring buffer and queue it for group commit. A malformed payload is answered
+        with the raw fields plus an "error" explaining why it wasn't stored, a retransmit
+        (same seq) with the reading plus "duplicate": True. Without a write buffer the reading
+        goes straight to the store, the way a batch of one would.
+        BufferFullError is left to the caller so it can answer 503.
+        """
+        try:
+            _, *values, status = timed_parse_reading(schema, raw_txt)
+        except PayloadError as e:
+            reading = dict(zip(schema.labels + ("status",), raw_txt.split(",")))
+            reading["error"] = str(e)
+            return reading
+
+        row = (time.time(), *values, status.value)
+        if seq is not None and not self.dedup.claim(device, schema.name, [seq], now=row[0])[0]:
+            self.devices.touch(device, row[0], duplicates=1)
+            reading = schema.to_dict(values, status)
+            reading["duplicate"] = True
+            return reading
+        if self._submit is not None or self.store is not None:
+            try:
+                if self._submit is not None:
+                    self._submit(schema.name, row)
+                else:
+                    self._inserts[schema.name]([row])
+            except Exception:
+                if seq is not None:
+                    self.dedup.release(device, schema.name, [seq])  # not stored: the retry must get through
+                raise
+        state = self.devices.touch(device, row[0], readings=1, kind=schema.name)
+        self._accept(schema, row, state)
+        state.latest[schema.name] = reading = schema.to_dict(values, status)
+        return reading
+
+    def _accept(self, schema: SensorSchema, row: tuple, state: DeviceState) -> None:
+        """Live side of an accepted reading: the device's ring buffer, SSE fan-out, alerts, anomalies."""
+        ts, first, second, third, status = row
+        device = state.device
+        state.rings[schema.name].append(ts, row[1:1 + len(RING_FIELDS[schema.name])])
+
+        if self._publish is not None:
+            reading = schema.to_dict((first, second, third), status, ts=ts)
+            reading["device"] = device
+            self._publish(schema.name, reading)
+
+        if self._evaluate_alerts is not None:
+            for event in self._evaluate_alerts(schema.name, row, device):
+                self.logger.warning("[ALERT] %s %s (value %s)", event["state"], event["rule"], event["value"])
+                if self._publish is not None:
+                    self._publish("alert", event)
+
+        if self._observe_anomalies is not None:
+            for event in self._observe_anomalies(schema.name, row, device):
+                self.logger.warning("[ANOMALY] %s %s.%s (value %s, score %.1f)", event["type"], event["sensor"],
+                                    event["field"], event["value"], event["score"])
+                if self._publish is not None:
+                    self._publish("anomaly", event)
+
+    def latest(self, kind: str, device: str = DEFAULT_DEVICE) -> dict | None:
+        state = self.devices.get(device)
+        ring = state.rings.get(kind) if state is not None else None
+        return ring.latest() if ring is not None else None
+
+    def window(self, kind: str, seconds: float, now: float | None = None, device: str = DEFAULT_DEVICE) -> dict:
+        state = self.devices.get(device)
+        ring = state.rings.get(kind) if state is not None else None
+        if ring is None:
+            return {"timestamp": np.empty(0), **{field: np.empty(0, dtype=np.float32) for field in RING_FIELDS[kind]}}
+        return ring.window(seconds, time.time() if now is None else now)
+
+    def _forget_device(self, device: str) -> None:
+        """Evicted by the registry: drop the per-device rolling state the engines keep as well."""
+        self.dedup.forget(device)  # the store's unique index still catches a late retransmit
+        if self.alerts is not None:
+            self.alerts.forget(device)
+        if self.anomalies is not None:
+            self.anomalies.forget(device)
+
+    def history(self, kind: str, field: str, start: float, end: float, max_points: int = 500) -> dict:
+        if self.store is None:
+            raise ValueError("history needs a ReadingStore")
+        return self.store.history(kind, field, start, end, max_points)
+
+    def resample(self, series: list[str], start: float, end: float, step: float, how: str = "mean",
+                 fill: str = "none", max_gap: float | None = None) -> dict:
+        if self.store is None:
+            raise ValueError("resampling needs a ReadingStore")
+        return self.store.resample(series, start, end, step, how, fill, max_gap)
+
+    def backtest_anomalies(self, kind: str, start: float, end: float,
+                           detector: AnomalyDetector | None = None) -> list[dict]:
+        if self.store is None:
+            raise ValueError("backtesting needs a ReadingStore")
+        columns = self.store.columns(kind, SCHEMAS[kind].fields, start, end)
+        return (detector or AnomalyDetector()).score_columns(kind, columns)
+
+    @log.log_this(sample_every=100)
+    def update_dht22_batch(self, raw_txt: str, device: str = DEFAULT_DEVICE, seq: int | None = None) -> dict:
+        return self._update_batch(DHT22_SCHEMA, raw_txt, device, seq)
+
+    @log.log_this(sample_every=100)
+    def update_ens160_batch(self, raw_txt: str, device: str = DEFAULT_DEVICE, seq: int | None = None) -> dict:
+        return self._update_batch(ENS160_SCHEMA, raw_txt, device, seq)
+
+    def _update_batch(self, schema: SensorSchema, raw_txt: str, device: str, seq: int | None = None) -> dict:
+        """
+        Parse newline-delimited "timestamp,value,value,value,status" lines in one vectorized pass.
+        Bad lines are reported (0-based line index + reason) instead of failing the whole batch.
+        """
+        now = time.time()
+        block = timed_parse_block(schema, raw_txt, now)
+        seqs = None if seq is None else [seq + line - 1 for line in block.lines]
+        return self._ingest_rows(schema, block.rows(), block.errors, device, seqs, now,
+                                 [line - 1 for line in block.lines])
 
-    def update_dht22_data(self, raw_txt: str) -> dict:
-        keys = ["temperature", "humidity", "average", "status"]
-        values = raw_txt.split(",")
-        self.dht22_data = dict(zip(keys, values))
+    @log.log_this(sample_every=100)
+    def update_frame(self, kind: str, data: bytes, device: str | None = None) -> dict:
+        """
+        Binary upload (see wire_format). Raises FrameError when the frame itself is unusable;
+        individual bad records are reported like bad batch lines. Without an explicit device
+        the frame header's device id is used.
+        """
+        now = time.time()
+        frame = timed_decode_frame(data, expected_kind=kind, now=now)
+        return self._ingest_rows(SCHEMAS[kind], frame.rows, frame.errors,
+                                 str(frame.device_id) if device is None else device, frame.seqs, now, frame.indices)
 
-        return self.dht22_data
+    def _ingest_rows(self, schema: SensorSchema, rows: list[tuple], errors: list[dict], device: str,
+                     seqs: list[int] | None = None, now: float | None = None,
+                     indices: list[int] | None = None) -> dict:
+        """`indices` is each row's position in the upload, what its "errors" entries point at."""
+        now = time.time() if now is None else now
+        if rows and not all(now - MAX_AGE_SECONDS <= row[0] <= now + MAX_FUTURE_SECONDS for row in rows):
+            # the parsers already filter these: nothing with a bogus clock may reach storage or retention
+            keep = [i for i, row in enumerate(rows) if timestamp_error(row[0], now) is None]
+            indices = indices if indices is not None else list(range(len(rows)))
+            errors = sorted(errors + [{"index": indices[i], "error": timestamp_error(rows[i][0], now)}
+                                      for i in sorted(set(range(len(rows))) - set(keep))], key=lambda e: e["index"])
+            rows = [rows[i] for i in keep]
+            seqs = None if seqs is None else [seqs[i] for i in keep]
+        offered = len(rows)
+        if rows and seqs is not None:
+            rows, seqs = self._drop_duplicates(schema, rows, device, seqs)
+        elif rows and self.store:
+            self._inserts[schema.name](rows)
+        duplicates = offered - len(rows)
 
-    def update_ens160_data(self, raw_txt: str) -> dict:
-        keys = ["eCO2 level", "total TVOC", "air quality", "status"]
-        values = raw_txt.split(",")
-        self.ens160_data = dict(zip(keys,values))
+        if rows or duplicates:
+            state = self.devices.touch(device, now, readings=len(rows), kind=schema.name if rows else None,
+                                       duplicates=duplicates)
+            for row in rows:
+                self._accept(schema, row, state)
+            if rows:
+                ts, *values, status = rows[-1]
+                state.latest[schema.name] = schema.to_dict(values, Status(status), ts=ts)
 
-        return self.ens160_data
+        return {"accepted": len(rows), "duplicates": duplicates, "rejected": len(errors), "errors": errors}
 
+    def _drop_duplicates(self, schema: SensorSchema, rows: list[tuple], device: str,
+                         seqs: list[int]) -> tuple[list[tuple], list[int]]:
+        """
+        The rows (and their seqs) to accept: first the in-memory window, then, for what got past
+        it, the store's unique index, which also stores them. A failed write un-claims the rows.
+        """
+        fresh = self.dedup.claim(device, schema.name, seqs, [row[0] for row in rows])
+        if not all(fresh):
+            rows = [row for row, new in zip(rows, fresh) if new]
+            seqs = [seq for seq, new in zip(seqs, fresh) if new]
+        if rows and self.store:
+            try:
+                stored = self._insert_sequenced(schema.name, rows, device, seqs)
+            except Exception:
+                self.dedup.release(device, schema.name, seqs)
+                raise
+            if len(stored) < len(rows):
+                rows = [rows[i] for i in stored]
+                seqs = [seqs[i] for i in stored]
+        return rows, seqs
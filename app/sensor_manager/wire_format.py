@@ -0,0 +1,113 @@
+#  Purpose:
+#  - Compact fixed-layout binary frames for Pico -> Pi uploads. Cheaper than CSV on the
+#    Pico (no float formatting), on the radio (fewer bytes) and on the Pi (no string splitting).
+#    Sent to the existing /dht22 and /ens160 routes with Content-Type: CONTENT_TYPE.
+#
+#  Frame layout (little-endian):
+#      header  <B B I H>   version, sensor (1 = DHT22, 2 = ENS160), device id, record count   8 bytes
+#      records, `count` times:
+#        DHT22   <I I H h H h B>  seq, ts seconds, ts millis, temperature, humidity, average, status  17 bytes
+#        ENS160  <I I H H H B B>  seq, ts seconds, ts millis, eco2 (ppm), tvoc (ppb), aqi, status     16 bytes
+#      DHT22 values are fixed-point tenths (225 = 22.5 °C), the sensor's own 0.1 resolution.
+#      status is the index into payload_parser.STATUSES (0 = OK)
+#
+#  Main Methods:
+#  - encode_frame(kind, device_id, records): build a frame (tests, benchmarks, Pico reference)
+#  - decode_frame(data, expected_kind, now): parse a frame straight from the request bytes via memoryview
+#    (records with an implausible timestamp are reported like bad records, see payload_parser.timestamp_error)
+#
+#  Example:
+#      frame = encode_frame("dht22", 7, [(1, 1717000000.0, 22.5, 60.0, 41.2, 0)])
+#      decode_frame(frame).rows  # -> [(1717000000.0, 22.5, 60.0, 41.2, "OK")]
+#
+#  MicroPython side: ustruct.pack("<BBIH", 1, 1, device_id, n) + b"".join(
+#      ustruct.pack("<IIHhHhB", seq, secs, millis, round(t * 10), round(h * 10), round(avg * 10), status) for ...)
+
+import struct
+import time
+
+from sensor_manager.payload_parser import MAX_AGE_SECONDS, MAX_FUTURE_SECONDS, STATUSES, timestamp_error
+
+CONTENT_TYPE = "application/vnd.localedge.frame"
+VERSION = 1
+
+HEADER = struct.Struct("<BBIH")
+RECORDS = {
+    "dht22": struct.Struct("<IIHhHhB"),
+    "ens160": struct.Struct("<IIHHHBB"),
+}
+DIVISORS = {"dht22": 10, "ens160": 1}  # measurement = wire integer / divisor
+SENSOR_IDS = {"dht22": 1, "ens160": 2}
+SENSOR_KINDS = {sensor_id: kind for kind, sensor_id in SENSOR_IDS.items()}
+
+
+class FrameError(ValueError):
+    """The frame as a whole can't be decoded (bad header, wrong length, unknown version)."""
+
+
+class DecodedFrame:
+    def __init__(self, kind: str, device_id: int, rows: list[tuple], seqs: list[int], errors: list[dict],
+                 indices: list[int] | None = None):
+        self.kind = kind
+        self.device_id = device_id
+        self.rows = rows  # (ts, first, second, third, status) like ParsedBlock.rows()
+        self.seqs = seqs  # sequence number of each row, same order
+        self.errors = errors  # {"index": 0-based record position, "error": reason}
+        self.indices = indices if indices is not None else list(range(len(rows)))  # record position of each row
+
+
+def encode_frame(kind: str, device_id: int, records: list[tuple]) -> bytes:
+    """records: (seq, ts, first, second, third, status_code) tuples, measurements in real units."""
+    record = RECORDS[kind]
+    divisor = DIVISORS[kind]
+    parts = [HEADER.pack(VERSION, SENSOR_IDS[kind], device_id, len(records))]
+    for seq, ts, first, second, third, status in records:
+        seconds = int(ts)
+        millis = min(999, round((ts - seconds) * 1000))
+        parts.append(record.pack(seq, seconds, millis, round(first * divisor), round(second * divisor),
+                                 round(third * divisor), status))
+    return b"".join(parts)
+
+
+def decode_frame(data: bytes, expected_kind: str | None = None, now: float | None = None) -> DecodedFrame:
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise FrameError(f"frame shorter than its {HEADER.size}-byte header")
+
+    version, sensor_id, device_id, count = HEADER.unpack_from(view, 0)
+    if version != VERSION:
+        raise FrameError(f"unsupported frame version {version}")
+    kind = SENSOR_KINDS.get(sensor_id)
+    if kind is None:
+        raise FrameError(f"unknown sensor id {sensor_id}")
+    if expected_kind is not None and kind != expected_kind:
+        raise FrameError(f"frame carries {kind} readings, not {expected_kind}")
+
+    record = RECORDS[kind]
+    body = view[HEADER.size:]
+    if len(body) != count * record.size:
+        raise FrameError(f"expected {count} records of {record.size} bytes, got {len(body)} bytes")
+
+    rows, seqs, errors, indices = [], [], [], []
+    divisor = DIVISORS[kind]
+    n_statuses = len(STATUSES)
+    now = time.time() if now is None else now
+    oldest, newest = now - MAX_AGE_SECONDS, now + MAX_FUTURE_SECONDS
+    # iter_unpack walks the memoryview in place: no slicing copies, no text
+    for index, (seq, seconds, millis, first, second, third, status) in enumerate(record.iter_unpack(body)):
+        if status >= n_statuses:
+            errors.append({"index": index, "error": f"unknown status code {status}"})
+            continue
+        if millis > 999:
+            errors.append({"index": index, "error": f"millisecond field out of range: {millis}"})
+            continue
+        ts = seconds + millis / 1000
+        if not oldest <= ts <= newest:
+            errors.append({"index": index, "error": timestamp_error(ts, now)})
+            continue
+        if divisor != 1:
+            first, second, third = first / divisor, second / divisor, third / divisor
+        rows.append((ts, first, second, third, STATUSES[status].value))
+        seqs.append(seq)
+        indices.append(index)
+    return DecodedFrame(kind, device_id, rows, seqs, errors, indices)
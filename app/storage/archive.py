@@ -0,0 +1,243 @@
+#  Purpose:
+#    Cold storage for closed reading partitions. A partition becomes one directory of
+#    column files (timestamps, one float32 file per field, uint8 status codes) that are
+#    read back with np.memmap: a range query maps the files, binary-searches the
+#    timestamps and only pages in the slice it needs, so a year of history never has
+#    to fit in the Pi's RAM. 17 bytes per DHT22/ENS160 reading, a fraction of its SQLite row + index.
+#
+#  Key Attributes:
+#    - directory (str): root of the archive, one sub-directory per sensor and period
+#    - delta_ts (bool): store timestamps as uint32 milliseconds since the period start
+#                       (4 bytes, still sorted, so searchsorted works on the map) instead of float64 seconds.
+#                       Archived timestamps are therefore millisecond resolution.
+#
+#  Main Methods:
+#    - write_partition(sensor, period_start, rows): archive (ts, v1, v2, v3, status) rows, atomically
+#    - recover(): finish or roll back writes a crash interrupted (run by the constructor)
+#    - periods(sensor): period starts that are archived
+#    - iter_ranges(sensor, start, end): per-period column views for [start, end), for streaming scans
+#    - query(sensor, start, end): the same ranges concatenated into one dict of arrays
+#    - rows(sensor, start, end): the same ranges as (ts, v1, v2, v3, status) tuples
+#    - drop_before(cutoff, period_seconds): delete archived periods that end before cutoff
+#
+#  Example:
+#      archive = ColumnarArchive("app/data/archive")
+#      archive.write_partition("dht22", 1716768000, rows)
+#      archive.query("dht22", 1716768000, 1716854400)["temperature"]  # float32 array
+#
+#  On-disk format (little-endian, no header, length = meta["count"]):
+#      <directory>/<sensor>/<YYYYMMDD>/meta.json   {"start", "count", "ts_encoding", "fields"}
+#                                      ts.u4 | ts.f8, <field>.f4 ..., status.u1
+#      <YYYYMMDD>.tmp is a write in progress (complete once its meta.json exists, which is
+#      written last), <YYYYMMDD>.old the previous version while the new one is swapped in.
+
+import calendar
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from sensor_manager.payload_parser import STATUS_CODES, STATUSES, to_status
+from storage.rollups import ROLLUP_FIELDS
+
+MAX_DELTA_MS = np.iinfo(np.uint32).max  # ~49 days of milliseconds, plenty for a week partition
+
+
+class ColumnarArchive:
+    def __init__(self, directory: str, delta_ts: bool = True):
+        self.directory = directory
+        self.delta_ts = delta_ts
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+
+    def write_partition(self, sensor: str, period_start: int, rows: list[tuple]) -> int:
+        """
+        Write one period's rows (any order) as column files. The files are built and fsynced in
+        a temporary directory, then swapped into place: the previous version is renamed aside,
+        the new one renamed in, and only then is the old one deleted. Readers see one whole
+        version or the other, and after a crash at any step recover() finds a complete copy.
+        """
+        if not rows:
+            return 0
+        fields = ROLLUP_FIELDS[sensor]
+        rows = sorted(rows, key=lambda row: row[0])
+        ts = np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+
+        ts_encoding = "f8"
+        if self.delta_ts and ts[0] >= period_start and (ts[-1] - period_start) * 1000 <= MAX_DELTA_MS:
+            ts_encoding = "u4"
+
+        final_dir = self._period_dir(sensor, period_start)
+        tmp_dir = final_dir + ".tmp"
+        os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+        self._recover_period(final_dir)  # a leftover .tmp is finished first, it may hold merged rows
+        os.makedirs(tmp_dir)
+
+        if ts_encoding == "u4":
+            np.rint((ts - period_start) * 1000).astype("<u4").tofile(os.path.join(tmp_dir, "ts.u4"))
+        else:
+            ts.astype("<f8").tofile(os.path.join(tmp_dir, "ts.f8"))
+        for index, field in enumerate(fields, start=1):
+            values = np.array([np.nan if row[index] is None else row[index] for row in rows], dtype="<f4")
+            values.tofile(os.path.join(tmp_dir, f"{field}.f4"))
+        codes = np.array([STATUS_CODES[to_status(row[-1] or "")] for row in rows], dtype=np.uint8)
+        codes.tofile(os.path.join(tmp_dir, "status.u1"))
+
+        for name in os.listdir(tmp_dir):
+            with open(os.path.join(tmp_dir, name), "rb") as f:
+                os.fsync(f.fileno())
+        # meta.json last: its presence marks the .tmp directory as complete (see recover())
+        meta = {"start": period_start, "count": len(rows), "ts_encoding": ts_encoding, "fields": list(fields)}
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(tmp_dir)
+
+        self._swap_in(final_dir)  # re-archiving the same period replaces it
+        return len(rows)
+
+    def recover(self) -> None:
+        """
+        Clean up after a crash in write_partition(): a complete .tmp is swapped in (it may be the
+        only copy of rows merged from the old version), an incomplete one deleted, and a version
+        left renamed aside is put back or deleted.
+        """
+        for sensor in os.listdir(self.directory):
+            sensor_dir = os.path.join(self.directory, sensor)
+            if not os.path.isdir(sensor_dir):
+                continue
+            pending = {name[:-4] for name in os.listdir(sensor_dir) if name.endswith((".tmp", ".old"))}
+            for name in sorted(pending):
+                self._recover_period(os.path.join(sensor_dir, name))
+
+    def _recover_period(self, final_dir: str) -> None:
+        tmp_dir, old_dir = final_dir + ".tmp", final_dir + ".old"
+        tmp_complete = os.path.exists(os.path.join(tmp_dir, "meta.json"))
+        if os.path.isdir(tmp_dir) and not tmp_complete:
+            shutil.rmtree(tmp_dir)
+        if os.path.isdir(old_dir) and not os.path.isdir(final_dir):
+            if tmp_complete:
+                os.replace(tmp_dir, final_dir)  # crashed between the two renames
+                tmp_complete = False
+            else:
+                os.replace(old_dir, final_dir)
+            _fsync_dir(os.path.dirname(final_dir))
+        if os.path.isdir(old_dir):
+            shutil.rmtree(old_dir)  # the new version is in place
+        if tmp_complete:
+            self._swap_in(final_dir)
+
+    @staticmethod
+    def _swap_in(final_dir: str) -> None:
+        tmp_dir, old_dir = final_dir + ".tmp", final_dir + ".old"
+        parent = os.path.dirname(final_dir)
+        if os.path.isdir(final_dir):
+            os.replace(final_dir, old_dir)
+            _fsync_dir(parent)
+        os.replace(tmp_dir, final_dir)
+        _fsync_dir(parent)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def periods(self, sensor: str) -> list[int]:
+        sensor_dir = os.path.join(self.directory, sensor)
+        if not os.path.isdir(sensor_dir):
+            return []
+        starts = []
+        for name in os.listdir(sensor_dir):
+            if len(name) == 8 and name.isdigit():
+                starts.append(_day_start(name))
+        return sorted(starts)
+
+    def iter_ranges(self, sensor: str, start: float, end: float, period_seconds: int = 7 * 86400):
+        """
+        Yield {"timestamp", <fields>, "status"} for each archived period overlapping [start, end),
+        oldest first. Value and status arrays are read-only views into the memory map; only the
+        timestamps are materialised (decoded from their delta encoding). `period_seconds` just
+        bounds which directories are looked at, any value >= the partition period is correct.
+        """
+        for period_start in self.periods(sensor):
+            if period_start + period_seconds <= start or period_start >= end:
+                continue
+            columns = self._map(sensor, period_start)
+            if columns is None:
+                continue
+            raw_ts, meta = columns.pop("ts"), columns.pop("meta")
+            if meta["ts_encoding"] == "u4":
+                lo_key = max(0, int(np.ceil((start - period_start) * 1000)))
+                hi_key = max(0, int(np.ceil((end - period_start) * 1000)))
+                lo = np.searchsorted(raw_ts, min(lo_key, MAX_DELTA_MS + 1), side="left")
+                hi = np.searchsorted(raw_ts, min(hi_key, MAX_DELTA_MS + 1), side="left")
+                timestamps = raw_ts[lo:hi] / 1000 + period_start
+            else:
+                lo = np.searchsorted(raw_ts, start, side="left")
+                hi = np.searchsorted(raw_ts, end, side="left")
+                timestamps = np.array(raw_ts[lo:hi])
+            if hi <= lo:
+                continue
+            yield {"timestamp": timestamps, **{name: values[lo:hi] for name, values in columns.items()}}
+
+    def query(self, sensor: str, start: float, end: float, period_seconds: int = 7 * 86400) -> dict:
+        """All of [start, end) as one dict of arrays (copied out of the maps)."""
+        names = ("timestamp",) + ROLLUP_FIELDS[sensor] + ("status",)
+        parts = list(self.iter_ranges(sensor, start, end, period_seconds))
+        if not parts:
+            dtypes = {"timestamp": np.float64, "status": np.uint8}
+            return {name: np.empty(0, dtype=dtypes.get(name, np.float32)) for name in names}
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+    def rows(self, sensor: str, start: float, end: float, period_seconds: int = 7 * 86400) -> list[tuple]:
+        """[start, end) as (ts, v1, v2, v3, status) tuples, the same shape ReadingStore returns."""
+        result = []
+        for part in self.iter_ranges(sensor, start, end, period_seconds):
+            columns = [part["timestamp"].tolist()]
+            # via str: float32 22.3 comes back as 22.3, not 22.299999237060547
+            columns += [part[field].astype(str).astype(np.float64).tolist() for field in ROLLUP_FIELDS[sensor]]
+            columns.append([STATUSES[code].value for code in part["status"].tolist()])
+            result.extend(zip(*columns))
+        return result
+
+    def drop_before(self, cutoff: float, period_seconds: int) -> list[str]:
+        dropped = []
+        for sensor in os.listdir(self.directory):
+            for period_start in self.periods(sensor):
+                if period_start + period_seconds <= cutoff:
+                    path = self._period_dir(sensor, period_start)
+                    shutil.rmtree(path, ignore_errors=True)
+                    dropped.append(path)
+        return dropped
+
+    def _period_dir(self, sensor: str, period_start: int) -> str:
+        return os.path.join(self.directory, sensor, time.strftime("%Y%m%d", time.gmtime(period_start)))
+
+    def _map(self, sensor: str, period_start: int) -> dict | None:
+        path = self._period_dir(sensor, period_start)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None  # dropped between periods() and now
+
+        count = meta["count"]
+        encoding = meta["ts_encoding"]
+        columns = {"meta": meta,
+                   "ts": np.memmap(os.path.join(path, f"ts.{encoding}"), dtype=f"<{encoding}", mode="r", shape=(count,))}
+        for field in meta["fields"]:
+            columns[field] = np.memmap(os.path.join(path, f"{field}.f4"), dtype="<f4", mode="r", shape=(count,))
+        columns["status"] = np.memmap(os.path.join(path, "status.u1"), dtype=np.uint8, mode="r", shape=(count,))
+        return columns
+
+
+def _fsync_dir(path: str) -> None:
+    # a rename is only durable once the directory holding the entry is fsynced
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _day_start(name: str) -> int:
+    return calendar.timegm(time.strptime(name, "%Y%m%d"))
@@ -0,0 +1,66 @@
+#  Purpose:
+#    Periodic upkeep of a ReadingStore on the server clock: retention (drop expired
+#    partitions, forget old sequence numbers) and compaction of closed partitions into the
+#    archive. Runs on its own thread, off the ingest path, so a reading's timestamp never
+#    decides what gets dropped and no request waits for a partition to be archived.
+#
+#  Key Attributes:
+#    - store (ReadingStore): the store to maintain (the writer process's own, see writer_process.py)
+#    - interval (float): seconds between runs; partitions are days, hourly is plenty
+#    - runs / failed_runs / last_result: what the job has done so far
+#
+#  Main Methods:
+#    - run_once(now): one maintain() pass, errors are logged and counted
+#    - close(): stop the timer thread
+#
+#  Example:
+#      maintenance = StoreMaintenance(store, interval=3600)
+#      ...
+#      maintenance.close()
+
+import threading
+
+from app_logging.log_utils import Logger
+from storage.reading_store import ReadingStore
+
+
+class StoreMaintenance:
+    def __init__(self, store: ReadingStore, interval: float = 3600.0, autostart: bool = True):
+        if interval <= 0:
+            raise ValueError("interval must be > 0.")
+        self.store = store
+        self.interval = interval
+        self.logger = Logger().get_logger()
+
+        self.runs = 0
+        self.failed_runs = 0
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = None
+        if autostart:
+            self._thread = threading.Thread(target=self._run, name="StoreMaintenance", daemon=True)
+            self._thread.start()
+
+    def run_once(self, now: float | None = None) -> dict | None:
+        try:
+            result = self.store.maintain(now)
+        except Exception as e:
+            self.failed_runs += 1
+            self.logger.error(f"Store maintenance failed: {e}", exc_info=True)
+            return None
+        self.runs += 1
+        self.last_result = result
+        if any(result.values()):
+            self.logger.info(f"Store maintenance: {result}")
+        return result
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        # first pass right away: a server started after a long stop has expired partitions waiting
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
@@ -0,0 +1,178 @@
+#  Purpose:
+#    Time-partitioned reading tables. Rows go to one table per UTC day (or Monday-based week),
+#    e.g. dht22_readings_p20240529, so a range query only opens the partitions that
+#    overlap it and retention is a DROP TABLE per expired partition instead of a
+#    DELETE rewriting half the file. Dropped pages go on SQLite's freelist and are
+#    reused by the next partitions, so the file plateaus at about `retention` of data.
+#
+#  Key Attributes:
+#    - base (str): table name prefix, partitions are "<base>_p<YYYYMMDD of period start>"
+#    - columns (tuple): column names, ts first, in insert tuple order
+#    - period (str): "day" or "week" (weeks start Monday 00:00 UTC)
+#    - watch_schema (bool): another process creates and drops the partitions (see writer_process.py),
+#                           re-read them whenever SQLite's schema version changes
+#
+#  Main Methods:
+#    - insert(rows): route rows to their partitions, creating partitions on first use
+#    - drop_copied(period_start, last_rowid): remove rows copied elsewhere, the table too once it's empty
+#    - query(start, end): rows with start <= ts < end from the overlapping partitions, in ts order
+#    - partitions(): [(period_start, table_name)] oldest first
+#    - drop_before(cutoff): drop every partition that ends at or before cutoff
+#    - drop_partition(period_start): drop one partition (after it has been archived)
+#
+#  Example:
+#      table = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES, period="day")
+#      table.insert([(1717000000.0, 22.5, 60.0, 41.2, "OK")])
+#      table.query(1716940800, 1717027200)
+#      table.drop_before(time.time() - 90 * 86400)
+
+import calendar
+import sqlite3
+import threading
+import time
+
+from storage.sqlite_db import SqliteDB
+
+
+PERIODS = {"day": 86400, "week": 7 * 86400}
+WEEK_OFFSET = 4 * 86400  # 1970-01-01 was a Thursday, the first Monday is 4 days later
+
+
+class PartitionedTable:
+    def __init__(self, db: SqliteDB, base: str, columns: tuple, types: tuple, period: str = "day",
+                 watch_schema: bool = False):
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {sorted(PERIODS)}")
+        if len(columns) != len(types) or columns[0] != "ts":
+            raise ValueError("columns and types must line up and start with ts")
+        self.db = db
+        self.base = base
+        self.columns = columns
+        self.types = types
+        self.period = period
+        self.seconds = PERIODS[period]
+        self._offset = WEEK_OFFSET if period == "week" else 0
+        self.watch_schema = watch_schema
+        self._schema_version = None
+
+        self._known = None  # period_start -> table name, loaded from sqlite_master on first use
+        self._lock = threading.Lock()
+
+    def period_start(self, ts: float) -> int:
+        return int((ts - self._offset) // self.seconds) * self.seconds + self._offset
+
+    def table_name(self, period_start: int) -> str:
+        return f"{self.base}_p{time.strftime('%Y%m%d', time.gmtime(period_start))}"
+
+    def partitions(self) -> list[tuple[int, str]]:
+        known = self._partitions()
+        with self._lock:
+            return sorted(known.items())
+
+    def insert(self, rows: list[tuple]) -> list[int]:
+        """Insert rows (usually all in one partition), returns the period starts of partitions created."""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.period_start(row[0]), []).append(row)
+
+        created = []
+        placeholders = ", ".join("?" for _ in self.columns)
+        column_list = ", ".join(self.columns)
+        try:
+            with self.db.transaction():
+                for start, group in groups.items():
+                    if start not in self._partitions():
+                        self._create(start)
+                        created.append(start)
+                    self.db.executemany(
+                        f"INSERT INTO {self.table_name(start)} ({column_list}) VALUES ({placeholders})", group)
+        except Exception:
+            self._forget_known()  # a partition compacted away under us: re-read next time
+            raise
+        return created
+
+    def query(self, start: float, end: float, columns: tuple | None = None) -> list[tuple]:
+        """Only partitions overlapping [start, end) are read; each uses its own ts index."""
+        column_list = ", ".join(columns or self.columns)
+        rows = []
+        for period_start, name in self.partitions():
+            if period_start + self.seconds <= start or period_start >= end:
+                continue
+            try:
+                rows.extend(self.db.fetchall(
+                    f"SELECT {column_list} FROM {name} WHERE ts >= ? AND ts < ? ORDER BY ts", (start, end)))
+            except sqlite3.OperationalError as e:
+                if not (self.watch_schema and "no such table" in str(e)):
+                    raise
+                # the writer archived or expired it since partitions() was read: nothing left here to read
+        return rows
+
+    def drop_before(self, cutoff: float) -> list[str]:
+        """Drop partitions whose whole period lies before cutoff. Returns the dropped table names."""
+        expired = [(start, name) for start, name in self.partitions() if start + self.seconds <= cutoff]
+        if not expired:
+            return []
+        with self.db.transaction():
+            for _, name in expired:
+                self.db.execute(f"DROP TABLE IF EXISTS {name}")  # drops its index too
+        with self._lock:
+            for start, _ in expired:
+                self._known.pop(start, None)
+        return [name for _, name in expired]
+
+    def drop_copied(self, period_start: int, last_rowid: int) -> bool:
+        """
+        Delete the rows up to last_rowid (the ones copied elsewhere, e.g. archived) in one short
+        transaction; drop the table if nothing arrived since. Returns True when it was dropped.
+        """
+        name = self.table_name(period_start)
+        with self.db.transaction():
+            self.db.execute(f"DELETE FROM {name} WHERE rowid <= ?", (last_rowid,))
+            if self.db.fetchone(f"SELECT EXISTS (SELECT 1 FROM {name})")[0]:
+                return False  # late rows: they stay until the next compaction merges them
+            self.db.execute(f"DROP TABLE {name}")
+        with self._lock:
+            if self._known is not None:
+                self._known.pop(period_start, None)
+        return True
+
+    def drop_partition(self, period_start: int) -> None:
+        self.db.execute(f"DROP TABLE IF EXISTS {self.table_name(period_start)}")
+        with self._lock:
+            if self._known is not None:
+                self._known.pop(period_start, None)
+
+    def _partitions(self) -> dict:
+        if self.watch_schema:
+            version = self.db.fetchone("PRAGMA schema_version")[0]  # bumped by every CREATE / DROP
+            if version != self._schema_version:
+                with self._lock:
+                    self._known = None
+                    self._schema_version = version
+        if self._known is None:
+            with self._lock:
+                if self._known is None:
+                    names = self.db.fetchall(
+                        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+                        (f"{self.base}_p[0-9]*",))
+                    known = {}
+                    for (name,) in names:
+                        day = time.strptime(name[len(self.base) + 2:], "%Y%m%d")
+                        known[calendar.timegm(day)] = name
+                    self._known = known
+        return self._known
+
+    def _create(self, period_start: int) -> None:
+        name = self.table_name(period_start)
+        definitions = ", ".join(f"{column} {kind}" for column, kind in zip(self.columns, self.types))
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {name} (id INTEGER PRIMARY KEY, {definitions})")
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_ts ON {name} (ts)")
+        # the CREATE commits with the outermost transaction (a writer group, insert_batches):
+        # if that rolls back, the table is gone again and must not stay in _known
+        self.db.on_rollback(self._forget_known)
+        with self._lock:
+            self._known[period_start] = name
+
+    def _forget_known(self) -> None:
+        with self._lock:
+            self._known = None
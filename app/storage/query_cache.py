@@ -0,0 +1,143 @@
+#  Purpose:
+#    In-process cache for dashboard read queries. Browser tabs and kiosk displays ask for
+#    the same "last 24 h" history again and again; a cached answer costs a dict lookup
+#    instead of a rollup or raw-partition scan. Each entry remembers which sensors and which
+#    time range it was computed from, so an ingest only invalidates the entries whose range
+#    covers the new readings, not the whole cache.
+#
+#    Consistency: ReadingStore invalidates after the write committed. A query that was
+#    already running when a write to one of its sensors committed still answers, but its
+#    result isn't cached (per-sensor versions are compared before storing), so a cached
+#    entry never predates a committed write in this process. Writes made by other processes
+#    (other workers behind a storage writer) aren't seen: ttl bounds how stale an entry gets.
+#
+#  Key Attributes:
+#    - max_bytes: memory cap, least recently used entries are evicted above it (sizes are estimates)
+#    - ttl: seconds an entry is served at most
+#    - stats: hits / misses / evictions / invalidations (see stats())
+#
+#  Main Methods:
+#    - get_or_compute(key, sensors, start, end, compute): cached value for key, else compute() and cache it
+#    - invalidate(sensor, first_ts, last_ts): drop the entries for sensor whose range contains new readings
+#    - clear(): drop everything
+#    - align(ts): round a "now" up to the bucket grid, so queries ending "now" share a key for bucket_seconds
+#
+#  Example:
+#      cache = QueryCache(max_bytes=32 * 2**20, ttl=30)
+#      cache.get_or_compute(("history", "dht22", "temperature", start, end, 500), ("dht22",), start, end,
+#                           lambda: rollups.query("dht22", "temperature", start, end, 500))
+#      cache.invalidate("dht22", 1717000000.0, 1717000001.0)
+#
+#  Sources:
+#    - https://docs.python.org/3/library/collections.html#collections.OrderedDict
+#    - https://developer.mozilla.org/en-US/docs/Web/HTTP/Caching#validation
+
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_size(value) -> int:
+    """Rough bytes held by a query result: NumPy buffers, containers and their scalars."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class CacheEntry:
+    __slots__ = ("value", "sensors", "start", "end", "expires", "size")
+
+    def __init__(self, value, sensors: tuple, start: float, end: float, expires: float, size: int):
+        self.value = value
+        self.sensors = sensors
+        self.start = start
+        self.end = end
+        self.expires = expires
+        self.size = size
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int = 32 * 2 ** 20, ttl: float = 30.0, bucket_seconds: float = 60.0):
+        if max_bytes <= 0 or ttl <= 0 or bucket_seconds <= 0:
+            raise ValueError("max_bytes, ttl and bucket_seconds must be > 0.")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bucket_seconds = bucket_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self._bytes = 0
+        self._versions = {}  # sensor -> writes committed so far
+        self._lock = threading.Lock()
+
+    def align(self, ts: float) -> float:
+        return math.ceil(ts / self.bucket_seconds) * self.bucket_seconds
+
+    def get_or_compute(self, key: tuple, sensors: tuple, start: float, end: float, compute):
+        """
+        The value cached under key, or compute()'s. [start, end) is the time range the value
+        was computed from; sensors the data it read. Returned values are shared, treat them as read-only.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            versions = tuple(self._versions.get(sensor, 0) for sensor in sensors)
+
+        value = compute()  # outside the lock: concurrent misses run in parallel (and may compute twice)
+        size = estimate_size(value)
+        with self._lock:
+            if size > self.max_bytes or versions != tuple(self._versions.get(sensor, 0) for sensor in sensors):
+                return value  # too big, or written to while computing: answer but don't keep
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(value, sensors, start, end, now + self.ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def invalidate(self, sensor: str, first_ts: float, last_ts: float) -> int:
+        """Drop sensor's entries whose [start, end) contains a reading from first_ts..last_ts. Returns how many."""
+        with self._lock:
+            self._versions[sensor] = self._versions.get(sensor, 0) + 1
+            stale = [key for key, entry in self._entries.items()
+                     if sensor in entry.sensors and entry.start <= last_ts and first_ts < entry.end]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            for sensor in self._versions:
+                self._versions[sensor] += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+    def _remove(self, key) -> None:
+        self._bytes -= self._entries.pop(key).size
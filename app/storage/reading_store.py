@@ -0,0 +1,396 @@
+#  Purpose:
+#    Sensor-aware persistence on top of SqliteDB. Owns the reading tables
+#    (DHT22, ENS160) and writes whole batches of parsed readings at once.
+#    Every insert also updates the 1-minute/1-hour/1-day rollups in the same transaction.
+#    With partition="day"/"week" the raw rows go to per-period tables (see partitions.py)
+#    and retention drops whole partitions. With an archive, closed partitions are compacted
+#    into memory-mapped column files (see archive.py) and readings() merges both tiers.
+#    Readings with a sequence number also claim a row in ingest_seqs, whose primary key
+#    (ts, device, sensor, seq) is the on-disk backstop against storing a retransmit twice.
+#    With a QueryCache, history() and resample() answers are cached and every committed
+#    insert, dropped or archived partition invalidates the cached ranges it touches (see query_cache.py).
+#
+#  Key Attributes:
+#    - db (SqliteDB): underlying database wrapper
+#    - rollups (RollupStore | None): pre-aggregated history, None when built with rollups=False
+#    - partitions (dict | None): sensor -> PartitionedTable, None for the single-table layout
+#    - retention_days (float | None): partitions older than this are dropped by prune() / maintain()
+#    - archive (ColumnarArchive | None): cold tier that maintain() moves closed partitions into
+#    - archive_after_days (float): how long a partition stays in SQLite after its period closed
+#    - dedup_days (float): how long stored sequence numbers are remembered (pruned by prune())
+#    - cache (QueryCache | None): cache for history() / resample(), None to always query
+#
+#  Main Methods:
+#    - create_tables(): create the reading tables if they don't exist
+#    - insert_dht22(rows): bulk insert (ts, temperature, humidity, average, status) tuples
+#    - insert_ens160(rows): bulk insert (ts, eco2, tvoc, aqi, status) tuples
+#    - insert_batches({sensor: rows}): several sensors' rows in one transaction (WriteBuffer flushes)
+#    - insert_sequenced(sensor, rows, device, seqs): insert the rows not stored before, returns their positions
+#    - readings(sensor, start, end): raw rows in [start, end), only touching overlapping partitions
+#    - columns(sensor, fields, start, end): the same range as float64 NumPy columns (bulk read, both tiers)
+#    - resample(series, start, end, step, how, fill, max_gap): "sensor.field" series on one regular grid
+#    - prune(now): apply retention_days (DROP TABLE per expired partition, rmtree per archived one,
+#                  expired rollup buckets) and dedup_days (old sequence numbers)
+#    - compact(now): move closed partitions into the archive (its own transactions, never inside an ingest)
+#    - migrate_unpartitioned(): move rows of a pre-partitioning database into partitions (once)
+#    - maintain(now): migrate, compact() then prune(), on the server clock; run periodically by StoreMaintenance
+#    - history(sensor, field, start, end, max_points): chart-ready buckets from the rollups
+#
+#  Example:
+#      store = ReadingStore(SqliteDB(db_path="app/data/localedge.db"))
+#      store.create_tables()
+#      store.insert_dht22([(1717000000.0, 22.5, 60.0, 41.2, "OK")])
+#
+#      store = ReadingStore(db, partition="day", retention_days=90,
+#                           archive=ColumnarArchive("app/data/archive"), archive_after_days=1)
+#      store = ReadingStore(db, **store_layout("app/data/localedge.db", config.get("RETENTION_DAYS")))
+
+import os
+import time
+
+import numpy as np
+
+from storage.archive import ColumnarArchive
+from storage.partitions import PartitionedTable
+from storage.query_cache import QueryCache
+from storage.resample import resample as resample_columns
+from storage.rollups import RollupStore
+from storage.sqlite_db import SqliteDB
+
+
+DHT22_TABLE = "dht22_readings"
+ENS160_TABLE = "ens160_readings"
+
+# Column order here is the tuple order every insert_* method expects
+DHT22_COLUMNS = ("ts", "temperature", "humidity", "average", "status")
+ENS160_COLUMNS = ("ts", "eco2", "tvoc", "aqi", "status")
+DHT22_TYPES = ("REAL NOT NULL", "REAL", "REAL", "REAL", "TEXT")
+ENS160_TYPES = ("REAL NOT NULL", "REAL", "REAL", "REAL", "TEXT")
+
+SEQS_TABLE = "ingest_seqs"
+SEQS_PER_STATEMENT = 200  # 4 parameters each, well below SQLite's 999 variable limit
+DEFAULT_RETENTION_DAYS = 90
+
+
+def store_layout(db_path: str, retention_days: float | str | None = None) -> dict:
+    """
+    ReadingStore keyword arguments for the deployed database at db_path: day partitions,
+    retention_days (RETENTION_DAYS, 90 when unset) and the column archive next to the database.
+    The Flask workers and the storage writer must open the store with the same layout.
+    """
+    return dict(partition="day", retention_days=float(retention_days or DEFAULT_RETENTION_DAYS),
+                archive=ColumnarArchive(os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")))
+
+
+class ReadingStore:
+    def __init__(self, db: SqliteDB, rollups: bool = True, partition: str | None = None,
+                 retention_days: float | None = None, archive: ColumnarArchive | None = None,
+                 archive_after_days: float = 1, dedup_days: float = 7, watch_schema: bool = False,
+                 cache: QueryCache | None = None):
+        if archive is not None and partition is None:
+            raise ValueError("An archive needs a partitioned store (partition='day' or 'week').")
+        self.db = db
+        self.rollups = RollupStore(db) if rollups else None
+        self.retention_days = retention_days
+        self.archive = archive
+        self.archive_after_days = archive_after_days  # grace for late uploads before a partition is frozen
+        self.dedup_days = dedup_days  # a Pico resending readings older than this would store them again
+        self.cache = cache
+        self.partitions = None
+        if partition is not None:
+            self.partitions = {
+                "dht22": PartitionedTable(db, DHT22_TABLE, DHT22_COLUMNS, DHT22_TYPES, period=partition,
+                                          watch_schema=watch_schema),
+                "ens160": PartitionedTable(db, ENS160_TABLE, ENS160_COLUMNS, ENS160_TYPES, period=partition,
+                                           watch_schema=watch_schema),
+            }
+        self._tables = {"dht22": (DHT22_TABLE, DHT22_COLUMNS), "ens160": (ENS160_TABLE, ENS160_COLUMNS)}
+        self._tables_ready = False
+
+    def create_tables(self) -> None:
+        if self.rollups is not None:
+            self.rollups.create_tables()
+        # ts first: lookups are by the whole key, pruning is a range delete on ts
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SEQS_TABLE} (
+                ts REAL NOT NULL,
+                device TEXT NOT NULL,
+                sensor TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (ts, device, sensor, seq)
+            ) WITHOUT ROWID""")
+        if self.partitions is not None:
+            self._tables_ready = True  # partitions are created by their first insert
+            return
+
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {DHT22_TABLE} (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                temperature REAL,
+                humidity REAL,
+                average REAL,
+                status TEXT
+            )""")
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ENS160_TABLE} (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                eco2 REAL,
+                tvoc REAL,
+                aqi REAL,
+                status TEXT
+            )""")
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_{DHT22_TABLE}_ts ON {DHT22_TABLE} (ts)")
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_{ENS160_TABLE}_ts ON {ENS160_TABLE} (ts)")
+        self._tables_ready = True
+
+    def insert_dht22(self, rows: list[tuple]) -> int:
+        return self._insert_many("dht22", rows)
+
+    def insert_ens160(self, rows: list[tuple]) -> int:
+        return self._insert_many("ens160", rows)
+
+    def insert_batches(self, batches: dict[str, list[tuple]]) -> int:
+        with self.db.transaction():
+            count = sum(self._insert_many(sensor, rows) for sensor, rows in batches.items())
+        for sensor, rows in batches.items():
+            self._invalidate(sensor, rows)  # again, now that the outer transaction committed
+        return count
+
+    def insert_sequenced(self, sensor: str, rows: list[tuple], device: str, seqs: list[int]) -> list[int]:
+        """
+        Insert only the rows whose (ts, device, seq) hasn't been stored before, in one transaction
+        with their claim in ingest_seqs. Returns the positions of the rows that were stored.
+        """
+        if not rows:
+            return []
+        if not self._tables_ready:
+            self.create_tables()
+        with self.db.transaction():
+            claimed = {}
+            for i in range(0, len(rows), SEQS_PER_STATEMENT):
+                chunk = range(i, min(i + SEQS_PER_STATEMENT, len(rows)))
+                params = [value for j in chunk for value in (rows[j][0], device, sensor, seqs[j])]
+                # RETURNING only yields the rows the OR IGNORE actually inserted
+                for ts, seq in self.db.fetchall(
+                        f"INSERT OR IGNORE INTO {SEQS_TABLE} (ts, device, sensor, seq) VALUES "
+                        f"{', '.join('(?, ?, ?, ?)' for _ in chunk)} RETURNING ts, seq", tuple(params)):
+                    claimed[(ts, seq)] = claimed.get((ts, seq), 0) + 1
+            fresh = []
+            for i, (row, seq) in enumerate(zip(rows, seqs)):
+                if claimed.get((row[0], seq)):
+                    claimed[(row[0], seq)] -= 1  # the same reading twice in one upload is stored once
+                    fresh.append(i)
+            self._insert_many(sensor, [rows[i] for i in fresh])
+        self._invalidate(sensor, [rows[i] for i in fresh])
+        return fresh
+
+    def readings(self, sensor: str, start: float, end: float) -> list[tuple]:
+        """Raw (ts, v1, v2, v3, status) rows with start <= ts < end, oldest first, from both tiers."""
+        if self.partitions is not None:
+            table = self.partitions[sensor]
+            hot = table.query(start, end)
+            if self.archive is None:
+                return hot
+            cold = self.archive.rows(sensor, start, end, period_seconds=table.seconds)
+            if cold and hot and hot[0][0] < cold[-1][0]:
+                return sorted(cold + hot, key=lambda row: row[0])  # late upload into an archived period
+            return cold + hot
+        if not self._tables_ready:
+            self.create_tables()
+        table, columns = self._tables[sensor]
+        return self.db.fetchall(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE ts >= ? AND ts < ? ORDER BY ts", (start, end))
+
+    def columns(self, sensor: str, fields: tuple[str, ...], start: float, end: float) -> dict[str, np.ndarray]:
+        """
+        {"timestamp", *fields} float64 arrays for start <= ts < end, oldest first. One SELECT per
+        overlapping partition straight into an array (NULL -> NaN), archived periods come from
+        their memory maps; no per-reading Python objects beyond what sqlite3 returns.
+        """
+        names = self._tables[sensor][1]
+        unknown = [field for field in fields if field not in names[1:-1]]
+        if unknown:
+            raise ValueError(f"{sensor} has no field {', '.join(unknown)}")
+        selected = ("ts",) + tuple(fields)
+        if self.partitions is not None:
+            table = self.partitions[sensor]
+            hot = table.query(start, end, columns=selected)
+        else:
+            if not self._tables_ready:
+                self.create_tables()
+            hot = self.db.fetchall(f"SELECT {', '.join(selected)} FROM {self._tables[sensor][0]} "
+                                   "WHERE ts >= ? AND ts < ? ORDER BY ts", (start, end))
+        matrix = np.array(hot, dtype=np.float64).reshape(-1, len(selected))
+        result = {"timestamp": matrix[:, 0], **{field: matrix[:, i] for i, field in enumerate(fields, start=1)}}
+
+        if self.archive is not None:
+            cold = self.archive.query(sensor, start, end, period_seconds=self.partitions[sensor].seconds)
+            if len(cold["timestamp"]):
+                result = {name: np.concatenate([cold[name].astype(np.float64), values])
+                          for name, values in result.items()}
+                if np.any(np.diff(result["timestamp"]) < 0):  # late upload into an archived period
+                    order = np.argsort(result["timestamp"], kind="stable")
+                    result = {name: values[order] for name, values in result.items()}
+        return result
+
+    def resample(self, series: list[str], start: float, end: float, step: float, how: str = "mean",
+                 fill: str = "none", max_gap: float | None = None) -> dict[str, np.ndarray]:
+        """
+        "sensor.field" series aggregated onto one grid (see resample.py), one bulk read per sensor.
+        Returns {"timestamp": grid, "dht22.temperature": values, ...}, NaN where there is no value.
+        """
+        wanted = {}
+        for name in series:
+            sensor, _, field = name.partition(".")
+            if sensor not in self._tables or not field:
+                raise ValueError(f"series must look like dht22.temperature, got {name!r}")
+            wanted.setdefault(sensor, []).append(field)
+
+        def compute() -> dict[str, np.ndarray]:
+            columns = {}
+            for sensor, fields in wanted.items():
+                data = self.columns(sensor, tuple(dict.fromkeys(fields)), start, end)
+                for field in fields:
+                    columns[f"{sensor}.{field}"] = (data["timestamp"], data[field])
+            return resample_columns(columns, start, end, step, how, fill, max_gap)
+
+        if self.cache is None:
+            return compute()
+        key = ("resample", tuple(series), start, end, step, how, fill, max_gap)
+        return self.cache.get_or_compute(key, tuple(wanted), start, end, compute)
+
+    def maintain(self, now: float | None = None) -> dict:
+        """
+        Periodic upkeep (see storage/maintenance.py): move rows left in the single-table layout
+        into partitions, compact closed partitions, then apply retention.
+        """
+        return {"migrated": self.migrate_unpartitioned(), "compacted": self.compact(now), "pruned": self.prune(now)}
+
+    def migrate_unpartitioned(self, chunk_size: int = 10000) -> int:
+        """
+        Move the rows of dht22_readings / ens160_readings (a database from before partition="day")
+        into their partitions, so readings(), columns() and compaction see them, then drop the old
+        tables. Chunk by chunk in id order, each chunk moved in one transaction, so a crash never
+        loses or duplicates a row. Their rollups already exist: only the raw rows move. Returns rows moved.
+        """
+        if self.partitions is None:
+            return 0
+        moved = 0
+        for sensor, table in self.partitions.items():
+            legacy, columns = self._tables[sensor]
+            if not self.db.fetchone("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?)",
+                                    (legacy,))[0]:
+                continue
+            while True:
+                with self.db.transaction():
+                    chunk = self.db.fetchall(f"SELECT id, {', '.join(columns)} FROM {legacy} ORDER BY id LIMIT ?",
+                                             (chunk_size,))
+                    if not chunk:
+                        self.db.execute(f"DROP TABLE {legacy}")  # drops its ts index too
+                        break
+                    table.insert([row[1:] for row in chunk])
+                    self.db.execute(f"DELETE FROM {legacy} WHERE id <= ?", (chunk[-1][0],))
+                moved += len(chunk)
+                self._invalidate(sensor, [row[1:] for row in chunk])
+        return moved
+
+    def prune(self, now: float | None = None) -> list[str]:
+        """
+        Drop every partition that lies entirely outside retention_days. Cost depends on the
+        number of partitions dropped, not on how many rows they hold. Returns the dropped tables.
+        Rollup buckets that end before the cutoff are deleted too, or they would grow forever.
+        Sequence numbers older than dedup_days are forgotten as well. `now` is the server clock
+        (tests pass their own), never a reading's timestamp.
+        """
+        now = time.time() if now is None else now
+        if self.dedup_days is not None and self._tables_ready:
+            self.db.execute(f"DELETE FROM {SEQS_TABLE} WHERE ts < ?", (now - self.dedup_days * 86400,))
+        if self.retention_days is None or self.partitions is None:
+            return []
+        cutoff = now - self.retention_days * 86400
+        dropped = []
+        for table in self.partitions.values():
+            dropped.extend(table.drop_before(cutoff))
+        if self.archive is not None:
+            dropped.extend(self.archive.drop_before(cutoff, next(iter(self.partitions.values())).seconds))
+        expired_buckets = self.rollups.drop_before(cutoff) if self.rollups is not None else 0
+        if (dropped or expired_buckets) and self.cache is not None:
+            for sensor in self.partitions:
+                self.cache.invalidate(sensor, float("-inf"), cutoff)  # cached answers still hold the dropped rows
+        return dropped
+
+    def compact(self, now: float | None = None) -> list[str]:
+        """
+        Move every partition that closed more than archive_after_days ago (server clock) into
+        the archive: write its column files, then delete the copied rows and drop the table in
+        a short transaction of its own. Must not run inside another transaction: the archive
+        can't roll back. Rows that arrive while a partition is being copied stay in SQLite
+        until the next run. A period that is already archived (late upload, or a crash between
+        the two steps) is merged, keeping one reading per millisecond. Returns the compacted table names.
+        """
+        if self.archive is None:
+            return []
+        cutoff = (time.time() if now is None else now) - self.archive_after_days * 86400
+        compacted = []
+        for sensor, table in self.partitions.items():
+            archived = set(self.archive.periods(sensor))
+            for period_start, name in table.partitions():
+                if period_start + table.seconds > cutoff:
+                    continue
+                rows = self.db.fetchall(f"SELECT rowid, {', '.join(table.columns)} FROM {name} ORDER BY rowid")
+                last_rowid = rows[-1][0] if rows else 0
+                rows = [row[1:] for row in rows]
+                if period_start in archived:
+                    merged = {round(row[0] * 1000): row
+                              for row in self.archive.rows(sensor, period_start, period_start + table.seconds,
+                                                           period_seconds=table.seconds)}
+                    merged.update((round(row[0] * 1000), row) for row in rows)
+                    rows = list(merged.values())
+                self.archive.write_partition(sensor, period_start, rows)  # fsynced before any row is deleted
+                if table.drop_copied(period_start, last_rowid):
+                    compacted.append(name)
+                if self.cache is not None:
+                    # merged with an older archive copy: the period may answer differently now
+                    self.cache.invalidate(sensor, period_start, period_start + table.seconds)
+        return compacted
+
+    def history(self, sensor: str, field: str, start: float, end: float, max_points: int = 500) -> dict:
+        if self.rollups is None:
+            raise RuntimeError("ReadingStore was created with rollups=False.")
+        if self.cache is None:
+            return self.rollups.query(sensor, field, start, end, max_points)
+        # the first bucket starts before `start`: readings landing in it change the answer too
+        resolution = self.rollups.pick_resolution(start, end, max_points)
+        return self.cache.get_or_compute(("history", sensor, field, start, end, max_points), (sensor,),
+                                         start // resolution * resolution, end,
+                                         lambda: self.rollups.query(sensor, field, start, end, max_points))
+
+    def _insert_many(self, sensor: str, rows: list[tuple]) -> int:
+        if not rows:
+            return 0
+        if not self._tables_ready:
+            self.create_tables()
+
+        # one transaction == one fsync for the raw rows and their rollups (joins the caller's transaction if any)
+        with self.db.transaction():
+            if self.partitions is not None:
+                # compaction and retention run on the server clock from maintain(), never from reading timestamps
+                self.partitions[sensor].insert(rows)
+                count = len(rows)
+            else:
+                table, columns = self._tables[sensor]
+                placeholders = ", ".join("?" for _ in columns)
+                query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+                count = self.db.executemany(query, rows)
+            if self.rollups is not None:
+                self.rollups.add(sensor, rows)
+        self._invalidate(sensor, rows)
+        return count
+
+    def _invalidate(self, sensor: str, rows: list[tuple]) -> None:
+        # after the commit: a query that read the old rows can't be cached any more (see QueryCache)
+        if self.cache is not None and rows:
+            timestamps = [row[0] for row in rows]
+            self.cache.invalidate(sensor, min(timestamps), max(timestamps))
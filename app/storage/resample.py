@@ -0,0 +1,113 @@
+#  Purpose:
+#    Put irregular readings onto a regular time grid, for charts and exports that need
+#    DHT22 and ENS160 side by side. Every series is aggregated per grid step, empty steps
+#    (a Pico off Wi-Fi) are optionally filled, and all series share the same grid, so
+#    joining sensors is just putting their columns next to each other. Everything runs on
+#    whole NumPy arrays (searchsorted / reduceat / accumulate), nothing loops per reading.
+#
+#  Key Attributes:
+#    - AGGREGATIONS: how the readings inside one step are combined (mean, min, max, last)
+#    - FILLS: what happens to steps without readings (none, ffill, linear)
+#
+#  Main Methods:
+#    - grid(start, end, step): the step start times covering [start, end)
+#    - aggregate(timestamps, values, start, step, points, how): one value per step, NaN where empty
+#    - fill_gaps(values, how, max_gap_steps): forward-fill or interpolate the NaN steps
+#    - resample(columns, start, end, step, how, fill, max_gap): the above for several series at once
+#
+#  Example:
+#      columns = {"dht22.temperature": (ts, temperature), "ens160.eco2": (ts2, eco2)}
+#      resample(columns, 1717000000, 1717003600, step=60, how="mean", fill="linear", max_gap=300)
+#      # -> {"timestamp": array([1717000000., 1717000060., ...]), "dht22.temperature": array([...]), ...}
+#
+#  Sources:
+#    - https://numpy.org/doc/stable/reference/generated/numpy.ufunc.reduceat.html
+#    - https://numpy.org/doc/stable/reference/generated/numpy.interp.html
+
+import numpy as np
+
+AGGREGATIONS = ("mean", "min", "max", "last")
+FILLS = ("none", "ffill", "linear")
+
+
+def grid(start: float, end: float, step: float) -> np.ndarray:
+    if step <= 0 or end <= start:
+        raise ValueError("step must be > 0 and start before end")
+    return start + np.arange(int(np.ceil((end - start) / step))) * step
+
+
+def aggregate(timestamps: np.ndarray, values: np.ndarray, start: float, step: float, points: int,
+              how: str = "mean") -> np.ndarray:
+    """One value per step (NaN for steps without readings). Readings with a NaN value are ignored."""
+    if how not in AGGREGATIONS:
+        raise ValueError(f"aggregation must be one of {', '.join(AGGREGATIONS)}")
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind="stable")  # "last" needs time order
+        timestamps, values = timestamps[order], values[order]
+
+    steps = np.floor((timestamps - start) / step).astype(np.int64)
+    keep = (steps >= 0) & (steps < points) & ~np.isnan(values)
+    steps, values = steps[keep], values[keep]
+
+    result = np.full(points, np.nan)
+    if not len(steps):
+        return result
+    # steps is sorted: each run of equal step numbers is one segment to reduce
+    firsts = np.flatnonzero(np.r_[True, steps[1:] != steps[:-1]])
+    occupied = steps[firsts]
+    if how == "mean":
+        result[occupied] = np.add.reduceat(values, firsts) / np.diff(np.r_[firsts, len(values)])
+    elif how == "min":
+        result[occupied] = np.minimum.reduceat(values, firsts)
+    elif how == "max":
+        result[occupied] = np.maximum.reduceat(values, firsts)
+    else:
+        result[occupied] = values[np.r_[firsts[1:], len(values)] - 1]
+    return result
+
+
+def fill_gaps(values: np.ndarray, how: str = "none", max_gap_steps: float | None = None) -> np.ndarray:
+    """
+    ffill: carry the last value forward for at most max_gap_steps steps.
+    linear: interpolate between the values on both sides of a gap when they are at most
+    max_gap_steps apart (never extrapolates past the first / last value).
+    """
+    if how not in FILLS:
+        raise ValueError(f"fill must be one of {', '.join(FILLS)}")
+    missing = np.isnan(values)
+    if how == "none" or not missing.any() or missing.all():
+        return values
+    limit = np.inf if max_gap_steps is None else max_gap_steps
+    positions = np.arange(len(values))
+    known = np.flatnonzero(~missing)
+
+    # index of the last known step at or before each step (-1 before the first one)
+    previous = np.maximum.accumulate(np.where(missing, -1, positions))
+    if how == "ffill":
+        usable = missing & (previous >= 0) & (positions - previous <= limit)
+        filled = values.copy()
+        filled[usable] = values[previous[usable]]
+        return filled
+
+    # index of the first known step at or after each step (len(values) past the last one)
+    following = np.minimum.accumulate(np.where(missing, len(values), positions)[::-1])[::-1]
+    usable = missing & (previous >= 0) & (following < len(values)) & (following - previous <= limit)
+    filled = values.copy()
+    filled[usable] = np.interp(positions[usable], known, values[known])
+    return filled
+
+
+def resample(columns: dict[str, tuple[np.ndarray, np.ndarray]], start: float, end: float, step: float,
+             how: str = "mean", fill: str = "none", max_gap: float | None = None) -> dict[str, np.ndarray]:
+    """
+    columns: name -> (timestamps, values). Returns {"timestamp": grid, name: values, ...};
+    max_gap is in seconds, None fills gaps of any length.
+    """
+    timeline = grid(start, end, step)
+    max_gap_steps = None if max_gap is None else max_gap / step
+    result = {"timestamp": timeline}
+    for name, (timestamps, values) in columns.items():
+        result[name] = fill_gaps(aggregate(timestamps, values, start, step, len(timeline), how), fill, max_gap_steps)
+    return result
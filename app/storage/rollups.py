@@ -0,0 +1,187 @@
+#  Purpose:
+#    Pre-aggregated history for the dashboard charts. Every reading written through
+#    ReadingStore is folded into 1-minute, 1-hour and 1-day buckets (min/max/sum/count/last
+#    per sensor field) in the same transaction, so a history query reads at most
+#    `max_points` rows by primary key instead of GROUP BY-ing months of raw readings.
+#
+#  Key Attributes:
+#    - RESOLUTIONS: bucket widths in seconds, finest first
+#    - ROLLUP_FIELDS: which columns of each sensor are rolled up
+#
+#  Main Methods:
+#    - create_tables(): create the rollup table if it doesn't exist
+#    - add(sensor, rows): fold (ts, v1, v2, v3, status) rows into every resolution (one upsert per bucket)
+#    - query(sensor, field, start, end, max_points): buckets at the finest resolution that fits the budget
+#    - pick_resolution(start, end, max_points): the resolution query() would use
+#    - rebuild(sensor, raw_table): recompute a sensor's rollups from its raw table (one-off migration)
+#    - drop_before(cutoff): delete the buckets that end at or before cutoff (retention)
+#
+#  Example:
+#      rollups = RollupStore(db)
+#      rollups.add("dht22", [(1717000000.0, 22.5, 60.0, 41.2, "OK")])
+#      rollups.query("dht22", "temperature", 1716900000, 1717000060, max_points=500)
+#      # -> {"resolution": 60, "ts": [...], "min": [...], "max": [...], "mean": [...], "count": [...], "last": [...]}
+#
+#   Sources:
+#       - https://sqlite.org/lang_upsert.html
+#       - https://sqlite.org/withoutrowid.html
+
+from storage.sqlite_db import SqliteDB
+
+
+ROLLUP_TABLE = "reading_rollups"
+
+RESOLUTIONS = (60, 3600, 86400)  # 1 minute, 1 hour, 1 day
+
+ROLLUP_FIELDS = {
+    "dht22": ("temperature", "humidity", "average"),
+    "ens160": ("eco2", "tvoc", "aqi"),
+}
+
+# "last" follows the newest timestamp, so late or out-of-order batches can't overwrite it
+UPSERT = f"""
+    INSERT INTO {ROLLUP_TABLE} (sensor, field, resolution, bucket, min, max, sum, count, last, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (sensor, field, resolution, bucket) DO UPDATE SET
+        min = MIN(min, excluded.min),
+        max = MAX(max, excluded.max),
+        sum = sum + excluded.sum,
+        count = count + excluded.count,
+        last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last ELSE last END,
+        last_ts = MAX(last_ts, excluded.last_ts)"""
+
+
+class RollupStore:
+    def __init__(self, db: SqliteDB):
+        self.db = db
+        self._tables_ready = False
+
+    def create_tables(self) -> None:
+        # WITHOUT ROWID: rows are stored in primary key order, a range query is one b-tree walk
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                sensor TEXT NOT NULL,
+                field TEXT NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                sum REAL NOT NULL,
+                count INTEGER NOT NULL,
+                last REAL NOT NULL,
+                last_ts REAL NOT NULL,
+                PRIMARY KEY (sensor, field, resolution, bucket)
+            ) WITHOUT ROWID""")
+        self._tables_ready = True
+
+    def add(self, sensor: str, rows: list[tuple]) -> int:
+        """
+        Fold a batch of (ts, v1, v2, v3, status) rows into every resolution. The batch is
+        pre-aggregated here, so the database sees one upsert per touched bucket, not per reading.
+        Returns the number of upserts.
+        """
+        if not rows:
+            return 0
+        if not self._tables_ready:
+            self.create_tables()
+
+        fields = ROLLUP_FIELDS[sensor]
+        buckets = {}  # (field, resolution, bucket) -> [min, max, sum, count, last, last_ts]
+        for row in rows:
+            ts = row[0]
+            for resolution in RESOLUTIONS:
+                bucket = int(ts // resolution) * resolution
+                for field, value in zip(fields, row[1:4]):
+                    if value is None:
+                        continue
+                    agg = buckets.get((field, resolution, bucket))
+                    if agg is None:
+                        buckets[(field, resolution, bucket)] = [value, value, value, 1, value, ts]
+                        continue
+                    if value < agg[0]:
+                        agg[0] = value
+                    if value > agg[1]:
+                        agg[1] = value
+                    agg[2] += value
+                    agg[3] += 1
+                    if ts >= agg[5]:
+                        agg[4], agg[5] = value, ts
+
+        params = [(sensor, field, resolution, bucket, *agg) for (field, resolution, bucket), agg in buckets.items()]
+        self.db.executemany(UPSERT, params)
+        return len(params)
+
+    @staticmethod
+    def pick_resolution(start: float, end: float, max_points: int) -> int:
+        """Finest resolution whose bucket count over [start, end) fits max_points (1 day if none does)."""
+        span = max(end - start, 0)
+        for resolution in RESOLUTIONS:
+            if span / resolution <= max_points:
+                return resolution
+        return RESOLUTIONS[-1]
+
+    def query(self, sensor: str, field: str, start: float, end: float, max_points: int = 500,
+              resolution: int | None = None) -> dict:
+        if field not in ROLLUP_FIELDS.get(sensor, ()):
+            raise ValueError(f"No rollups for {sensor}.{field}")
+        if resolution is None:
+            resolution = self.pick_resolution(start, end, max_points)
+        elif resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {RESOLUTIONS}")
+        if not self._tables_ready:
+            self.create_tables()
+
+        first_bucket = int(start // resolution) * resolution  # include the bucket `start` falls in
+        rows = self.db.fetchall(
+            f"SELECT bucket, min, max, sum, count, last FROM {ROLLUP_TABLE} "
+            "WHERE sensor = ? AND field = ? AND resolution = ? AND bucket >= ? AND bucket < ? "
+            "ORDER BY bucket",
+            (sensor, field, resolution, first_bucket, end))
+
+        result = {"resolution": resolution, "ts": [], "min": [], "max": [], "mean": [], "count": [], "last": []}
+        for bucket, lo, hi, total, count, last in rows:
+            result["ts"].append(bucket)
+            result["min"].append(lo)
+            result["max"].append(hi)
+            result["mean"].append(total / count)
+            result["count"].append(count)
+            result["last"].append(last)
+        return result
+
+    def drop_before(self, cutoff: float) -> int:
+        """Delete every bucket that ends at or before cutoff. Returns how many were deleted."""
+        if not self._tables_ready:
+            self.create_tables()
+        deleted = 0
+        with self.db.transaction():
+            # one primary-key range per (sensor, field, resolution) instead of a full table scan
+            for sensor, fields in ROLLUP_FIELDS.items():
+                for field in fields:
+                    for resolution in RESOLUTIONS:
+                        deleted += self.db.executemany(
+                            f"DELETE FROM {ROLLUP_TABLE} WHERE sensor = ? AND field = ? AND resolution = ? "
+                            "AND bucket <= ?", [(sensor, field, resolution, cutoff - resolution)])
+        return deleted
+
+    def rebuild(self, sensor: str, raw_table: str, chunk_size: int = 10000) -> int:
+        """
+        Drop and recompute a sensor's rollups from its raw table, e.g. for a database that
+        predates rollups. Streams the raw rows chunk by chunk in id order. Returns rows folded.
+        """
+        if not self._tables_ready:
+            self.create_tables()
+        columns = ", ".join(("ts",) + ROLLUP_FIELDS[sensor])
+        total = 0
+        last_id = 0
+        with self.db.transaction():
+            self.db.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE sensor = ?", (sensor,))
+            while True:
+                chunk = self.db.fetchall(
+                    f"SELECT id, {columns} FROM {raw_table} WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, chunk_size))
+                if not chunk:
+                    break
+                last_id = chunk[-1][0]
+                self.add(sensor, [row[1:] for row in chunk])
+                total += len(chunk)
+        return total
@@ -4,50 +4,209 @@
 #
 #  Key Attributes:
 #    - db_path (str): Filesystem path to the SQLite database file.
+#    - pooled (bool): Reuse long-lived WAL connections instead of opening one per call.
+#    - pool_size (int): Max number of pooled connections (one per concurrently active thread).
+#    - acquire_timeout (float): Seconds to wait for a pooled connection before giving up.
+#    - synchronous / cache_size / mmap_size: PRAGMA tuning applied to every pooled connection.
+#    - cached_statements (int): Size of sqlite3's per-connection prepared-statement cache.
 #
 #  Main Methods:
 #    - __connect(): Internal method to establish and return a database connection.
 #    - execute(query, params): Execute a write or DDL statement.
+#    - executemany(query, params_seq): Execute a write statement for many rows in one transaction.
 #    - fetchall(query, params): Execute a read query and return all rows.
 #    - fetchone(query, params): Execute a read query and return a single row.
+#    - transaction(): Context manager grouping several writes into a single commit.
+#    - on_rollback(callback): Run callback if the current (outermost) transaction rolls back.
+#    - close(): Close every pooled connection; pooled calls made afterwards raise sqlite3.ProgrammingError.
+#
+#  Example:
+#      db = SqliteDB("app/data/localedge.db", pooled=True, synchronous="NORMAL")
+#      with db.transaction():
+#          db.execute("INSERT INTO t (v) VALUES (?)", (1,))
+#          db.execute("INSERT INTO t (v) VALUES (?)", (2,))
 #
 #   Sources:
 #       - https://docs.python.org/3/library/sqlite3.html
+#       - https://sqlite.org/wal.html
+#       - https://sqlite.org/pragma.html
 
 
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 class SqliteDB:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, pooled: bool = False, pool_size: int = 4,
+                 synchronous: str = "NORMAL", cache_size: int = -8000, mmap_size: int = 0,
+                 cached_statements: int = 256, acquire_timeout: float = 30.0):
         if not db_path:
             raise ValueError("Database path must be specified.")
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
         self.db_path = db_path
 
+        self.pooled = pooled
+        self.pool_size = pool_size
+        self.synchronous = synchronous.upper()
+        self.cache_size = cache_size  # negative = KiB, positive = pages (PRAGMA cache_size semantics)
+        self.mmap_size = mmap_size  # bytes, 0 disables memory-mapped I/O
+        self.cached_statements = cached_statements
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.LifoQueue()  # LIFO keeps the hottest connection (warm page cache) in use
+        self._all_connections = []
+        self._pool_lock = threading.Lock()
+        self._closed = False  # set by close(): connections released afterwards are closed, not pooled
+        self._local = threading.local()  # holds the connection pinned by transaction() on this thread
+
     # Creat local connection mapped to db_path file
     def __connect(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.db_path)
+        if not self.pooled:
+            return sqlite3.connect(self.db_path, cached_statements=self.cached_statements)
+
+        # check_same_thread=False: a pooled connection may serve different threads, but never two at once
+        conn = sqlite3.connect(self.db_path, cached_statements=self.cached_statements, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")  # readers no longer block on the writer (and vice versa)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return conn
+
+    def __acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._pool_lock:
+            if self._closed:  # close() drained the idle queue: answer like a closed sqlite3.Connection
+                raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+            if len(self._all_connections) < self.pool_size:
+                conn = self.__connect()
+                self._all_connections.append(conn)
+                return conn
+
+        # pool exhausted, wait for another thread to hand one back
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"No pooled connection freed up within {self.acquire_timeout}s "
+                f"(all {self.pool_size} are in use; raise pool_size?)") from None
+
+    def __release(self, conn: sqlite3.Connection) -> None:
+        with self._pool_lock:
+            if not self._closed:
+                self._idle.put(conn)
+                return
+            if conn in self._all_connections:
+                self._all_connections.remove(conn)
+        conn.close()  # checked out when close() ran
+
+    @contextmanager
+    def __session(self):
+        """
+        Yields the connection a single call should use and commits (or rolls back) when it's done.
+        Inside transaction() the pinned connection is reused and the commit is left to transaction().
+        """
+        pinned = getattr(self._local, "conn", None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        if not self.pooled:
+            conn = self.__connect()
+            try:
+                with conn:  # commit on success, rollback on error
+                    yield conn
+            finally:
+                conn.close()
+            return
+
+        conn = self.__acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.__release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several execute/executemany calls on one connection and commit them together.
+        Any exception rolls the whole block back. Nested calls join the outer transaction.
+        """
+        if getattr(self._local, "conn", None) is not None:
+            yield self
+            return
+
+        conn = self.__acquire() if self.pooled else self.__connect()
+        self._local.conn = conn
+        self._local.on_rollback = []
+        try:
+            with conn:
+                yield self
+        except BaseException:
+            for callback in self._local.on_rollback:
+                callback()
+            raise
+        finally:
+            self._local.conn = None
+            self._local.on_rollback = []
+            if self.pooled:
+                self.__release(conn)
+            else:
+                conn.close()
+
+    def on_rollback(self, callback) -> None:
+        """
+        Call callback() if the enclosing transaction() rolls back, e.g. to forget a table whose
+        CREATE is undone with it. Outside transaction() a statement commits on its own: no-op.
+        """
+        if getattr(self._local, "conn", None) is not None:
+            self._local.on_rollback.append(callback)
 
     # execute a write query INSERT,UPDATE,DELETE
     def execute(self, query: str, params: tuple | None = None) -> None:
         params = params or ()
         # handle closing and opening automatically
-        with self.__connect() as conn:
+        with self.__session() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
-            conn.commit() # persist changes
+
+    # execute the same write query once per params tuple, all inside a single transaction
+    def executemany(self, query: str, params_seq: list[tuple]) -> int:
+        with self.__session() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(query, params_seq)
+            return cursor.rowcount
 
     def fetchall(self, query: str, params: tuple | None = None) -> list[tuple]:
         params = params or () # to ensure always something iterable to avoid TypeError
                               # This is equivalent to params () if params is None
-        with self.__connect() as conn: # open connection using __connect()
+        with self.__session() as conn: # open connection using __session()
             cursor = conn.cursor()
             cursor.execute(query, params)
             return cursor.fetchall()
 
     def fetchone(self, query: str, params: tuple | None = None) -> tuple | None:
         params = params or ()
-        with self.__connect() as conn:
+        with self.__session() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             return cursor.fetchone()
+
+    def close(self) -> None:
+        with self._pool_lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                self._all_connections.remove(conn)
+                conn.close()
+            # connections still checked out are closed by __release() when their thread is done with them
@@ -0,0 +1,171 @@
+#  Purpose:
+#    Write-behind buffer between SensorPipeline and ReadingStore. Parsed readings are
+#    queued in memory and group-committed: one transaction (one fsync) per flush
+#    instead of one per reading.
+#
+#  Key Attributes:
+#    - store (ReadingStore): destination for flushed rows (or a RemoteStore, see writer_process.py)
+#    - max_batch (int): flush as soon as this many rows are pending
+#    - max_age (float): flush when the oldest pending row is this many seconds old
+#    - max_queue (int): hard bound on pending rows; submit() raises BufferFullError above it
+#    - stats: flush latency / queue depth counters (see stats())
+#
+#  Main Methods:
+#    - submit(kind, row): queue one row for "dht22" or "ens160"
+#    - flush(): write everything pending now, in one transaction
+#    - close(): stop the background flusher and flush what is left
+#    - stats(): snapshot of the counters
+#
+#  Example:
+#      buffer = WriteBuffer(store, max_batch=200, max_age=2.0)
+#      buffer.submit("dht22", (time.time(), 22.5, 60.0, 41.2, "OK"))
+#      ...
+#      buffer.close()
+
+import threading
+import time
+
+from app_logging.log_utils import Logger
+from storage.reading_store import ReadingStore
+
+
+class BufferFullError(RuntimeError):
+    """Raised by WriteBuffer.submit when the disk has fallen behind and the queue is full."""
+
+
+class WriteBuffer:
+    def __init__(self, store: ReadingStore, max_batch: int = 100, max_age: float = 1.0,
+                 max_queue: int = 10000, autostart: bool = True):
+        if max_batch < 1 or max_queue < max_batch:
+            raise ValueError("max_batch must be >= 1 and max_queue must be >= max_batch.")
+        self.store = store
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self.max_queue = max_queue
+        self.logger = Logger().get_logger()
+
+        self._kinds = ("dht22", "ens160")
+        self._pending = {kind: [] for kind in self._kinds}
+        self._depth = 0  # pending + in-flight rows, this is what max_queue bounds
+        self._oldest = None  # monotonic time of the oldest pending row
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # only one flush touches the disk at a time
+        self._closed = False
+
+        # counters
+        self.flush_count = 0
+        self.rows_flushed = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_queue_depth = 0
+
+        self._thread = None
+        if autostart:
+            self._thread = threading.Thread(target=self._run, name="WriteBufferFlusher", daemon=True)
+            self._thread.start()
+
+    def submit(self, kind: str, row: tuple) -> None:
+        if kind not in self._kinds:
+            raise ValueError(f"Unknown sensor kind: {kind}")
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBuffer is closed.")
+            if self._depth >= self.max_queue:
+                self.rejected += 1
+                raise BufferFullError(f"Write buffer full ({self.max_queue} rows pending).")
+
+            self._pending[kind].append(row)
+            self._depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._depth)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._cond.notify()  # flusher was idle, let it start the max_age countdown
+            elif self._pending_count() >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._cond:
+                batch = self._pending
+                self._pending = {kind: [] for kind in self._kinds}
+                self._oldest = None
+            count = sum(len(rows) for rows in batch.values())
+            if not count:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                # one transaction for every sensor (one IPC round trip when the store is a RemoteStore)
+                self.store.insert_batches({kind: rows for kind, rows in batch.items() if rows})
+            except Exception as e:
+                self.failed_flushes += 1
+                self.logger.error(f"WriteBuffer flush of {count} rows failed: {e}", exc_info=True)
+                with self._cond:
+                    # put the rows back in front so the next flush retries them in order
+                    for kind, rows in batch.items():
+                        self._pending[kind][:0] = rows
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                raise
+
+            duration_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self._depth -= count
+                self.flush_count += 1
+                self.rows_flushed += count
+                self.last_flush_ms = duration_ms
+                self.max_flush_ms = max(self.max_flush_ms, duration_ms)
+                self.total_flush_ms += duration_ms
+            return count
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queue_depth": self._depth,
+                "max_queue_depth": self.max_queue_depth,
+                "flush_count": self.flush_count,
+                "rows_flushed": self.rows_flushed,
+                "rejected": self.rejected,
+                "failed_flushes": self.failed_flushes,
+                "last_flush_ms": self.last_flush_ms,
+                "max_flush_ms": self.max_flush_ms,
+                "avg_flush_ms": self.total_flush_ms / self.flush_count if self.flush_count else 0.0,
+            }
+
+    def _pending_count(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending_count() >= self.max_batch:
+                        break
+                    if self._oldest is not None:
+                        remaining = self.max_age - (time.monotonic() - self._oldest)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return  # close() does the final flush on the caller's thread
+
+            try:
+                self.flush()
+            except Exception:
+                time.sleep(min(self.max_age, 1.0))  # already logged, back off before retrying
@@ -0,0 +1,377 @@
+#  Purpose:
+#    Single-writer storage for multi-worker deployments. With several API worker processes
+#    (one per Pi 5 core) each writing through its own SqliteDB they would take turns on the
+#    database write lock and eventually answer "database is locked". Instead one writer
+#    process owns every write: workers hand it parsed readings in batches over a Unix socket
+#    (multiprocessing.connection, length-prefixed pickles, HMAC handshake when an authkey is
+#    set) and keep reading the database directly, WAL lets readers and the one writer overlap.
+#
+#    Requests from all workers are group-committed: the writer thread takes whatever is
+#    queued (up to max_batch requests) and applies it in one transaction. A request is
+#    acknowledged only after that transaction committed, so a worker that got its answer
+#    knows the readings are on disk. If a group fails, its requests are retried one
+#    transaction each, so one bad request can't fail the others. Retention and compaction
+#    (StoreMaintenance) run on the same thread between groups, every maintenance_interval seconds.
+#
+#  Delivery:
+#    At least once. A lost acknowledgement (writer killed mid-request) surfaces as
+#    WriterUnavailableError and the caller retries (WriteBuffer re-queues, the routes answer
+#    503 so the Pico resends); readings with sequence numbers are then stored exactly once
+#    (insert_sequenced), plain ones could be stored twice.
+#
+#  Key Attributes:
+#    - StorageWriter: the server side, owns a ReadingStore and the socket
+#    - RemoteStore: the worker side, a ReadingStore whose writes go to the writer (reads stay local)
+#    - WriterUnavailableError: no writer to talk to or no acknowledgement, safe to retry
+#
+#  Main Methods:
+#    - StorageWriter.start() / serve_forever() / close(drain_seconds)
+#    - RemoteStore.insert_batches / insert_dht22 / insert_ens160 / insert_sequenced: as ReadingStore, via the writer
+#    - RemoteStore.wait_ready(timeout): block until the writer answers (startup ordering)
+#
+#  Startup / shutdown:
+#    Start the writer first; workers also retry connecting for connect_timeout seconds, so the
+#    order only matters for the first requests. Stop the workers first: their WriteBuffers
+#    flush on exit. On SIGTERM the writer stops accepting connections, keeps serving the open
+#    ones until they hang up (at most drain_seconds), commits what is queued and closes the database.
+#
+#  Example:
+#    cd app
+#    python -m storage.writer_process --socket /run/localedge/writer.sock &
+#    WRITER_SOCKET=/run/localedge/writer.sock gunicorn -w 4 -b 0.0.0.0:5000 run:app
+#
+#  Sources:
+#    - https://docs.python.org/3/library/multiprocessing.html#module-multiprocessing.connection
+#    - https://sqlite.org/wal.html#concurrency
+
+import argparse
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+from app_logging.log_utils import Logger
+from storage.maintenance import StoreMaintenance
+from storage.reading_store import ReadingStore, store_layout
+
+OPERATIONS = ("insert", "insert_sequenced", "ping")
+
+
+class WriterUnavailableError(ConnectionError):
+    """The writer process can't be reached or didn't acknowledge; nothing is known to be stored."""
+
+
+class WriterError(RuntimeError):
+    """The writer received the request but storing it failed (the message is the writer's error)."""
+
+
+class StorageWriter:
+    def __init__(self, store: ReadingStore, socket_path: str, authkey: bytes | None = None, max_batch: int = 64,
+                 maintenance_interval: float | None = None):
+        self.store = store
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.max_batch = max_batch
+        self.logger = Logger().get_logger()
+        # run by the write thread itself: upkeep never races a group commit for the write lock
+        self.maintenance = None
+        if maintenance_interval is not None:
+            self.maintenance = StoreMaintenance(store, interval=maintenance_interval, autostart=False)
+        self._next_maintenance = time.monotonic()
+
+        self.requests = 0
+        self.commits = 0
+        self._queue = queue.Queue()  # (operation, args, Future)
+        self._listener = None
+        self._connections = set()
+        self._lock = threading.Lock()  # _connections
+        self._write_thread = None
+        self._accept_thread = None
+        self._closing = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self.store.create_tables()  # before the socket exists: a worker that can connect finds the schema
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # left behind by a writer that was killed
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        old_umask = os.umask(0o177)  # the socket is created 0600: only this user's workers may connect
+        try:
+            self._listener = Listener(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(old_umask)
+        self._write_thread = threading.Thread(target=self._write_loop, name="StorageWriter", daemon=True)
+        self._accept_thread = threading.Thread(target=self._accept_loop, name="StorageWriterAccept", daemon=True)
+        self._write_thread.start()
+        self._accept_thread.start()
+        self.logger.info(f"Storage writer listening on {self.socket_path}")
+
+    def serve_forever(self, drain_seconds: float = 10.0) -> None:
+        self.start()
+        signal.signal(signal.SIGTERM, lambda *_: self._closing.set())
+        try:
+            self._closing.wait()
+        except KeyboardInterrupt:
+            pass
+        self.close(drain_seconds)
+
+    def close(self, drain_seconds: float = 10.0) -> None:
+        """Stop accepting, let connected workers finish (up to drain_seconds), commit what's queued."""
+        if self._stopped.is_set():
+            return
+        self._closing.set()
+        if self._listener is not None:
+            try:
+                with socket.socket(socket.AF_UNIX) as sock:
+                    sock.connect(self.socket_path)  # accept() doesn't notice the listener closing: wake it up
+            except OSError:
+                pass
+            self._accept_thread.join(timeout=drain_seconds)
+            self._listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        deadline = time.monotonic() + drain_seconds
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._connections:
+                    break
+            time.sleep(0.05)
+        with self._lock:
+            for conn in self._connections:
+                # wake the thread blocked in recv() with EOF (closing under it would pull the fd away);
+                # workers still connected get WriterUnavailableError and retry later
+                with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+                    sock.shutdown(socket.SHUT_RDWR)
+        self._queue.put(None)  # after everything already queued
+        if self._write_thread is not None:
+            self._write_thread.join()
+        while not self._queue.empty():  # queued by a connection after the stop marker
+            request = self._queue.get_nowait()
+            if request is not None:
+                request[2].set_exception(WriterUnavailableError("storage writer is shutting down"))
+        self._stopped.set()
+        self.store.db.close()
+        self.logger.info(f"Storage writer stopped after {self.requests} requests in {self.commits} commits")
+
+    def _accept_loop(self) -> None:
+        while not self._closing.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # listener closed
+            except Exception as e:  # failed handshake (wrong authkey) or a client that went away
+                if not self._closing.is_set():
+                    self.logger.warning(f"Storage writer rejected a connection: {e}")
+                continue
+            if self._closing.is_set():
+                conn.close()
+                return
+            with self._lock:
+                self._connections.add(conn)
+            thread = threading.Thread(target=self._serve, args=(conn,), name="StorageWriterConnection", daemon=True)
+            thread.start()
+
+    def _serve(self, conn) -> None:
+        """One worker connection: one request in flight at a time, answered after its commit."""
+        try:
+            while True:
+                try:
+                    operation, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                future = Future()
+                if operation not in OPERATIONS:
+                    future.set_exception(ValueError(f"unknown operation {operation!r}"))
+                else:
+                    self._queue.put((operation, args, future))
+                try:
+                    conn.send(("ok", future.result()))
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _write_loop(self) -> None:
+        while True:
+            timeout = None
+            if self.maintenance is not None:
+                if time.monotonic() >= self._next_maintenance:
+                    self.maintenance.run_once()
+                    self._next_maintenance = time.monotonic() + self.maintenance.interval
+                timeout = max(0.0, self._next_maintenance - time.monotonic())
+            try:
+                first = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue  # maintenance is due
+            if first is None:
+                return
+            batch = [first]
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)  # stop after this batch
+                    break
+                batch.append(request)
+            self._commit(batch)
+
+    def _commit(self, batch: list[tuple]) -> None:
+        self.requests += len(batch)
+        try:
+            with self.store.db.transaction():
+                results = [self._apply(operation, args) for operation, args, _ in batch]
+        except Exception as e:
+            self.logger.error(f"Storage writer group of {len(batch)} failed, retrying one by one: {e}")
+            for operation, args, future in batch:
+                try:
+                    with self.store.db.transaction():
+                        result = self._apply(operation, args)
+                except Exception as single_error:
+                    future.set_exception(single_error)
+                else:
+                    self.commits += 1
+                    future.set_result(result)
+            return
+        self.commits += 1
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)  # only now: the transaction is committed
+
+    def _apply(self, operation: str, args: tuple):
+        if operation == "insert":
+            return self.store.insert_batches(*args)
+        if operation == "insert_sequenced":
+            return self.store.insert_sequenced(*args)
+        return "pong"
+
+
+class RemoteStore(ReadingStore):
+    """A ReadingStore for worker processes: reads from `db` directly, writes through the writer process."""
+
+    def __init__(self, db, socket_path: str, authkey: bytes | None = None, connect_timeout: float = 10.0, **kwargs):
+        # partitions are created and dropped by the writer: follow its schema changes
+        super().__init__(db, watch_schema=True, **kwargs)
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()  # a Connection isn't thread-safe: one per worker thread
+        self._all = set()
+        self._lock = threading.Lock()
+
+    def insert_dht22(self, rows: list[tuple]) -> int:
+        return self.insert_batches({"dht22": rows})
+
+    def insert_ens160(self, rows: list[tuple]) -> int:
+        return self.insert_batches({"ens160": rows})
+
+    def insert_batches(self, batches: dict[str, list[tuple]]) -> int:
+        batches = {sensor: rows for sensor, rows in batches.items() if rows}
+        if not batches:
+            return 0
+        count = self._call("insert", batches)
+        for sensor, rows in batches.items():
+            self._invalidate(sensor, rows)  # this worker's cache; other workers' entries age out (ttl)
+        return count
+
+    def insert_sequenced(self, sensor: str, rows: list[tuple], device: str, seqs: list[int]) -> list[int]:
+        if not rows:
+            return []
+        fresh = self._call("insert_sequenced", sensor, rows, device, seqs)
+        self._invalidate(sensor, [rows[i] for i in fresh])
+        return fresh
+
+    def prune(self, now: float | None = None) -> list[str]:
+        return []  # retention, compaction and migration run in the writer's maintenance job
+
+    def migrate_unpartitioned(self, chunk_size: int = 10000) -> int:
+        return 0
+
+    def compact(self, now: float | None = None) -> list[str]:
+        return []
+
+    def wait_ready(self, timeout: float | None = None) -> None:
+        deadline = time.monotonic() + (self.connect_timeout if timeout is None else timeout)
+        while True:
+            try:
+                self._call("ping")
+                return
+            except WriterUnavailableError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+        self._local = threading.local()
+
+    def _call(self, operation: str, *args):
+        conn = self._connection()
+        try:
+            conn.send((operation, args))
+            status, result = conn.recv()
+        except (EOFError, OSError) as e:
+            self._drop(conn)
+            raise WriterUnavailableError(f"storage writer went away before acknowledging: {e}") from e
+        if status == "error":
+            raise WriterError(result)
+        return result
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                conn = Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+                break
+            except (OSError, EOFError) as e:
+                if time.monotonic() >= deadline:
+                    raise WriterUnavailableError(f"no storage writer on {self.socket_path}: {e}") from e
+                time.sleep(0.1)
+        self._local.conn = conn
+        with self._lock:
+            self._all.add(conn)
+        return conn
+
+    def _drop(self, conn) -> None:
+        self._local.conn = None
+        with self._lock:
+            self._all.discard(conn)
+        conn.close()
+
+
+def main():
+    from configbox.configuration import Configuration
+    from storage.sqlite_db import SqliteDB
+
+    config = Configuration()
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    parser = argparse.ArgumentParser(description="LocalEdge storage writer: the one process that writes SQLite")
+    parser.add_argument("--db", default=config.get("DB_PATH") or os.path.join(base_dir, "app/data/localedge.db"))
+    parser.add_argument("--socket", default=config.get("WRITER_SOCKET") or "/tmp/localedge-writer.sock")
+    parser.add_argument("--drain-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    store = ReadingStore(SqliteDB(db_path=args.db, pooled=True),
+                         **store_layout(args.db, config.get("RETENTION_DAYS")))  # the layout routes.py opens
+    secret = config.get("SECRET_KEY")
+    StorageWriter(store, args.socket, authkey=secret.encode() if secret else None,
+                  maintenance_interval=3600.0).serve_forever(args.drain_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#  Purpose:
+#     Cold history in SQLite partitions vs the memory-mapped column archive: bytes on
+#     disk per reading and the time to scan the whole range.
+#
+#  Example:
+#     python benchmarks/bench_archive.py --days 365 --interval 60
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from storage.archive import ColumnarArchive  # noqa: E402
+from storage.reading_store import ReadingStore  # noqa: E402
+from storage.sqlite_db import SqliteDB  # noqa: E402
+
+DAY = 86400
+
+
+def du(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite partitions vs columnar archive")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between readings")
+    args = parser.parse_args()
+
+    start = 1716768000.0
+    end = start + args.days * DAY
+    per_day = int(DAY / args.interval)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "hot.db")
+        db = SqliteDB(db_path=db_path, pooled=True)
+        store = ReadingStore(db, rollups=False, partition="day")  # everything stays in SQLite while filling
+        for d in range(args.days):
+            day = start + d * DAY
+            store.insert_dht22([(day + i * args.interval, 20 + (i % 100) / 10, 50.0, 40.0, "OK")
+                                for i in range(per_day)])
+        n = per_day * args.days
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        sqlite_ms, sqlite_rows = timed(lambda: store.readings("dht22", start, end))
+        sqlite_bytes = os.path.getsize(db_path)
+
+        archived = ReadingStore(db, rollups=False, partition="day",
+                                archive=ColumnarArchive(os.path.join(tmp_dir, "archive")), archive_after_days=0)
+        archived.compact(now=end)
+        archive_bytes = du(os.path.join(tmp_dir, "archive"))
+        scan_ms, columns = timed(lambda: archived.archive.query("dht22", start, end, period_seconds=DAY))
+
+        print(f"{n} DHT22 readings over {args.days} days")
+        print(f"    SQLite partitions   {sqlite_bytes / n:6.1f} B/reading   full scan {sqlite_ms:9.1f} ms ({len(sqlite_rows)} rows)")
+        print(f"    columnar archive    {archive_bytes / n:6.1f} B/reading   full scan {scan_ms:9.1f} ms ({len(columns['timestamp'])} rows)")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#  Purpose:
+#     Load test for the ingest path: N virtual Picos post DHT22 + ENS160 readings on an
+#     open-loop schedule (a slow server makes them fall behind, it doesn't slow them down)
+#     against the real routes module (partitions, rollups, alerts, anomalies, write buffer)
+#     backed by a throwaway database. Reports throughput, p50/p95/p99 latency, how far the
+#     Picos fell behind schedule and SQLite write amplification, and appends one JSON line
+#     per run to --output so runs from different revisions can be diffed.
+#
+#  Transports:
+#     - client: Flask test client, in-process (no sockets, the app's own cost)
+#     - socket: threaded werkzeug server on 127.0.0.1, one HTTP connection per request like app.run
+#     - async:  AsyncIngestServer on 127.0.0.1, keep-alive connections (INGEST_MODE=async)
+#
+#  Load shape:
+#     - --format text: one POST per reading and sensor; batch / frame: --batch readings per POST
+#     - --pattern steady: evenly spaced; poisson: random gaps with the same mean rate;
+#       burst: every --burst-period seconds the Pico sends everything it buffered back-to-back
+#
+#  Write amplification = bytes the process wrote to files (/proc/self/io wchar: SQLite
+#  database + WAL, plus the log) / payload bytes the Picos sent. Linux only, null elsewhere.
+#
+#  Example:
+#     python benchmarks/bench_ingest_load.py --picos 200 --rate 1 --seconds 20 --format text --transport client,socket
+#     python benchmarks/bench_ingest_load.py --picos 50 --format frame --batch 60 --pattern burst --burst-period 5
+#     -> benchmarks/results/ingest_load.jsonl, one {"revision": ..., "config": ..., "results": [...]} per run
+
+import argparse
+import asyncio
+import datetime
+import http.client
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, os.path.join(REPO_DIR, "app"))
+sys.path.insert(0, REPO_DIR)
+
+from sensor_manager.wire_format import CONTENT_TYPE as FRAME_CONTENT_TYPE, encode_frame  # noqa: E402
+
+TRANSPORTS = ("client", "socket", "async")
+
+
+class VirtualPico:
+    """One simulated board: a DHT22 and an ENS160 sampled `rate` times per second."""
+
+    def __init__(self, number: int, rate: float, fmt: str, pattern: str, batch: int, burst_period: float,
+                 rng: random.Random):
+        self.device = f"pico-{number:04d}"
+        self.number = number
+        self.rate = rate
+        self.fmt = fmt
+        self.pattern = pattern
+        self.batch = batch
+        self.burst_period = burst_period
+        self.rng = rng
+        self.seq = 0  # frame records are numbered per device, the server drops repeated numbers as retransmits
+
+    def schedule(self, seconds: float, start: float) -> list[tuple[float, str, bytes, dict, int]]:
+        """[(send offset, path, body, headers, readings)] sorted by send offset."""
+        sample_times = self._sample_times(seconds)
+        headers = {"X-Device-Id": self.device}
+        requests = []
+        if self.fmt == "text":
+            for t in sample_times:
+                temperature, humidity, eco2, tvoc = self._values()
+                requests.append((t, "/dht22", f"{temperature:.1f},{humidity:.1f},{temperature - 3:.1f},OK".encode(),
+                                 headers, 1))
+                requests.append((t, "/ens160", f"{eco2:.0f},{tvoc:.0f},2,OK".encode(), headers, 1))
+        else:
+            for offset in range(0, len(sample_times), self.batch):
+                times = sample_times[offset:offset + self.batch]
+                requests += self._batch_requests(times, start, headers)
+
+        if self.pattern == "burst":
+            # hold everything until the end of the Pico's current burst period, then send in a row
+            phase = self.rng.uniform(0, self.burst_period)
+            requests = [(min(seconds, (int((t + phase) // self.burst_period) + 1) * self.burst_period - phase),
+                         *rest) for t, *rest in requests]
+        requests.sort(key=lambda request: request[0])
+        return requests
+
+    def _sample_times(self, seconds: float) -> list[float]:
+        if self.pattern == "poisson":
+            times, t = [], self.rng.expovariate(self.rate)
+            while t < seconds:
+                times.append(t)
+                t += self.rng.expovariate(self.rate)
+            return times
+        phase = self.rng.uniform(0, 1 / self.rate)  # spread the fleet over the interval
+        return [phase + i / self.rate for i in range(int((seconds - phase) * self.rate))]
+
+    def _values(self) -> tuple[float, float, float, float]:
+        return (self.rng.gauss(22, 0.5), self.rng.gauss(50, 2), self.rng.gauss(600, 40), self.rng.gauss(150, 10))
+
+    def _batch_requests(self, times: list[float], start: float, headers: dict) -> list[tuple]:
+        t_send = times[-1]  # a batch leaves once its last reading is taken
+        values = [self._values() for _ in times]
+        if self.fmt == "frame":
+            frame_headers = {**headers, "Content-Type": FRAME_CONTENT_TYPE}
+            first = self.seq
+            self.seq += len(times)
+            dht22 = encode_frame("dht22", self.number, [(first + i, start + t, te, hu, te - 3, 0)
+                                                         for i, (t, (te, hu, _, _)) in enumerate(zip(times, values))])
+            ens160 = encode_frame("ens160", self.number, [(first + i, start + t, round(e), round(tv), 2, 0)
+                                                          for i, (t, (_, _, e, tv)) in enumerate(zip(times, values))])
+            return [(t_send, "/dht22", dht22, frame_headers, len(times)),
+                    (t_send, "/ens160", ens160, frame_headers, len(times))]
+        dht22 = "\n".join(f"{start + t:.3f},{te:.1f},{hu:.1f},{te - 3:.1f},OK" for t, (te, hu, _, _) in zip(times, values))
+        ens160 = "\n".join(f"{start + t:.3f},{e:.0f},{tv:.0f},2,OK" for t, (_, _, e, tv) in zip(times, values))
+        return [(t_send, "/dht22/batch", dht22.encode(), headers, len(times)),
+                (t_send, "/ens160/batch", ens160.encode(), headers, len(times))]
+
+
+class ClientSender:
+    """Flask test client, one per Pico thread."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path: str, body: bytes, headers: dict) -> tuple[int, dict]:
+        headers = dict(headers)
+        content_type = headers.pop("Content-Type", "text/plain")
+        response = self.client.post(path, data=body, headers=headers, content_type=content_type)
+        return response.status_code, response.get_json(silent=True) or {}
+
+    def close(self) -> None:
+        pass
+
+
+class SocketSender:
+    """http.client connection; reconnects by itself when the server closes after each response."""
+
+    def __init__(self, port: int):
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def post(self, path: str, body: bytes, headers: dict) -> tuple[int, dict]:
+        self.connection.request("POST", path, body=body, headers={"Content-Type": "text/plain", **headers})
+        response = self.connection.getresponse()
+        payload = response.read()
+        try:
+            return response.status, json.loads(payload)
+        except ValueError:
+            return response.status, {}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def accepted_readings(status: int, payload: dict) -> int:
+    if status != 200:
+        return 0
+    if "accepted" in payload:
+        return payload["accepted"]
+    return 0 if "error" in payload else 1
+
+
+def run_pico(requests: list, make_sender, t0: float, results: list) -> None:
+    sender = make_sender()
+    latencies, lags, statuses = [], [], {}
+    readings = offered = sent_bytes = 0
+    try:
+        for offset, path, body, headers, count in requests:
+            delay = t0 + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            begin = time.perf_counter()
+            lags.append(begin - (t0 + offset))
+            try:
+                status, payload = sender.post(path, body, headers)
+            except (OSError, http.client.HTTPException):
+                status, payload = 0, {}
+            latencies.append(time.perf_counter() - begin)
+            statuses[status] = statuses.get(status, 0) + 1
+            readings += accepted_readings(status, payload)
+            offered += count
+            sent_bytes += len(body)
+    finally:
+        sender.close()
+    results.append((latencies, lags, statuses, readings, sent_bytes, offered))
+
+
+def written_bytes() -> int | None:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def database_bytes(db_path: str) -> int:
+    return sum(os.path.getsize(path) for path in (db_path, db_path + "-wal") if os.path.exists(path))
+
+
+def run_scenario(transport: str, picos: list, args, routes_module, app, db_path: str) -> dict:
+    server = stop = None
+    if transport == "client":
+        make_sender = lambda: ClientSender(app)  # noqa: E731
+    elif transport == "socket":
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):  # one access-log line per request would dominate the run
+                pass
+
+        server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+        make_sender = lambda: SocketSender(port)  # noqa: E731
+        stop = server.shutdown
+    else:
+        from async_server import AsyncIngestServer
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        server = AsyncIngestServer(routes_module.pipeline, host="127.0.0.1", port=0)
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+        port = server.port
+        make_sender = lambda: SocketSender(port)  # noqa: E731
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+    start_wall = time.time()
+    schedules = [pico.schedule(args.seconds, start_wall) for pico in picos]
+    written_before, db_before = written_bytes(), database_bytes(db_path)
+    results = []
+    t0 = time.perf_counter() + 0.2  # let every thread get to its first sleep
+    threads = [threading.Thread(target=run_pico, args=(schedule, make_sender, t0, results))
+               for schedule in schedules]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    routes_module.write_buffer.flush()  # queued single readings count as written
+    elapsed = time.perf_counter() - t0
+    written_after = written_bytes()
+    if stop is not None:
+        stop()
+
+    latencies = np.array([value for result in results for value in result[0]]) * 1000
+    lags = np.array([value for result in results for value in result[1]]) * 1000
+    statuses = {}
+    for result in results:
+        for status, count in result[2].items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    readings = sum(result[3] for result in results)
+    sent_bytes = sum(result[4] for result in results)
+    written = None if written_before is None or written_after is None else written_after - written_before
+    percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [0.0, 0.0, 0.0]
+
+    return {
+        "transport": transport,
+        "requests": int(len(latencies)),
+        "readings": readings,
+        "readings_offered": sum(result[5] for result in results),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "readings_per_s": round(readings / elapsed, 1),
+        "latency_ms": {"p50": round(float(percentiles[0]), 3), "p95": round(float(percentiles[1]), 3),
+                       "p99": round(float(percentiles[2]), 3),
+                       "max": round(float(latencies.max()), 3) if len(latencies) else 0.0},
+        "max_lag_ms": round(float(lags.max()), 3) if len(lags) else 0.0,
+        "statuses": statuses,
+        "bytes_sent": sent_bytes,
+        "bytes_written": written,
+        "write_amplification": round(written / sent_bytes, 2) if written is not None and sent_bytes else None,
+        "db_growth_bytes_per_reading": round((database_bytes(db_path) - db_before) / readings, 1) if readings else None,
+    }
+
+
+def revision() -> str | None:
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest load generator: virtual Picos against the real routes")
+    parser.add_argument("--picos", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=1.0, help="readings per second per Pico and sensor")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--format", choices=("text", "batch", "frame"), default="text")
+    parser.add_argument("--batch", type=int, default=30, help="readings per POST for batch / frame")
+    parser.add_argument("--pattern", choices=("steady", "poisson", "burst"), default="steady")
+    parser.add_argument("--burst-period", type=float, default=5.0)
+    parser.add_argument("--transport", default="client,socket", help=f"comma-separated: {', '.join(TRANSPORTS)}")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "ingest_load.jsonl"))
+    args = parser.parse_args()
+
+    transports = [name.strip() for name in args.transport.split(",") if name.strip()]
+    unknown = set(transports) - set(TRANSPORTS)
+    if unknown:
+        parser.error(f"unknown transport(s): {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # the routes module builds its store from DB_PATH on import: point it at a scratch database
+        db_path = os.path.join(tmp_dir, "localedge.db")
+        os.environ["DB_PATH"] = db_path
+        routes_module = importlib.import_module("app.routes.routes")
+        from app import create_app
+        app = create_app()
+
+        rng = random.Random(args.seed)
+        picos = [VirtualPico(n, args.rate, args.format, args.pattern, args.batch, args.burst_period,
+                             random.Random(rng.random())) for n in range(args.picos)]
+
+        print(f"{args.picos} Picos x {args.rate}/s x 2 sensors, {args.format}, {args.pattern}, {args.seconds:.0f} s")
+        results = []
+        for transport in transports:
+            result = run_scenario(transport, picos, args, routes_module, app, db_path)
+            results.append(result)
+            latency = result["latency_ms"]
+            amplification = result["write_amplification"]
+            print(f"    {transport:7s} {result['readings_per_s']:9.1f} readings/s {result['requests_per_s']:8.1f} req/s"
+                  f"   p50 {latency['p50']:7.2f}  p95 {latency['p95']:7.2f}  p99 {latency['p99']:7.2f} ms"
+                  f"   behind {result['max_lag_ms']:8.1f} ms"
+                  f"   write amp {'n/a' if amplification is None else f'{amplification:.1f}x'}"
+                  f"   statuses {result['statuses']}")
+        routes_module.write_buffer.close()
+        routes_module.store.db.close()
+
+    record = {"benchmark": "ingest_load", "revision": revision(),
+              "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+              "python": platform.python_version(), "machine": platform.machine(), "config": vars(args),
+              "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#  Purpose:
+#     Retention cost, single table vs daily partitions: expire the oldest day of
+#     readings with DELETE WHERE ts < ? vs DROP TABLE, and scan one recent hour.
+#
+#  Example:
+#     python benchmarks/bench_partitions.py --days 30 --interval 5
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from storage.reading_store import DHT22_TABLE, ReadingStore  # noqa: E402
+from storage.sqlite_db import SqliteDB  # noqa: E402
+
+DAY = 86400
+
+
+def fill(store, start, n, interval):
+    for offset in range(0, n, 10000):
+        store.insert_dht22([(start + i * interval, 20 + (i % 100) / 10, 50.0, 40.0, "OK")
+                            for i in range(offset, min(offset + 10000, n))])
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DELETE vs DROP partition retention benchmark")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between readings")
+    args = parser.parse_args()
+
+    start = 1716768000.0  # midnight UTC, so day boundaries line up with the partitions
+    n = int(args.days * DAY / args.interval)
+    cutoff = start + DAY
+    recent = (start + (args.days - 1) * DAY, start + (args.days - 1) * DAY + 3600)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        single = ReadingStore(SqliteDB(db_path=os.path.join(tmp_dir, "single.db"), pooled=True), rollups=False)
+        daily = ReadingStore(SqliteDB(db_path=os.path.join(tmp_dir, "daily.db"), pooled=True),
+                             rollups=False, partition="day")
+        fill(single, start, n, args.interval)
+        fill(daily, start, n, args.interval)
+
+        print(f"{n} DHT22 readings over {args.days} days")
+        print(f"    expire oldest day, DELETE      {timed(lambda: single.db.execute(f'DELETE FROM {DHT22_TABLE} WHERE ts < ?', (cutoff,))):9.2f} ms")
+        print(f"    expire oldest day, DROP TABLE  {timed(lambda: daily.partitions['dht22'].drop_before(cutoff)):9.2f} ms")
+        print(f"    scan one hour, single table    {timed(lambda: single.readings('dht22', *recent)):9.2f} ms")
+        print(f"    scan one hour, partitioned     {timed(lambda: daily.readings('dht22', *recent)):9.2f} ms")
+        single.db.close()
+        daily.db.close()
+
+
+if __name__ == "__main__":
+    main()
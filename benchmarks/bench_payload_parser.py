@@ -0,0 +1,55 @@
+#  Purpose:
+#     Micro-benchmark of the typed payload parser against the original split/zip approach.
+#
+#  Example:
+#     python benchmarks/bench_payload_parser.py --lines 10000 --repeat 5
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sensor_manager.payload_parser import DHT22_SCHEMA, parse_block, parse_reading  # noqa: E402
+
+
+def split_zip(line: str) -> dict:
+    # what SensorPipeline.update_dht22_data used to do: strings only, no validation
+    keys = ["temperature", "humidity", "average", "status"]
+    return dict(zip(keys, line.split(",")))
+
+
+def split_zip_typed(line: str) -> dict:
+    # split/zip followed by the float() calls every consumer had to do afterwards
+    reading = split_zip(line)
+    for key in ("temperature", "humidity", "average"):
+        reading[key] = float(reading[key])
+    return reading
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload parser micro-benchmark")
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = [f"{20 + (i % 100) / 10:.1f},{40 + (i % 50) / 10:.1f},{30 + (i % 70) / 10:.1f},OK"
+             for i in range(args.lines)]
+    block = "\n".join(f"{1717000000 + i},{line}" for i, line in enumerate(lines))
+
+    cases = {
+        "split/zip (strings)": lambda: [split_zip(line) for line in lines],
+        "split/zip + float()": lambda: [split_zip_typed(line) for line in lines],
+        "parse_reading per line": lambda: [parse_reading(DHT22_SCHEMA, line) for line in lines],
+        "parse_block (vectorized)": lambda: parse_block(DHT22_SCHEMA, block, now=1717000000),
+    }
+
+    print(f"{args.lines} lines, best of {args.repeat}")
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"  {name:<26} {best * 1000:8.2f} ms  {best / args.lines * 1e6:6.2f} us/line")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#  Purpose:
+#     History query cost as raw data piles up: GROUP BY over the raw table vs reading the
+#     pre-aggregated rollups, for the same chart (one field, ~500 points).
+#
+#  Example:
+#     python benchmarks/bench_rollups.py --days 30 --interval 10
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from storage.reading_store import DHT22_TABLE, ReadingStore  # noqa: E402
+from storage.sqlite_db import SqliteDB  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw GROUP BY vs rollup history queries")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between readings")
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = SqliteDB(db_path=os.path.join(tmp_dir, "bench.db"), pooled=True)
+        store = ReadingStore(db)
+        start = 1717000000.0
+        n = int(args.days * 86400 / args.interval)
+        for offset in range(0, n, 10000):
+            store.insert_dht22([(start + i * args.interval, 20 + (i % 100) / 10, 50.0, 40.0, "OK")
+                                for i in range(offset, min(offset + 10000, n))])
+        end = start + n * args.interval
+
+        resolution = store.rollups.pick_resolution(start, end, args.points)
+        raw_query = (f"SELECT CAST(ts / {resolution} AS INTEGER) * {resolution} AS bucket, "
+                     f"MIN(temperature), MAX(temperature), AVG(temperature), COUNT(*) "
+                     f"FROM {DHT22_TABLE} WHERE ts >= ? AND ts < ? GROUP BY bucket ORDER BY bucket")
+        cases = {
+            "raw GROUP BY": lambda: db.fetchall(raw_query, (start, end)),
+            "rollups": lambda: store.history("dht22", "temperature", start, end, args.points),
+        }
+
+        print(f"{n} DHT22 readings over {args.days} days, chart of <= {args.points} points ({resolution} s buckets)")
+        for name, case in cases.items():
+            best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+            print(f"    {name:<14} {best * 1000:8.3f} ms")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#  Purpose:
+#     Cold start cost: how long a fresh interpreter takes from launch until the app has
+#     accepted its first reading (import, create_app, one POST /dht22 through the test
+#     client), and what each module costs to import (python -X importtime). Every run is a
+#     new process with a throwaway database, so the numbers include everything a Pi pays
+#     after a reboot except the OS file cache. Appends one JSON line per run to --output.
+#
+#  Regression guard:
+#     Modules listed in LAZY_MODULES (cloud SDKs) must not be imported before the first
+#     reading is accepted; the run exits with status 1 if one is, so CI can catch an
+#     accidental module-level `import boto3`.
+#
+#  Example:
+#     python benchmarks/bench_startup.py --runs 5
+#     python benchmarks/bench_startup.py --importtime-top 40   # longer list of the heaviest imports
+#     -> benchmarks/results/startup.jsonl, one {"revision": ..., "first_reading_s": ..., "imports": ...} per run
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+
+LAZY_MODULES = ("boto3", "botocore", "paho")
+APP_MODULES = ("app", "app.routes.routes", "storage.reading_store", "sensor_manager.sensor_pipeline",
+               "sensor_manager.alerts", "sensor_manager.anomaly", "configbox.configuration", "aws.mqtt_client",
+               "flask", "numpy")
+
+# runs in the child: everything the Pi does between boot and answering its first Pico
+FIRST_READING = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+client = create_app().test_client()
+response = client.post("/dht22", data="22.5,60,41.2,OK")
+accepted = time.perf_counter()
+loaded = sorted(name for name in {lazy!r} if name in sys.modules)
+print(json.dumps({{"status": response.status_code, "import_s": imported - started,
+                   "first_post_s": accepted - imported, "lazy_loaded": loaded}}), flush=True)
+"""
+
+# the import graph the server actually has: the app package plus the optional cloud client
+IMPORTS = "import app, aws.mqtt_client"
+
+
+def child_env(db_dir: str) -> dict:
+    env = dict(os.environ)
+    env["DB_PATH"] = os.path.join(db_dir, "localedge.db")
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(REPO_DIR, "app"), REPO_DIR])
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # bytecode caches exist on a deployed Pi too
+    return env
+
+
+def first_reading(python: str) -> dict:
+    """Launch a fresh interpreter, return its timings; wall_s is launch -> first reading accepted."""
+    with tempfile.TemporaryDirectory() as db_dir:
+        start = time.perf_counter()
+        completed = subprocess.run([python, "-c", FIRST_READING.format(lazy=LAZY_MODULES)], cwd=REPO_DIR,
+                                   env=child_env(db_dir), capture_output=True, text=True, check=True)
+        wall = time.perf_counter() - start  # includes interpreter shutdown, the child's own numbers don't
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def import_times(python: str) -> dict[str, dict]:
+    """{module: {"self_ms", "cumulative_ms"}} from python -X importtime (first import only)."""
+    with tempfile.TemporaryDirectory() as db_dir:
+        completed = subprocess.run([python, "-X", "importtime", "-c", IMPORTS], cwd=REPO_DIR,
+                                   env=child_env(db_dir), capture_output=True, text=True, check=True)
+    modules = {}
+    for line in completed.stderr.splitlines():
+        # "import time:       412 |      14213 |   flask"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not self_us.isdigit():
+            continue  # the header line
+        modules[name] = {"self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000}
+    return modules
+
+
+def revision() -> str | None:
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark: time to first accepted reading, import cost")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time (the first warms the cache)")
+    parser.add_argument("--importtime-top", type=int, default=15, help="heaviest modules (self time) to list")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "startup.jsonl"))
+    args = parser.parse_args()
+
+    first_reading(args.python)  # warm-up: compile bytecode and fill the OS cache, not part of the numbers
+    runs = [first_reading(args.python) for _ in range(args.runs)]
+    statuses = sorted({run["status"] for run in runs})
+    lazy_loaded = sorted({name for run in runs for name in run["lazy_loaded"]})
+
+    modules = import_times(args.python)
+    app_modules = {name: modules[name] for name in APP_MODULES if name in modules}
+    heaviest = dict(sorted(modules.items(), key=lambda item: -item[1]["self_ms"])[:args.importtime_top])
+
+    def summary(key):
+        values = [run[key] for run in runs]
+        return {"min": round(min(values), 4), "median": round(statistics.median(values), 4),
+                "max": round(max(values), 4)}
+
+    record = {"benchmark": "startup", "revision": revision(),
+              "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+              "python": platform.python_version(), "machine": platform.machine(), "config": vars(args),
+              "first_reading_s": summary("wall_s"), "import_s": summary("import_s"),
+              "first_post_s": summary("first_post_s"), "statuses": statuses, "lazy_loaded": lazy_loaded,
+              "imports": {"app": app_modules, "heaviest_self": heaviest}}
+
+    first = record["first_reading_s"]
+    print(f"first accepted reading: min {first['min'] * 1000:.0f} ms, median {first['median'] * 1000:.0f} ms"
+          f"   (import {record['import_s']['median'] * 1000:.0f} ms,"
+          f" first POST {record['first_post_s']['median'] * 1000:.1f} ms, statuses {statuses})")
+    print("cumulative import cost:")
+    for name, cost in app_modules.items():
+        print(f"    {name:34s} {cost['cumulative_ms']:8.1f} ms")
+    print(f"heaviest {len(heaviest)} modules by own import time:")
+    for name, cost in heaviest.items():
+        print(f"    {name:34s} {cost['self_ms']:8.1f} ms")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"appended to {args.output}")
+
+    if lazy_loaded:
+        print(f"REGRESSION: imported before the first reading: {', '.join(lazy_loaded)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#  Purpose:
+#     Compare the CSV text upload with the binary wire_format frame: bytes on the wire
+#     and decode time on the Pi, for the same readings.
+#
+#  Example:
+#     python benchmarks/bench_wire_format.py --readings 1000 --repeat 5
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sensor_manager.payload_parser import DHT22_SCHEMA, parse_block, parse_reading  # noqa: E402
+from sensor_manager.wire_format import decode_frame, encode_frame  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text vs binary upload benchmark")
+    parser.add_argument("--readings", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    readings = [(i, 1717000000.0 + i, 20 + (i % 100) / 10, 40 + (i % 50) / 10, 30 + (i % 70) / 10, 0)
+                for i in range(args.readings)]
+
+    single_text = [f"{t:.1f},{h:.1f},{a:.1f},OK".encode() for _, _, t, h, a, _ in readings]
+    single_frames = [encode_frame("dht22", 1, [r]) for r in readings]
+    batch_text = "\n".join(f"{ts:.0f},{t:.1f},{h:.1f},{a:.1f},OK" for _, ts, t, h, a, _ in readings).encode()
+    batch_frame = encode_frame("dht22", 1, readings)
+
+    print(f"{args.readings} DHT22 readings")
+    print("  bytes on the wire (payload only, no HTTP headers)")
+    print(f"    text,   one per request  {sum(map(len, single_text)):>9} B  ({sum(map(len, single_text)) / args.readings:.1f} B/reading, no timestamp/seq)")
+    print(f"    binary, one per request  {sum(map(len, single_frames)):>9} B  ({sum(map(len, single_frames)) / args.readings:.1f} B/reading)")
+    print(f"    text,   one batch        {len(batch_text):>9} B  ({len(batch_text) / args.readings:.1f} B/reading)")
+    print(f"    binary, one frame        {len(batch_frame):>9} B  ({len(batch_frame) / args.readings:.1f} B/reading)")
+
+    cases = {
+        "text single (decode+parse)": lambda: [parse_reading(DHT22_SCHEMA, p.decode()) for p in single_text],
+        "binary single": lambda: [decode_frame(f, now=1717000000) for f in single_frames],
+        "text batch (parse_block)": lambda: parse_block(DHT22_SCHEMA, batch_text.decode(), now=1717000000).rows(),
+        "binary frame": lambda: decode_frame(batch_frame, now=1717000000).rows,
+    }
+    print(f"  decode time, best of {args.repeat}")
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f"    {name:<27} {best * 1000:8.2f} ms  {best / args.readings * 1e6:6.2f} us/reading")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Logger() reads LOG_FILE when a module builds its logger at import time: point it at a
+# scratch directory before any test module imports the app, so runs never touch app/logs/.
+os.environ["LOG_FILE"] = os.path.join(tempfile.mkdtemp(prefix="localedge-test-logs-"), "log.txt")
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from sensor_manager.alerts import (AlertEngine, Ewma, RateOfChange, RollingExtreme, RollingMean, RuleError,
+                                   parse_rule)
+from sensor_manager.broadcaster import ReadingBroadcaster
+from sensor_manager.sensor_pipeline import SensorPipeline
+
+T0 = 1717000000.0
+
+
+def ens160(ts, eco2, tvoc=100.0, aqi=1.0):
+    return (ts, eco2, tvoc, aqi, "OK")
+
+
+def dht22(ts, temperature=22.0, humidity=50.0):
+    return (ts, temperature, humidity, 40.0, "OK")
+
+
+class TestRuleParsing:
+    def test_full_rule(self):
+        rule = parse_rule("ens160.eco2 > 1200 for 5m clear 1000")
+        assert (rule.sensor, rule.field, rule.op, rule.threshold) == ("ens160", "eco2", ">", 1200.0)
+        assert rule.hold == 300.0
+        assert rule.clear == 1000.0
+        assert rule.stat == "value"
+
+    def test_windowed_stat(self):
+        rule = parse_rule("dht22.humidity rate(2m) >= 3.5")
+        assert (rule.stat, rule.window, rule.threshold) == ("rate", 120.0, 3.5)
+
+    @pytest.mark.parametrize("text", [
+        "ens160.co2 > 1200",  # unknown field
+        "bme280.temperature > 30",  # unknown sensor
+        "dht22.temperature ~ 30",  # unknown operator
+        "dht22.temperature > 30 clear 35",  # clear level on the wrong side
+        "dht22.temperature mean(0s) > 30",  # empty window
+    ])
+    def test_bad_rules_are_rejected(self, text):
+        with pytest.raises(RuleError):
+            parse_rule(text)
+
+
+class TestRollingStatistics:
+    def test_mean_forgets_old_samples(self):
+        mean = RollingMean(window=10)
+        assert mean.update(0, 10.0) == 10.0
+        assert mean.update(5, 20.0) == 15.0
+        assert mean.update(12, 30.0) == 25.0  # the sample at t=0 left the window
+
+    def test_extremes_track_the_window(self):
+        window_max = RollingExtreme(window=10, is_max=True)
+        window_min = RollingExtreme(window=10, is_max=False)
+        for ts, value in [(0, 5.0), (1, 9.0), (2, 3.0), (3, 4.0)]:
+            window_max.update(ts, value)
+            window_min.update(ts, value)
+        assert window_max.update(4, 1.0) == 9.0
+        assert window_min.update(4, 1.0) == 1.0
+        assert window_max.update(11.5, 2.0) == 4.0  # 9.0 at t=1 expired
+        assert len(window_max.candidates) == 2  # only samples that can still become the max are kept
+
+    def test_ewma_is_time_aware(self):
+        ewma = Ewma(window=60)
+        ewma.update(0, 0.0)
+        assert ewma.update(60, 100.0) == pytest.approx(100 * (1 - 2.718281828 ** -1), rel=1e-6)
+
+    def test_rate_is_per_minute(self):
+        rate = RateOfChange(window=300)
+        assert rate.update(0, 50.0) is None
+        assert rate.update(120, 54.0) == pytest.approx(2.0)
+
+
+class TestAlertEngine:
+    def test_alert_fires_after_hold_and_only_once(self):
+        engine = AlertEngine(["ens160.eco2 > 1200 for 5m clear 1000"])
+        events = []
+        for i in range(12):  # one reading a minute, all above the threshold
+            events += engine.evaluate("ens160", ens160(T0 + i * 60, 1300.0))
+
+        assert [e["state"] for e in events] == ["firing"]
+        assert events[0]["timestamp"] == T0 + 300
+        assert events[0]["since"] == T0
+        assert len(engine.active()) == 1
+
+    def test_short_spike_does_not_fire(self):
+        engine = AlertEngine(["ens160.eco2 > 1200 for 5m"])
+        events = []
+        for i, eco2 in enumerate([1300, 1300, 1300, 900, 1300, 1300]):
+            events += engine.evaluate("ens160", ens160(T0 + i * 60, float(eco2)))
+        assert events == []
+
+    def test_hysteresis_keeps_alert_until_clear_level(self):
+        engine = AlertEngine(["ens160.eco2 > 1200 clear 1000"])
+        states = []
+        for i, eco2 in enumerate([1300, 1150, 1250, 1100, 990, 1210]):
+            states += [e["state"] for e in engine.evaluate("ens160", ens160(T0 + i, float(eco2)))]
+        # dipping to 1150/1100 is inside the hysteresis band: no resolve, no second alert
+        assert states == ["firing", "resolved", "firing"]
+
+    def test_devices_are_tracked_separately(self):
+        engine = AlertEngine(["dht22.temperature > 30"])
+        assert engine.evaluate("dht22", dht22(T0, temperature=31.0), device="kitchen")[0]["device"] == "kitchen"
+        assert engine.evaluate("dht22", dht22(T0, temperature=25.0), device="bedroom") == []
+        assert [a["device"] for a in engine.active()] == ["kitchen"]
+
+    def test_rules_on_the_same_window_share_it(self):
+        engine = AlertEngine(["dht22.humidity mean(10m) > 70", "dht22.humidity mean(10m) < 20",
+                              "dht22.humidity > 90"])
+        trackers, rules = engine._plans["dht22"]
+        assert len(trackers) == 2
+        assert len(rules) == 3
+
+
+class TestPipelineAlerts:
+    def test_alerts_reach_the_stream(self):
+        broadcaster = ReadingBroadcaster()
+        subscription = broadcaster.subscribe({"alert"})
+        pipeline = SensorPipeline(api_key="test", server_url="http://localhost", broadcaster=broadcaster,
+                                  alerts=AlertEngine(["dht22.temperature > 30"]))
+
+        now = time.time()  # Pico timestamps must be near the server clock
+        pipeline.update_dht22_batch(f"{now - 2:.0f},31.0,50,40,OK\n{now - 1:.0f},31.5,50,40,OK")
+        frames = subscription.get(timeout=0)
+        assert len(frames) == 1
+        assert frames[0].startswith("event: alert\n")
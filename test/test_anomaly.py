@@ -0,0 +1,106 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from sensor_manager.anomaly import AnomalyDetector, _recurrence
+from sensor_manager.sensor_pipeline import SensorPipeline
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+
+T0 = 1717000000.0
+
+
+def feed(detector, sensor, ts, values_by_field):
+    """Stream rows through observe(); values_by_field gives the first two fields of each row."""
+    events = []
+    first, second = values_by_field
+    for t, a, b in zip(ts, first, second):
+        events += detector.observe(sensor, (float(t), float(a), float(b), 0.0, "OK"))
+    return events
+
+
+class TestAnomalyDetector:
+    """Test suite for the streaming and vectorized anomaly detectors."""
+
+    @staticmethod
+    def noisy(n, seed=1, level=22.0, scale=0.2):
+        return level + np.random.default_rng(seed).normal(0, scale, n)
+
+    def test_spike_is_flagged(self):
+        detector = AnomalyDetector()
+        temperature = self.noisy(200)
+        temperature[150] += 15
+        events = feed(detector, "dht22", T0 + np.arange(200) * 60, (temperature, self.noisy(200, 2, 50, 1)))
+
+        spikes = [e for e in events if e["type"] == "spike"]
+        assert [(e["field"], e["timestamp"]) for e in spikes] == [("temperature", T0 + 150 * 60)]
+
+    def test_stuck_sensor_is_reported_once(self):
+        detector = AnomalyDetector(stuck_seconds=3600, stuck_min_count=10)
+        humidity = np.r_[self.noisy(30, 3, 50, 1), np.full(200, 48.0)]  # frozen after 30 readings
+        events = feed(detector, "dht22", T0 + np.arange(230) * 60, (self.noisy(230), humidity))
+
+        stuck = [e for e in events if e["type"] == "stuck"]
+        assert len(stuck) == 1
+        assert stuck[0]["field"] == "humidity"
+        assert stuck[0]["timestamp"] == T0 + (30 + 60) * 60  # an hour into the frozen run
+
+    def test_drift_is_reported_once_per_excursion(self):
+        detector = AnomalyDetector(z_threshold=1e9)  # only look at drift here
+        eco2 = np.r_[self.noisy(500, 4, 450, 5), 450 + np.linspace(0, 200, 300)]  # slow climb
+        events = feed(detector, "ens160", T0 + np.arange(800) * 10, (eco2, self.noisy(800, 5, 100, 2)))
+
+        drift = [e for e in events if e["type"] == "drift"]
+        assert len(drift) == 1
+        assert drift[0]["field"] == "eco2"
+        assert drift[0]["timestamp"] > T0 + 500 * 10
+
+    def test_streams_are_kept_per_device(self):
+        detector = AnomalyDetector(warmup=5)
+        for i in range(20):
+            detector.observe("dht22", (T0 + i, 22.0 + i % 2 * 0.1, 50.0 + i % 3, 40.0, "OK"), device="kitchen")
+        assert detector.observe("dht22", (T0 + 20, 40.0, 51.0, 40.0, "OK"), device="bedroom") == []
+        assert detector.observe("dht22", (T0 + 20, 40.0, 51.0, 40.0, "OK"), device="kitchen")[0]["type"] == "spike"
+
+    def test_vectorized_backtest_matches_streaming(self):
+        n = 3000
+        ts = T0 + np.arange(n) * 30.0
+        temperature = self.noisy(n, 6)
+        temperature[[700, 1900]] += [8, -9]
+        humidity = np.r_[self.noisy(2000, 7, 50, 1), np.full(1000, 61.0)]
+
+        streaming = feed(AnomalyDetector(), "dht22", ts, (temperature, humidity))
+        batch = AnomalyDetector().score_columns(
+            "dht22", {"timestamp": ts, "temperature": temperature, "humidity": humidity, "average": temperature})
+
+        key = lambda e: (e["timestamp"], e["field"], e["type"])
+        assert sorted(map(key, batch)) == sorted(map(key, streaming))
+        assert {e["type"] for e in batch} >= {"spike", "stuck"}
+        for b, s in zip(sorted(batch, key=key), sorted(streaming, key=key)):
+            assert b["score"] == pytest.approx(s["score"], rel=1e-6)
+
+    def test_recurrence_matches_loop(self):
+        inputs = np.random.default_rng(8).normal(size=5000)
+        expected = []
+        y = 3.0
+        for value in inputs:
+            y = 0.9 * y + value
+            expected.append(y)
+        np.testing.assert_allclose(_recurrence(inputs, 0.9, 3.0), expected, rtol=1e-9, atol=1e-9)
+
+
+class TestPipelineAnomalies:
+    def test_backtest_reads_stored_history(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "backtest.db"), pooled=True)
+            store = ReadingStore(db)
+            eco2 = 450 + np.random.default_rng(9).normal(0, 5, 300)
+            eco2[250] = 2000
+            store.insert_ens160([(T0 + i * 10, float(v), 100.0, 2.0, "OK") for i, v in enumerate(eco2)])
+            pipeline = SensorPipeline(api_key="test", server_url="http://localhost", store=store)
+
+            events = pipeline.backtest_anomalies("ens160", T0, T0 + 3000)
+            assert [(e["type"], e["timestamp"]) for e in events] == [("spike", T0 + 2500)]
+            db.close()
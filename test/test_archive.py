@@ -0,0 +1,153 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from storage.archive import ColumnarArchive
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+
+DAY = 86400
+MONDAY = 1716768000  # 2024-05-27 00:00 UTC
+
+
+class TestColumnarArchive:
+    """Test suite for the memory-mapped column archive."""
+
+    @pytest.fixture
+    def archive_dir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yield tmp_dir
+
+    @staticmethod
+    def rows(n, start=MONDAY, step=10.5):
+        return [(start + i * step, 20.0 + (i % 10) / 10, 50.0, 40.0, "OK" if i % 3 else "WARNING") for i in range(n)]
+
+    def test_columns_are_fixed_width_files(self, archive_dir):
+        archive = ColumnarArchive(archive_dir)
+        archive.write_partition("dht22", MONDAY, self.rows(1000))
+
+        period_dir = os.path.join(archive_dir, "dht22", "20240527")
+        assert os.path.getsize(os.path.join(period_dir, "ts.u4")) == 4000  # delta-encoded milliseconds
+        assert os.path.getsize(os.path.join(period_dir, "temperature.f4")) == 4000
+        assert os.path.getsize(os.path.join(period_dir, "status.u1")) == 1000
+        assert archive.periods("dht22") == [MONDAY]
+
+    def test_range_query_slices_the_maps(self, archive_dir):
+        archive = ColumnarArchive(archive_dir)
+        rows = self.rows(1000)
+        archive.write_partition("dht22", MONDAY, rows)
+
+        result = archive.query("dht22", rows[100][0], rows[200][0])
+        assert len(result["timestamp"]) == 100
+        assert result["timestamp"][0] == pytest.approx(rows[100][0])
+        assert result["temperature"].dtype == np.float32
+        np.testing.assert_allclose(result["temperature"], [r[1] for r in rows[100:200]], rtol=1e-6)
+
+    def test_views_point_into_the_file(self, archive_dir):
+        archive = ColumnarArchive(archive_dir)
+        archive.write_partition("ens160", MONDAY, [(MONDAY + i, 400.0 + i, 150.0, 2.0, "OK") for i in range(100)])
+
+        part = next(archive.iter_ranges("ens160", MONDAY, MONDAY + 50))
+        assert isinstance(part["eco2"], np.memmap)
+        assert not part["eco2"].flags.writeable
+
+    def test_rows_round_trip_with_float64_timestamps(self, archive_dir):
+        archive = ColumnarArchive(archive_dir, delta_ts=False)
+        rows = self.rows(50)
+        archive.write_partition("dht22", MONDAY, rows)
+
+        assert os.path.exists(os.path.join(archive_dir, "dht22", "20240527", "ts.f8"))
+        assert archive.rows("dht22", MONDAY, MONDAY + DAY) == rows
+
+    def test_drop_before_removes_expired_periods(self, archive_dir):
+        archive = ColumnarArchive(archive_dir)
+        for d in range(3):
+            archive.write_partition("dht22", MONDAY + d * DAY, self.rows(10, start=MONDAY + d * DAY))
+
+        archive.drop_before(MONDAY + 2 * DAY, DAY)
+        assert archive.periods("dht22") == [MONDAY + 2 * DAY]
+
+    def test_crash_between_the_renames_is_recovered(self, archive_dir, monkeypatch):
+        """The merged .tmp may be the only copy of the old rows: it's finished, never deleted."""
+        archive = ColumnarArchive(archive_dir)
+        archive.write_partition("dht22", MONDAY, self.rows(10))
+        merged = self.rows(20)
+
+        def crash(src, dst):
+            if src.endswith(".tmp"):
+                raise OSError("power cut")
+            real_replace(src, dst)
+
+        real_replace = os.replace
+        monkeypatch.setattr(os, "replace", crash)
+        with pytest.raises(OSError):
+            archive.write_partition("dht22", MONDAY, merged)
+        monkeypatch.setattr(os, "replace", real_replace)
+        assert archive.periods("dht22") == []  # old version renamed aside, new one not yet in place
+
+        assert ColumnarArchive(archive_dir).rows("dht22", MONDAY, MONDAY + DAY) == merged
+        assert sorted(os.listdir(os.path.join(archive_dir, "dht22"))) == ["20240527"]
+
+    def test_incomplete_write_is_discarded(self, archive_dir):
+        archive = ColumnarArchive(archive_dir)
+        archive.write_partition("dht22", MONDAY, self.rows(10))
+        os.makedirs(os.path.join(archive_dir, "dht22", "20240527.tmp"))  # crashed before meta.json
+
+        assert ColumnarArchive(archive_dir).rows("dht22", MONDAY, MONDAY + DAY) == self.rows(10)
+        assert sorted(os.listdir(os.path.join(archive_dir, "dht22"))) == ["20240527"]
+
+
+class TestArchivedReadingStore:
+    """Compaction of closed partitions and merged reads across both tiers."""
+
+    @pytest.fixture
+    def store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "store.db"), pooled=True)
+            archive = ColumnarArchive(os.path.join(tmp_dir, "archive"))
+            yield ReadingStore(db, partition="day", archive=archive, archive_after_days=1)
+            db.close()
+
+    def test_closed_partitions_move_to_the_archive(self, store):
+        for d in range(4):
+            store.insert_dht22([(MONDAY + d * DAY + 60, 20.0 + d, 50.0, 40.0, "OK")])
+        assert store.archive.periods("dht22") == []  # ingest never compacts
+
+        # day 3 running: days 0 and 1 are more than a day closed, day 2 is still in its grace period
+        store.maintain(now=MONDAY + 3 * DAY + 60)
+        assert store.archive.periods("dht22") == [MONDAY, MONDAY + DAY]
+        assert [start for start, _ in store.partitions["dht22"].partitions()] == [MONDAY + 2 * DAY, MONDAY + 3 * DAY]
+        assert [r[1] for r in store.readings("dht22", MONDAY, MONDAY + 4 * DAY)] == [20.0, 21.0, 22.0, 23.0]
+
+    def test_late_upload_is_merged_on_next_compaction(self, store):
+        store.insert_dht22([(MONDAY + 60, 20.0, 50.0, 40.0, "OK")])
+        store.compact(now=MONDAY + 3 * DAY)
+        store.insert_dht22([(MONDAY + 30, 19.0, 50.0, 40.0, "OK")])  # late, lands in a fresh day-0 table
+
+        assert [r[1] for r in store.readings("dht22", MONDAY, MONDAY + DAY)] == [19.0, 20.0]
+        store.compact(now=MONDAY + 3 * DAY)
+        assert store.partitions["dht22"].partitions() == []
+        assert [r[1] for r in store.readings("dht22", MONDAY, MONDAY + DAY)] == [19.0, 20.0]
+
+    def test_rows_arriving_during_compaction_are_kept(self, store, monkeypatch):
+        store.insert_dht22([(MONDAY + 60, 20.0, 50.0, 40.0, "OK")])
+        write_partition = store.archive.write_partition
+
+        def write_while_ingesting(sensor, period_start, rows):
+            store.insert_dht22([(MONDAY + 120, 21.0, 50.0, 40.0, "OK")])  # a late upload mid-compaction
+            write_partition(sensor, period_start, rows)
+
+        monkeypatch.setattr(store.archive, "write_partition", write_while_ingesting)
+        assert store.compact(now=MONDAY + 3 * DAY) == []
+        assert [r[1] for r in store.readings("dht22", MONDAY, MONDAY + DAY)] == [20.0, 21.0]
+
+        monkeypatch.setattr(store.archive, "write_partition", write_partition)
+        assert len(store.compact(now=MONDAY + 3 * DAY)) == 1
+        assert store.partitions["dht22"].partitions() == []
+        assert [r[1] for r in store.readings("dht22", MONDAY, MONDAY + DAY)] == [20.0, 21.0]
+
+    def test_archive_requires_partitions(self, tmp_path):
+        with pytest.raises(ValueError):
+            ReadingStore(SqliteDB(db_path=":memory:"), archive=ColumnarArchive(str(tmp_path)))
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import pytest
+
+from async_server import AsyncIngestServer
+from sensor_manager.sensor_pipeline import SensorPipeline
+from sensor_manager.wire_format import CONTENT_TYPE as FRAME_CONTENT_TYPE, encode_frame
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+from storage.writer_process import WriterError
+
+
+async def send(reader, writer, method, path, body=b"", headers=None):
+    """Send one request on an open connection and read back (status, headers, body)."""
+    lines = [f"{method} {path} HTTP/1.1", "Host: test", f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode().strip().split("\r\n")
+    response_headers = {k.lower(): v.strip() for k, _, v in (h.partition(":") for h in header_lines)}
+    payload = await reader.readexactly(int(response_headers["content-length"]))
+    return int(status_line.split()[1]), response_headers, payload
+
+
+class TestAsyncIngestServer:
+    """Test suite for the asyncio ingest server."""
+
+    @pytest.fixture
+    def pipeline(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "async.db"), pooled=True)
+            yield SensorPipeline(api_key="test", server_url="http://localhost", store=ReadingStore(db))
+            db.close()
+
+    def run_with_server(self, pipeline, scenario, **options):
+        async def runner():
+            server = AsyncIngestServer(pipeline, host="127.0.0.1", port=0, **options)
+            await server.start()
+            try:
+                return await scenario(server.port)
+            finally:
+                await server.close()
+        return asyncio.run(runner())
+
+    def test_keep_alive_serves_several_requests_on_one_connection(self, pipeline):
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            results = [await send(reader, writer, "GET", "/"),
+                       await send(reader, writer, "POST", "/dht22", b"22.5,60,41.2,OK"),
+                       await send(reader, writer, "POST", "/ens160/batch", f"{time.time():.0f},400,150,2,OK\n".encode())]
+            writer.close()
+            return results
+
+        home, dht22, batch = self.run_with_server(pipeline, scenario)
+        assert home[0] == 200 and b"LocalEdge is up and running!" in home[2]
+        assert dht22[0] == 200 and json.loads(dht22[2])["temperature"] == 22.5
+        assert dht22[1]["connection"] == "keep-alive"
+        assert batch[0] == 200 and json.loads(batch[2])["accepted"] == 1
+        assert pipeline.store.db.fetchone("SELECT COUNT(*) FROM ens160_readings") == (1,)
+
+    def test_connection_close_is_honoured(self, pipeline):
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, headers, _ = await send(reader, writer, "GET", "/", headers={"Connection": "close"})
+            closed = await reader.read() == b""
+            writer.close()
+            return status, headers, closed
+
+        status, headers, closed = self.run_with_server(pipeline, scenario)
+        assert status == 200
+        assert headers["connection"] == "close"
+        assert closed
+
+    def test_unknown_route_and_wrong_method(self, pipeline):
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            results = [(await send(reader, writer, "GET", "/nope"))[0],
+                       (await send(reader, writer, "GET", "/dht22"))[0]]
+            writer.close()
+            return results
+
+        assert self.run_with_server(pipeline, scenario) == [404, 405]
+
+    def test_bad_payloads_are_client_errors(self, pipeline, monkeypatch):
+        def rejecting(raw_txt, device="default", seq=None):
+            raise ValueError("sequence number out of range")
+
+        monkeypatch.setattr(pipeline, "update_dht22_data", rejecting)
+
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            results = [(await send(reader, writer, "POST", "/dht22", b"22.5,60,41.2,OK"))[0],
+                       (await send(reader, writer, "POST", "/dht22", b"\x00\x01",
+                                   {"Content-Type": "application/vnd.localedge.frame"}))[0]]
+            writer.close()
+            return results
+
+        assert self.run_with_server(pipeline, scenario) == [400, 400]  # the same answers as the Flask routes
+
+    def test_rejected_items_are_reported_by_index_on_every_endpoint(self, pipeline):
+        now = time.time()
+        frame = encode_frame("dht22", 7, [(1, now, 22.5, 60.0, 41.2, 0), (2, now, 22.5, 60.0, 41.2, 99)])
+
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            results = [await send(reader, writer, "POST", "/dht22/batch", f"{now:.0f},22.5,60,41.2,OK\nbad\n".encode()),
+                       await send(reader, writer, "POST", "/dht22", frame, {"Content-Type": FRAME_CONTENT_TYPE})]
+            writer.close()
+            return [json.loads(payload)["errors"] for _, _, payload in results]
+
+        batch_errors, frame_errors = self.run_with_server(pipeline, scenario)
+        assert [e["index"] for e in batch_errors] == [1]
+        assert [e["index"] for e in frame_errors] == [1]
+
+    def test_stalled_body_times_out(self, pipeline):
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /dht22 HTTP/1.1\r\nHost: test\r\nContent-Length: 15\r\n\r\n22.5")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)  # answered, then closed
+            writer.close()
+            return response
+
+        response = self.run_with_server(pipeline, scenario, body_timeout=0.2)
+        assert response.startswith(b"HTTP/1.1 408 ")
+        assert b"Connection: close" in response
+
+    def test_failed_writer_write_is_retryable(self, pipeline, monkeypatch):
+        def failing(raw_txt, device="default", seq=None):
+            raise WriterError("disk I/O error")
+
+        monkeypatch.setattr(pipeline, "update_dht22_batch", failing)
+
+        async def scenario(port):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = f"{time.time():.0f},22.5,60,41.2,OK".encode()
+            status, headers, _ = await send(reader, writer, "POST", "/dht22/batch", body)
+            writer.close()
+            return status, headers
+
+        status, headers = self.run_with_server(pipeline, scenario)
+        assert (status, headers["retry-after"]) == (503, "1")
+
+    def test_many_concurrent_connections(self, pipeline):
+        async def client(port, i):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, _, _ = await send(reader, writer, "POST", "/dht22", f"{20 + i % 5},50,40,OK".encode())
+            writer.close()
+            return status
+
+        async def scenario(port):
+            return await asyncio.gather(*(client(port, i) for i in range(100)))
+
+        assert self.run_with_server(pipeline, scenario) == [200] * 100
+        assert len(pipeline.devices.get("default").rings["dht22"]) == 100
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
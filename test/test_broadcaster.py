@@ -0,0 +1,80 @@
+import importlib
+import json
+
+import pytest
+
+from app import create_app
+from sensor_manager.broadcaster import ReadingBroadcaster
+from sensor_manager.sensor_pipeline import SensorPipeline
+
+
+class TestReadingBroadcaster:
+    """Test suite for the SSE fan-out."""
+
+    def test_subscribers_only_get_their_sensors(self):
+        broadcaster = ReadingBroadcaster()
+        dht22_only = broadcaster.subscribe({"dht22"})
+        both = broadcaster.subscribe()
+
+        broadcaster.publish("dht22", {"temperature": 22.5})
+        broadcaster.publish("ens160", {"eco2": 400.0})
+
+        assert dht22_only.get(timeout=0) == ['event: dht22\ndata: {"temperature":22.5}\n\n']
+        assert len(both.get(timeout=0)) == 2
+
+    def test_slow_subscriber_drops_oldest(self):
+        broadcaster = ReadingBroadcaster(max_queue=2)
+        subscription = broadcaster.subscribe({"dht22"})
+        for i in range(5):
+            broadcaster.publish("dht22", {"n": i})
+
+        frames = subscription.get(timeout=0)
+        assert [json.loads(f.split("data: ")[1])["n"] for f in frames] == [3, 4]
+        assert subscription.dropped == 3
+
+    def test_idle_get_returns_empty_for_heartbeat(self):
+        subscription = ReadingBroadcaster().subscribe()
+        assert subscription.get(timeout=0.01) == []
+
+    def test_unsubscribe_and_invalid_kinds(self):
+        broadcaster = ReadingBroadcaster()
+        subscription = broadcaster.subscribe({"ens160"})
+        broadcaster.unsubscribe(subscription)
+        assert broadcaster.subscriber_count() == 0
+        with pytest.raises(ValueError):
+            broadcaster.subscribe({"bme280"})
+
+
+class TestStreamEndpoint:
+    """Test suite for GET /stream."""
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, monkeypatch):
+        routes_module = importlib.import_module("app.routes.routes")
+        self.broadcaster = ReadingBroadcaster()
+        monkeypatch.setattr(routes_module, "broadcaster", self.broadcaster)
+        monkeypatch.setattr(routes_module, "pipeline",
+                            SensorPipeline(api_key="test", server_url="http://localhost", broadcaster=self.broadcaster))
+        self.client = create_app().test_client()
+
+    def test_stream_pushes_accepted_readings(self):
+        response = self.client.get("/stream?sensors=dht22", buffered=False)
+        assert response.mimetype == "text/event-stream"
+        chunks = iter(response.response)
+        assert next(chunks).startswith(b"retry:")
+
+        self.client.post("/ens160", data="400,150,2,OK")  # filtered out
+        self.client.post("/dht22", data="22.5,60,41.2,OK")
+        frame = next(chunks).decode()
+        assert frame.startswith("event: dht22\n")
+        assert json.loads(frame.split("data: ")[1])["temperature"] == 22.5
+
+        response.close()
+        assert self.broadcaster.subscriber_count() == 0
+
+    def test_stream_rejects_unknown_sensor(self):
+        assert self.client.get("/stream?sensors=bme280").status_code == 400
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from configbox.configuration import Configuration
+
+
+@pytest.fixture
+def env_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(Configuration, "_cache", {})
+    monkeypatch.setattr(Configuration, "_from_file", set())
+    for name in Configuration.FIELDS:
+        monkeypatch.delenv(name, raising=False)
+    path = tmp_path / ".env"
+    path.write_text("DB_PATH=/tmp/first.db\nRETENTION_DAYS=30\n")
+    yield path
+    for name in Configuration._from_file:
+        os.environ.pop(name, None)  # exported from the file; monkeypatch then restores the originals
+
+
+class TestConfiguration:
+    """Test suite for the cached, read-only configuration."""
+
+    def test_file_is_read_once_and_cached(self, env_file):
+        config = Configuration(str(env_file))
+        env_file.write_text("DB_PATH=/tmp/second.db\n")
+
+        assert Configuration(str(env_file)) is config
+        assert config.DB_PATH == "/tmp/first.db"
+        assert config.get("RETENTION_DAYS") == "30"
+        assert config.get("ADMIN_TOKEN") is None
+
+    def test_configuration_is_read_only(self, env_file):
+        config = Configuration(str(env_file))
+        with pytest.raises(AttributeError):
+            config.DB_PATH = "/tmp/other.db"
+        with pytest.raises(AttributeError):
+            config.NOT_A_SETTING
+
+    def test_reload_picks_up_edits_but_environment_wins(self, env_file, monkeypatch):
+        old = Configuration(str(env_file))
+        env_file.write_text("DB_PATH=/tmp/second.db\nSECRET_KEY=from-file\n")
+        monkeypatch.setenv("SECRET_KEY", "from-environment")
+
+        new = Configuration.reload(str(env_file))
+
+        assert Configuration(str(env_file)) is new
+        assert new.DB_PATH == "/tmp/second.db"
+        assert new.SECRET_KEY == "from-environment"
+        assert old.DB_PATH == "/tmp/first.db"  # holders of the old object see consistent old values
+
+    def test_get_falls_back_beyond_the_fields(self, env_file, monkeypatch):
+        env_file.write_text("DB_PATH=/tmp/first.db\nSENSOR_SITE=greenhouse\n")
+        monkeypatch.delenv("SENSOR_SITE", raising=False)
+        config = Configuration(str(env_file))
+
+        assert config.get("SENSOR_SITE") == "greenhouse"  # exported from .env, not a declared field
+        assert config.get("env_path") == str(env_file)
+        assert config.get("NOT_A_SETTING") is None
+
+    def test_load_is_reload(self, env_file):
+        old = Configuration(str(env_file))
+        env_file.write_text("DB_PATH=/tmp/second.db\n")
+
+        new = old.load()
+
+        assert Configuration(str(env_file)) is new
+        assert new.DB_PATH == "/tmp/second.db" and old.DB_PATH == "/tmp/first.db"
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
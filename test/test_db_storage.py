@@ -1,5 +1,7 @@
 import tempfile
 import os
+import sqlite3
+import threading
 import pytest
 from pathlib import Path
 
@@ -33,3 +35,88 @@ class TestSqliteDB:
         temp_db.execute("INSERT INTO t (v) VALUES (?)", ("value",))
         row = temp_db.fetchone("SELECT * FROM t")
         assert row == (1, "value")
+
+    def test_executemany_inserts_all_rows(self, temp_db):
+        temp_db.execute("CREATE TABLE t (ts REAL, v REAL)")
+        count = temp_db.executemany("INSERT INTO t (ts, v) VALUES (?, ?)", [(1.0, 10.0), (2.0, 20.0), (3.0, 30.0)])
+        assert count == 3
+        assert temp_db.fetchall("SELECT v FROM t ORDER BY ts") == [(10.0,), (20.0,), (30.0,)]
+
+
+class TestPooledSqliteDB:
+    @pytest.fixture(scope="function")
+    def pooled_db(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "pooled.db"), pooled=True, pool_size=2)
+            yield db
+            db.close()
+
+    def test_pooled_connection_uses_wal(self, pooled_db):
+        assert pooled_db.fetchone("PRAGMA journal_mode") == ("wal",)
+        assert pooled_db.fetchone("PRAGMA synchronous") == (1,)  # NORMAL
+
+    def test_pooled_roundtrip_reuses_connection(self, pooled_db):
+        pooled_db.execute("CREATE TABLE t (v INTEGER)")
+        for i in range(10):
+            pooled_db.execute("INSERT INTO t (v) VALUES (?)", (i,))
+        assert pooled_db.fetchone("SELECT COUNT(*) FROM t") == (10,)
+        assert len(pooled_db._all_connections) == 1
+
+    def test_transaction_commits_together(self, pooled_db):
+        pooled_db.execute("CREATE TABLE t (v INTEGER)")
+        with pooled_db.transaction():
+            pooled_db.execute("INSERT INTO t (v) VALUES (?)", (1,))
+            pooled_db.executemany("INSERT INTO t (v) VALUES (?)", [(2,), (3,)])
+        assert pooled_db.fetchall("SELECT v FROM t ORDER BY v") == [(1,), (2,), (3,)]
+
+    def test_transaction_rolls_back_on_error(self, pooled_db):
+        pooled_db.execute("CREATE TABLE t (v INTEGER)")
+        with pytest.raises(RuntimeError):
+            with pooled_db.transaction():
+                pooled_db.execute("INSERT INTO t (v) VALUES (?)", (1,))
+                raise RuntimeError("boom")
+        assert pooled_db.fetchone("SELECT COUNT(*) FROM t") == (0,)
+
+    def test_reader_not_blocked_by_open_write_transaction(self, pooled_db):
+        pooled_db.execute("CREATE TABLE t (v INTEGER)")
+        pooled_db.execute("INSERT INTO t (v) VALUES (?)", (1,))
+        result = []
+
+        with pooled_db.transaction():
+            pooled_db.execute("INSERT INTO t (v) VALUES (?)", (2,))
+            reader = threading.Thread(target=lambda: result.append(pooled_db.fetchone("SELECT COUNT(*) FROM t")))
+            reader.start()
+            reader.join(timeout=5)
+
+        assert result == [(1,)]  # reader sees the last committed snapshot instead of waiting
+
+    def test_exhausted_pool_times_out(self, tmp_path):
+        db = SqliteDB(db_path=str(tmp_path / "small.db"), pooled=True, pool_size=1, acquire_timeout=0.1)
+        result = []
+        with db.transaction():  # pins the only connection
+            other = threading.Thread(target=lambda: result.append(pytest.raises(sqlite3.OperationalError,
+                                                                                db.fetchone, "SELECT 1")))
+            other.start()
+            other.join(timeout=5)
+            assert db.fetchone("SELECT 1") == (1,)  # this thread still uses its pinned connection
+        assert len(result) == 1 and "pool_size" in str(result[0].value)
+        db.close()
+
+    def test_connection_released_after_close_is_closed(self, pooled_db):
+        with pooled_db.transaction():
+            conn = pooled_db._local.conn
+            pooled_db.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+        assert pooled_db._idle.empty() and pooled_db._all_connections == []
+
+    def test_closed_database_refuses_new_calls(self, pooled_db):
+        pooled_db.fetchone("SELECT 1")
+        pooled_db.close()
+        with pytest.raises(sqlite3.ProgrammingError):
+            pooled_db.fetchone("SELECT 1")
+        assert pooled_db._all_connections == []
+
+    def test_invalid_synchronous_rejected(self):
+        with pytest.raises(ValueError):
+            SqliteDB(db_path="x.db", synchronous="SOMETIMES")
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from sensor_manager.dedup import DedupIndex, parse_sequence
+from sensor_manager.sensor_pipeline import SensorPipeline
+from sensor_manager.wire_format import encode_frame
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+
+
+@pytest.fixture
+def store():
+    tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    tmp.close()
+    yield ReadingStore(SqliteDB(db_path=tmp.name))
+    os.unlink(tmp.name)
+
+
+class TestDedupIndex:
+    """Test suite for the in-memory sequence window."""
+
+    def test_retransmit_is_a_duplicate(self):
+        dedup = DedupIndex(window=8)
+        assert dedup.claim("a", "dht22", [1, 2], [10.0, 11.0]) == [True, True]
+        assert dedup.claim("a", "dht22", [2, 3], [11.0, 12.0]) == [False, True]
+        assert dedup.claim("b", "dht22", [2], [11.0]) == [True]  # windows are per device
+        assert dedup.claim("a", "ens160", [2], [11.0]) == [True]  # and per sensor
+        assert dedup.duplicates == 1
+
+    def test_restarted_counter_is_not_a_duplicate(self):
+        dedup = DedupIndex(window=8)
+        dedup.claim("a", "dht22", [0, 1, 2], [10.0, 11.0, 12.0])
+        assert dedup.claim("a", "dht22", [0, 1], [500.0, 501.0]) == [True, True]  # rebooted Pico, new timestamps
+
+    def test_untimestamped_readings_only_match_within_retry_seconds(self):
+        dedup = DedupIndex(window=8, retry_seconds=60)
+        assert dedup.claim("a", "dht22", [5], now=1000.0) == [True]
+        assert dedup.claim("a", "dht22", [5], now=1030.0) == [False]
+        assert dedup.claim("a", "dht22", [5], now=1100.0) == [True]
+
+    def test_release_and_forget(self):
+        dedup = DedupIndex(window=8)
+        dedup.claim("a", "dht22", [1, 2], [10.0, 11.0])
+        dedup.release("a", "dht22", [2])
+        assert dedup.claim("a", "dht22", [1, 2], [10.0, 11.0]) == [False, True]
+        dedup.forget("a")
+        assert dedup.claim("a", "dht22", [1], [10.0]) == [True]
+
+    def test_parse_sequence(self):
+        assert parse_sequence(None) is None
+        assert parse_sequence("42") == 42
+        for bad in ("-1", "4.2", "x", str(2 ** 32)):
+            with pytest.raises(ValueError):
+                parse_sequence(bad)
+
+
+class TestIdempotentIngest:
+    """Test suite for duplicate handling through the pipeline and the store's unique index."""
+
+    def test_store_backstop_skips_stored_readings(self, store):
+        rows = [(1717000000.0, 22.5, 60.0, 41.2, "OK"), (1717000001.0, 22.6, 60.1, 41.3, "OK")]
+        assert store.insert_sequenced("dht22", rows, "a", [1, 2]) == [0, 1]
+        assert store.insert_sequenced("dht22", rows + [(1717000002.0, 22.7, 60.2, 41.4, "OK")], "a", [1, 2, 3]) == [2]
+        assert store.insert_sequenced("dht22", rows[:1], "b", [1]) == [0]
+        assert len(store.readings("dht22", 0, 2e9)) == 4
+
+    def test_store_prunes_old_sequence_numbers(self, store):
+        store.insert_sequenced("dht22", [(1717000000.0, 22.5, 60.0, 41.2, "OK")], "a", [1])
+        store.prune(now=1717000000.0 + 8 * 86400)
+        assert store.insert_sequenced("dht22", [(1717000000.0, 22.5, 60.0, 41.2, "OK")], "a", [1]) == [0]
+
+    def test_frame_retransmit_after_restart_hits_the_backstop(self, store):
+        now = float(int(time.time()))
+        frame = encode_frame("dht22", 7, [(seq, now - 10 + seq, 22.5, 60.0, 41.2, 0) for seq in range(3)])
+        pipeline = SensorPipeline(api_key="test", server_url="http://localhost", store=store)
+        assert pipeline.update_frame("dht22", frame)["accepted"] == 3
+
+        restarted = SensorPipeline(api_key="test", server_url="http://localhost", store=store)  # empty window
+        result = restarted.update_frame("dht22", frame)
+        assert (result["accepted"], result["duplicates"]) == (0, 3)
+        assert restarted.latest("dht22", device="7") is None  # duplicates aren't replayed into the rings
+        assert restarted.devices.get("7").duplicates == 3
+        assert len(store.readings("dht22", 0, 2e9)) == 3
+
+    def test_single_reading_retry(self):
+        pipeline = SensorPipeline(api_key="test", server_url="http://localhost")
+        assert "duplicate" not in pipeline.update_dht22_data("22.5,60,41.2,OK", device="a", seq=9)
+        assert pipeline.update_dht22_data("22.5,60,41.2,OK", device="a", seq=9)["duplicate"] is True
+        assert pipeline.devices.get("a").readings == 1
+
+    def test_single_readings_are_stored_without_a_write_buffer(self, store):
+        pipeline = SensorPipeline(api_key="test", server_url="http://localhost", store=store)
+        pipeline.update_dht22_data("22.5,60,41.2,OK", device="a")
+        pipeline.update_dht22_data("22.6,60,41.2,OK", device="a", seq=9)
+        assert pipeline.update_dht22_data("22.6,60,41.2,OK", device="a", seq=9)["duplicate"] is True
+        assert [row[1] for row in store.readings("dht22", 0, 2e9)] == [22.5, 22.6]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from sensor_manager.alerts import AlertEngine
+from sensor_manager.anomaly import AnomalyDetector
+from sensor_manager.device_registry import DEFAULT_DEVICE, DeviceRegistry, StripedLock, normalize_device
+from sensor_manager.sensor_pipeline import SensorPipeline
+
+T0 = 1717000000.0
+
+
+class TestDeviceRegistry:
+    """Test suite for the sharded per-device state."""
+
+    def test_touch_creates_once_and_counts(self):
+        registry = DeviceRegistry(shards=4)
+        first = registry.touch("pico-1", T0, readings=1, kind="dht22")
+        again = registry.touch("pico-1", T0 + 5, readings=3)
+        assert first is again
+        assert again.readings == 4
+        assert again.first_seen == T0 and again.last_seen == T0 + 5
+        assert list(again.rings) == ["dht22"]  # the ENS160 ring is never allocated for this device
+        assert registry.get("pico-2") is None
+        assert len(registry) == 1
+
+    def test_idle_devices_are_evicted_with_callback(self):
+        evicted = []
+        registry = DeviceRegistry(shards=2, idle_seconds=60, on_evict=evicted.append)
+        registry.touch("quiet", T0)
+        registry.touch("busy", T0)
+        registry.touch("busy", T0 + 50)
+
+        assert registry.evict_idle(T0 + 70) == ["quiet"]
+        assert evicted == ["quiet"]
+        assert [d["device"] for d in registry.devices()] == ["busy"]
+
+    def test_touch_sweeps_its_shard(self):
+        evicted = []
+        registry = DeviceRegistry(shards=1, idle_seconds=60, on_evict=evicted.append)
+        registry.touch("old", T0)
+        registry.touch("new", T0 + 120)  # same shard, due for a sweep
+        assert evicted == ["old"]
+        assert registry.get("old") is None
+
+    def test_concurrent_devices(self):
+        registry = DeviceRegistry(shards=8)
+
+        def post(device):
+            for i in range(200):
+                state = registry.touch(device, T0 + i, readings=1, kind="ens160")
+                state.rings["ens160"].append(T0 + i, (400.0 + i, 100.0, 2.0))
+
+        threads = [threading.Thread(target=post, args=(f"pico-{n}",)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(registry) == 16
+        assert {d["readings"] for d in registry.devices()} == {200}
+        assert all(len(registry.get(f"pico-{n}").rings["ens160"]) == 200 for n in range(16))
+
+    def test_normalize_device(self):
+        assert normalize_device(None) == DEFAULT_DEVICE
+        assert normalize_device(42) == "42"
+        assert normalize_device(" pico-3f2a ") == "pico-3f2a"
+        with pytest.raises(ValueError):
+            normalize_device("no spaces please")
+        with pytest.raises(ValueError):
+            normalize_device("x" * 65)
+
+    def test_striped_lock_is_stable_per_key(self):
+        locks = StripedLock(16)
+        assert locks.for_key("pico-1") is locks.for_key("pico-1")
+        assert len({id(locks.for_key(f"pico-{n}")) for n in range(1000)}) == 16
+
+
+class TestPipelineDevices:
+    """Readings from different Picos no longer overwrite each other."""
+
+    def test_devices_keep_separate_state(self):
+        pipeline = SensorPipeline(api_key="test", server_url="http://localhost")
+        pipeline.update_dht22_data("22.5,60,41.2,OK", device="kitchen")
+        pipeline.update_dht22_data("19.0,45,32.0,OK", device="cellar")
+        now = int(time.time())
+        pipeline.update_ens160_batch(f"{now - 2},400,150,2,OK\n{now - 1},410,155,2,OK", device="kitchen")
+
+        assert pipeline.latest("dht22", device="kitchen")["temperature"] == 22.5
+        assert pipeline.latest("dht22", device="cellar")["temperature"] == 19.0
+        assert pipeline.latest("ens160", device="cellar") is None
+        assert pipeline.window("ens160", 60, now=now, device="kitchen")["eco2"].tolist() == [400.0, 410.0]
+        assert len(pipeline.window("ens160", 60, device="nobody")["eco2"]) == 0
+        assert pipeline.devices.get("kitchen").latest["ens160"]["timestamp"] == now - 1
+        assert pipeline.devices.get("kitchen").readings == 3
+
+    def test_eviction_drops_engine_state(self):
+        pipeline = SensorPipeline(api_key="test", server_url="http://localhost", idle_seconds=60,
+                                  alerts=AlertEngine(["ens160.eco2 > 1000"]), anomalies=AnomalyDetector())
+        pipeline.update_ens160_batch(f"{time.time():.0f},1500,150,2,OK", device="pico-7")
+        assert [alert["device"] for alert in pipeline.alerts.active()] == ["pico-7"]
+
+        pipeline.devices.evict_idle(now=pipeline.devices.get("pico-7").last_seen + 61)
+        assert pipeline.devices.get("pico-7") is None
+        assert pipeline.alerts.active() == []
+        assert pipeline.anomalies._streams == {}
@@ -1,6 +1,18 @@
+import importlib
+import os
+import tempfile
+import time
+
 import pytest
 import json
 from app import create_app
+from sensor_manager.sensor_pipeline import SensorPipeline
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+from storage.write_buffer import WriteBuffer
+from storage.writer_process import WriterError
+
+T0 = int(time.time()) // 86400 * 86400  # today 00:00 UTC: Pico timestamps must be near the server clock
 
 
 class TestFlaskApi:
@@ -113,6 +125,12 @@ class TestFlaskApi:
         """Test that app is configured for testing."""
         assert self.app.config['TESTING'] is True
 
+    def test_alerts_endpoint_lists_rules(self):
+        """The default rule set is reported even when nothing is firing."""
+        response = self.client.get("/alerts")
+        assert response.status_code == 200
+        assert "ens160.eco2 > 1200 for 5m clear 1000" in response.get_json()["rules"]
+
     def test_multiple_dht22_requests(self):
         """Test that multiple DHT22 requests can be handled."""
         responses = []
@@ -126,5 +144,140 @@ class TestFlaskApi:
             assert response.status_code in [200, 201]
 
 
+
+class TestBatchApi:
+    """Tests for the /dht22/batch and /ens160/batch bulk ingest endpoints."""
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, monkeypatch):
+        """Point the routes module at a throwaway database for each test."""
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        tmp.close()
+        self.db = SqliteDB(db_path=tmp.name)
+        routes_module = importlib.import_module("app.routes.routes")
+        monkeypatch.setattr(routes_module, "pipeline",
+                            SensorPipeline(api_key="test", server_url="http://localhost", store=ReadingStore(self.db)))
+
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        yield
+        os.unlink(tmp.name)
+
+    def test_dht22_batch_persists_all_lines(self):
+        """Every valid line ends up as a row, written in one request."""
+        body = f"{T0},22.5,60.0,41.2,OK\n{T0 + 1},22.6,60.1,41.3,OK\n{T0 + 2},22.7,60.2,41.4,OK\n"
+        response = self.client.post("/dht22/batch", data=body, content_type="text/plain")
+        assert response.status_code == 200
+        assert response.get_json() == {"accepted": 3, "duplicates": 0, "rejected": 0, "errors": []}
+        assert self.db.fetchone("SELECT COUNT(*) FROM dht22_readings") == (3,)
+
+    def test_ens160_batch_reports_partial_failures(self):
+        """Bad lines are rejected individually; good lines are still stored."""
+        body = f"{T0},400,150,2,OK\nnot,a,number,at,all\n{T0 + 1},410,155\n{T0 + 2},420,160,2,OK"
+        response = self.client.post("/ens160/batch", data=body, content_type="text/plain")
+        result = response.get_json()
+        assert response.status_code == 200
+        assert result["accepted"] == 2
+        assert result["rejected"] == 2
+        assert [e["index"] for e in result["errors"]] == [1, 2]
+        assert self.db.fetchall("SELECT eco2 FROM ens160_readings ORDER BY ts") == [(400.0,), (420.0,)]
+
+    def test_batch_with_only_bad_lines_returns_422(self):
+        """A batch with nothing usable is rejected as a whole."""
+        response = self.client.post("/dht22/batch", data="garbage\n", content_type="text/plain")
+        assert response.status_code == 422
+        assert response.get_json()["accepted"] == 0
+
+    def test_latest_and_window_served_from_ring_buffer(self):
+        """Readings ingested through the API show up on the GET endpoints."""
+        assert self.client.get("/ens160/latest").status_code == 404
+
+        self.client.post("/ens160", data="400,150,2,OK")
+        self.client.post("/ens160", data="410,155,2,OK")
+        latest = self.client.get("/ens160/latest").get_json()
+        assert latest["eco2"] == 410.0
+
+        window = self.client.get("/ens160/window?seconds=60").get_json()
+        assert window["eco2"] == [400.0, 410.0]
+        assert len(window["timestamp"]) == 2
+
+    def test_devices_are_kept_apart(self):
+        """X-Device-Id (or ?device=) separates Picos on ingest and on the live endpoints."""
+        self.client.post("/dht22", data="22.5,60,41.2,OK", headers={"X-Device-Id": "kitchen"})
+        self.client.post("/dht22?device=cellar", data="18.0,70,30.0,OK")
+
+        assert self.client.get("/dht22/latest?device=kitchen").get_json()["temperature"] == 22.5
+        assert self.client.get("/dht22/latest", headers={"X-Device-Id": "cellar"}).get_json()["temperature"] == 18.0
+        assert self.client.get("/dht22/latest").status_code == 404
+        devices = self.client.get("/devices").get_json()["devices"]
+        assert [(d["device"], d["readings"]) for d in devices] == [("cellar", 1), ("kitchen", 1)]
+
+    def test_invalid_device_id_is_rejected(self):
+        response = self.client.post("/dht22/batch", data=f"{T0},22.5,60.0,41.2,OK",
+                                    headers={"X-Device-Id": "not a valid id"})
+        assert response.status_code == 400
+        assert self.client.get("/devices").get_json() == {"devices": []}
+
+    def test_retransmitted_batch_is_stored_once(self):
+        """With X-Sequence a resent batch is acknowledged but not stored again."""
+        body = f"{T0},22.5,60.0,41.2,OK\n{T0 + 1},22.6,60.1,41.3,OK"
+        headers = {"X-Device-Id": "kitchen", "X-Sequence": "100"}
+        assert self.client.post("/dht22/batch", data=body, headers=headers).get_json()["accepted"] == 2
+
+        response = self.client.post("/dht22/batch", data=body + f"\n{T0 + 2},22.7,60.2,41.4,OK", headers=headers)
+        assert response.status_code == 200
+        assert (response.get_json()["accepted"], response.get_json()["duplicates"]) == (1, 2)
+        assert self.db.fetchone("SELECT COUNT(*) FROM dht22_readings") == (3,)
+        assert self.client.post("/dht22", data="22.5,60,41.2,OK", headers={"X-Sequence": "-1"}).status_code == 400
+
+    def test_window_requires_positive_seconds(self):
+        assert self.client.get("/dht22/window").status_code == 400
+        assert self.client.get("/dht22/window?seconds=-5").status_code == 400
+
+    def test_history_served_from_rollups(self):
+        """Batch-ingested readings are available as 1-minute buckets on /history."""
+        body = f"{T0 + 20},22.0,60.0,41.0,OK\n{T0 + 50},24.0,60.0,42.0,OK\n{T0 + 90},23.0,60.0,41.5,OK\n"
+        self.client.post("/dht22/batch", data=body, content_type="text/plain")
+
+        response = self.client.get(f"/dht22/history?field=temperature&start={T0}&end={T0 + 200}")
+        history = response.get_json()
+        assert response.status_code == 200
+        assert history["resolution"] == 60
+        assert history["mean"] == [23.0, 23.0]
+        assert history["count"] == [2, 1]
+
+    def test_history_rejects_unknown_field(self):
+        assert self.client.get("/dht22/history?field=eco2").status_code == 400
+        assert self.client.get("/dht22/history?field=temperature&points=0").status_code == 400
+
+    def test_single_reading_returns_503_when_buffer_full(self, monkeypatch):
+        """Backpressure from the write buffer surfaces as 503 + Retry-After."""
+        store = ReadingStore(self.db)
+        buffer = WriteBuffer(store, max_batch=1, max_queue=1, autostart=False)
+        routes_module = importlib.import_module("app.routes.routes")
+        monkeypatch.setattr(routes_module, "pipeline",
+                            SensorPipeline(api_key="test", server_url="http://localhost", store=store, buffer=buffer))
+
+        assert self.client.post("/dht22", data="22.5,60,41.2,OK").status_code == 200
+        response = self.client.post("/dht22", data="22.6,60,41.3,OK")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        buffer.flush()
+        assert self.db.fetchone("SELECT COUNT(*) FROM dht22_readings") == (1,)
+
+    def test_failed_writer_write_returns_503(self, monkeypatch):
+        """A write the storage writer received but couldn't store is retried by the Pico, not a 500."""
+        routes_module = importlib.import_module("app.routes.routes")
+
+        def failing(raw_txt, device="default", seq=None):
+            raise WriterError("no such table: dht22_readings_p20240527")
+
+        monkeypatch.setattr(routes_module.pipeline, "update_dht22_batch", failing)
+        response = self.client.post("/dht22/batch", data=f"{T0},22.5,60.0,41.2,OK")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -1,5 +1,6 @@
-from app_logging.decorators.log_decorator import LogDecorator
-from app_logging.log_utils import Logger
+from app_logging.decorators.log_decorator import LogDecorator, RateLimiter
+from app_logging.log_utils import Logger, DroppingQueueHandler
+import logging
 import pytest
 import os
 import tempfile
@@ -122,6 +123,60 @@ class TestLogger:
         result = no_debug_function(5)
         assert result == 15
 
+    def test_log_decorator_sampling(self, caplog):
+        """Only every Nth call is logged, but every failure is."""
+        decorator = LogDecorator(debug_enabled=False)
+
+        @decorator.log_this(sample_every=3)
+        def hot_function(fail=False):
+            if fail:
+                raise ValueError("boom")
+            return 1
+
+        with caplog.at_level(logging.DEBUG, logger="AppLogger"):
+            for _ in range(6):
+                hot_function()
+            with pytest.raises(ValueError):
+                hot_function(fail=True)
+
+        completed = [r for r in caplog.records if "was completed" in r.getMessage()]
+        failed = [r for r in caplog.records if "failed with error" in r.getMessage()]
+        assert len(completed) == 2
+        assert len(failed) == 1
+
+    def test_rate_limiter_caps_burst(self):
+        limiter = RateLimiter(rate=3)
+        assert [limiter.allow() for _ in range(5)] == [True, True, True, False, False]
+
+
+class TestAsyncLogger:
+    """Test suite for the queue-backed (async) logging mode."""
+
+    def test_async_logger_writes_after_shutdown(self, tmp_path):
+        log_file = tmp_path / "async.log"
+        logger = Logger(log_file=str(log_file), async_mode=True, name="AsyncTestLogger").get_logger()
+        assert isinstance(logger.handlers[0], DroppingQueueHandler)
+
+        for i in range(100):
+            logger.info("reading %d accepted", i)
+        Logger.shutdown("AsyncTestLogger")
+
+        content = log_file.read_text()
+        assert "reading 0 accepted" in content
+        assert "reading 99 accepted" in content
+
+    def test_full_queue_drops_instead_of_blocking(self, tmp_path):
+        logger = Logger(log_file=str(tmp_path / "drop.log"), async_mode=True, queue_size=1,
+                        name="DropTestLogger").get_logger()
+        handler = logger.handlers[0]
+        Logger._listeners["DropTestLogger"].stop()  # nobody drains the queue any more
+
+        logger.info("first")
+        logger.info("second")
+        logger.info("third")
+        assert handler.dropped == 2
+        Logger._listeners.pop("DropTestLogger")
+
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
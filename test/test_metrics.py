@@ -0,0 +1,75 @@
+import pytest
+
+from app import create_app
+from app_logging.decorators.log_decorator import LogDecorator
+from app_logging.metrics import Histogram, MetricsRegistry
+
+
+class TestHistogram:
+    """Test suite for the fixed-bucket latency histogram."""
+
+    def test_cumulative_buckets_and_quantiles(self):
+        histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+        for seconds in (0.0005, 0.0005, 0.005, 0.05, 2.0):
+            histogram.observe(seconds)
+
+        cumulative, total, count = histogram.snapshot()
+        assert cumulative == [2, 3, 4, 5]
+        assert count == 5
+        assert total == pytest.approx(2.056)
+        assert histogram.quantile(0.5) == 0.01
+        assert histogram.quantile(0.99) == float("inf")
+
+    def test_boundary_value_lands_in_its_bucket(self):
+        histogram = Histogram(buckets=(0.001, 0.01))
+        histogram.observe(0.001)
+        assert histogram.snapshot()[0] == [1, 1, 1]
+
+
+class TestMetricsRegistry:
+    """Test suite for the registry, the decorator hook and the Prometheus output."""
+
+    def test_decorator_records_calls_and_failures(self):
+        metrics = MetricsRegistry()
+        decorator = LogDecorator(debug_enabled=False, metrics=metrics)
+
+        @decorator.log_this(sample_every=1000)
+        def parse(fail=False):
+            if fail:
+                raise ValueError("bad payload")
+            return 1
+
+        for _ in range(3):
+            parse()
+        with pytest.raises(ValueError):
+            parse(fail=True)
+
+        name = "TestMetricsRegistry.test_decorator_records_calls_and_failures.<locals>.parse"
+        assert metrics.function_histogram(name).count == 4
+        text = metrics.render()
+        assert f'localedge_function_errors_total{{function="{name}"}} 1' in text
+        assert f'localedge_function_duration_seconds_count{{function="{name}"}} 4' in text
+
+    def test_render_request_series(self):
+        metrics = MetricsRegistry(buckets=(0.01,))
+        metrics.observe_request("/dht22", "POST", 200, 0.002)
+        text = metrics.render()
+        assert '# TYPE localedge_http_request_duration_seconds histogram' in text
+        assert 'localedge_http_request_duration_seconds_bucket{route="/dht22",method="POST",le="0.01"} 1' in text
+        assert 'localedge_http_request_duration_seconds_bucket{route="/dht22",method="POST",le="+Inf"} 1' in text
+        assert 'localedge_http_requests_total{route="/dht22",method="POST",status="200"} 1' in text
+
+    def test_metrics_endpoint_reports_routes(self):
+        client = create_app().test_client()
+        client.post("/ens160", data="400,150,2,OK")
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        body = response.get_data(as_text=True)
+        assert 'route="/ens160",method="POST",status="200"' in body
+        assert 'function="SensorPipeline.update_ens160_data"' in body
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,166 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+from aws.mqtt_client import MqttClient
+from aws.spool import DiskSpool
+
+
+class FakeMessageInfo:
+    def __init__(self, published: bool):
+        self.rc = 0
+        self._published = published
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return self._published
+
+
+class FakePahoClient:
+    """Stand-in for paho.mqtt.client.Client that records payloads instead of sending them."""
+
+    def __init__(self):
+        self.online = True
+        self.payloads = []
+
+    def connect(self, host, port):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        if self.online:
+            self.payloads.append(json.loads(payload))
+        return FakeMessageInfo(self.online)
+
+
+class TestDiskSpool:
+    """Test suite for the durable on-disk spool."""
+
+    def test_records_survive_reopen_until_acked(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spool = DiskSpool(tmp_dir)
+            spool.append_many([b"one", b"two", b"three"])
+            records, cursor = spool.read_batch(2)
+            assert records == [b"one", b"two"]
+            spool.ack(cursor, len(records))
+            spool.close()
+
+            reopened = DiskSpool(tmp_dir)
+            assert reopened.pending() == 1
+            assert reopened.read_batch(10)[0] == [b"three"]
+            reopened.close()
+
+    def test_torn_tail_is_truncated(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spool = DiskSpool(tmp_dir)
+            spool.append(b"complete")
+            spool.close()
+            with open(spool._segment_path(0), "ab") as f:
+                f.write(b"\x00\x00\x00\x10garbage")  # crash in the middle of a record
+
+            reopened = DiskSpool(tmp_dir)
+            assert reopened.pending() == 1
+            reopened.append(b"next")
+            assert reopened.read_batch(10)[0] == [b"complete", b"next"]
+            reopened.close()
+
+    def test_segments_rotate_and_are_deleted_once_acked(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spool = DiskSpool(tmp_dir, segment_bytes=32)
+            for i in range(10):
+                spool.append(f"message-{i}".encode())
+            assert len(spool._segments()) > 1
+
+            records, cursor = spool.read_batch(100)
+            assert len(records) == 10
+            spool.ack(cursor, len(records))
+            assert len(spool._segments()) == 1
+            assert spool.pending() == 0
+            spool.close()
+
+
+class TestMqttClientSpool:
+    """Test suite for spooled, batched publishing with a fake paho client."""
+
+    @pytest.fixture
+    def spool_dir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yield tmp_dir
+
+    def make_client(self, spool_dir, fake, **kwargs):
+        return MqttClient("pi5", "localhost", 8883, None, None, None, "localedge/readings",
+                          spool_dir=spool_dir, client=fake, **kwargs)
+
+    def test_messages_are_packed_into_batches(self, spool_dir):
+        fake = FakePahoClient()
+        client = self.make_client(spool_dir, fake, batch_size=3, max_in_flight=2)
+        for i in range(5):
+            client.publish(json.dumps({"temperature": 20 + i}))
+
+        assert client.drain_once() == 5
+        assert [p["count"] for p in fake.payloads] == [3, 2]
+        assert fake.payloads[0]["messages"][0] == {"temperature": 20}
+        assert client.spool.pending() == 0
+
+    def test_outage_keeps_messages_and_restart_resumes(self, spool_dir):
+        fake = FakePahoClient()
+        fake.online = False
+        client = self.make_client(spool_dir, fake)
+        client.publish("22.5,60,41.2,OK")
+        with pytest.raises(ConnectionError):
+            client.drain_once()
+        client.spool.close()
+
+        # "restart": a new client on the same spool delivers what the old one couldn't
+        fake = FakePahoClient()
+        restarted = self.make_client(spool_dir, fake)
+        assert restarted.spool.pending() == 1
+        assert restarted.drain_once() == 1
+        assert fake.payloads == [{"count": 1, "messages": ["22.5,60,41.2,OK"]}]
+
+    def test_background_drain_loop(self, spool_dir):
+        fake = FakePahoClient()
+        client = self.make_client(spool_dir, fake)
+        client.connect()
+        client.publish('{"eco2": 400}')
+
+        deadline = time.monotonic() + 5
+        while not fake.payloads and time.monotonic() < deadline:
+            time.sleep(0.01)
+        client.disconnect()
+        assert fake.payloads[0]["messages"] == [{"eco2": 400}]
+
+
+
+class TestMqttClientStartup:
+    """The cloud SDKs are imported on first use, not at startup."""
+
+    def test_import_and_injected_client_leave_sdks_unloaded(self):
+        app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+        code = ("import sys, tempfile\n"
+                "from aws.mqtt_client import MqttClient\n"
+                "MqttClient('t', 'localhost', 8883, None, None, None, 'topic',"
+                " spool_dir=tempfile.mkdtemp(), client=object())\n"
+                "print(sorted(m for m in ('boto3', 'paho') if m in sys.modules))")
+        completed = subprocess.run([sys.executable, "-c", code], cwd=app_dir, capture_output=True, text=True,
+                                   check=True)
+        assert completed.stdout.strip() == "[]"
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,130 @@
+import os
+import tempfile
+
+import pytest
+
+from storage.maintenance import StoreMaintenance
+from storage.partitions import PartitionedTable
+from storage.reading_store import ReadingStore, DHT22_COLUMNS, DHT22_TYPES
+from storage.sqlite_db import SqliteDB
+
+DAY = 86400
+MONDAY = 1716768000  # 2024-05-27 00:00 UTC
+
+
+class TestPartitionedTable:
+    """Test suite for per-day / per-week reading partitions."""
+
+    @pytest.fixture
+    def db(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "partitions.db"), pooled=True)
+            yield db
+            db.close()
+
+    @staticmethod
+    def row(ts, temperature=22.0):
+        return (ts, temperature, 50.0, 40.0, "OK")
+
+    def test_rows_are_routed_to_daily_partitions(self, db):
+        table = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES, period="day")
+        created = table.insert([self.row(MONDAY + 10), self.row(MONDAY + DAY + 10), self.row(MONDAY + 20)])
+
+        assert created == [MONDAY, MONDAY + DAY]
+        assert [name for _, name in table.partitions()] == ["dht22_readings_p20240527", "dht22_readings_p20240528"]
+        assert db.fetchone("SELECT COUNT(*) FROM dht22_readings_p20240527") == (2,)
+
+    def test_weekly_partitions_start_on_monday(self, db):
+        table = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES, period="week")
+        assert table.period_start(MONDAY + 6 * DAY + 3600) == MONDAY
+        assert table.period_start(MONDAY - 1) == MONDAY - 7 * DAY
+
+    def test_query_only_reads_overlapping_partitions(self, db):
+        table = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES, period="day")
+        table.insert([self.row(MONDAY + d * DAY + 60, temperature=20.0 + d) for d in range(5)])
+        db.execute("DROP TABLE dht22_readings_p20240527")  # a query that touched day 0 would now fail
+
+        rows = table.query(MONDAY + 2 * DAY, MONDAY + 4 * DAY)
+        assert [r[1] for r in rows] == [22.0, 23.0]
+
+    def test_drop_before_removes_whole_expired_partitions(self, db):
+        table = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES, period="day")
+        table.insert([self.row(MONDAY + d * DAY) for d in range(4)])
+
+        dropped = table.drop_before(MONDAY + 2 * DAY + 5)  # day 2 is only partly expired, it stays
+        assert dropped == ["dht22_readings_p20240527", "dht22_readings_p20240528"]
+        assert [start for start, _ in table.partitions()] == [MONDAY + 2 * DAY, MONDAY + 3 * DAY]
+
+    def test_partition_created_in_a_rolled_back_group_is_forgotten(self, db):
+        """A writer group commits several inserts at once; one failing undoes the CREATE as well."""
+        table = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES, period="day")
+        db.execute("CREATE TABLE other (v INTEGER)")
+        with pytest.raises(RuntimeError):
+            with db.transaction():
+                db.execute("INSERT INTO other (v) VALUES (1)")  # an earlier request: the group is open
+                table.insert([self.row(MONDAY)])
+                raise RuntimeError("a later request in the group failed")
+        assert table.partitions() == []
+
+        table.insert([self.row(MONDAY + 60)])  # recreated instead of "no such table"
+        assert table.query(MONDAY, MONDAY + DAY) == [self.row(MONDAY + 60)]
+
+    def test_partitions_are_rediscovered_on_reopen(self, db):
+        PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES).insert([self.row(MONDAY)])
+        reopened = PartitionedTable(db, "dht22_readings", DHT22_COLUMNS, DHT22_TYPES)
+        assert reopened.partitions() == [(MONDAY, "dht22_readings_p20240527")]
+
+
+class TestPartitionedReadingStore:
+    """ReadingStore with partition="day" and a retention policy."""
+
+    @pytest.fixture
+    def store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "store.db"), pooled=True)
+            yield ReadingStore(db, partition="day", retention_days=3)
+            db.close()
+
+    def test_maintenance_prunes_expired_partitions(self, store):
+        for d in range(6):
+            store.insert_ens160([(MONDAY + d * DAY + 60, 400.0 + d, 150.0, 2.0, "OK")])
+        assert len(store.partitions["ens160"].partitions()) == 6  # ingest never drops anything
+
+        store.maintain(now=MONDAY + 5 * DAY + 60)
+        starts = [start for start, _ in store.partitions["ens160"].partitions()]
+        assert starts == [MONDAY + d * DAY for d in (2, 3, 4, 5)]
+        assert [r[1] for r in store.readings("ens160", 0, MONDAY + 10 * DAY)] == [402.0, 403.0, 404.0, 405.0]
+
+    def test_future_dated_reading_does_not_expire_history(self, store):
+        """Retention follows the server clock: a Pico with a bogus clock can't drop anything."""
+        for d in range(3):
+            store.insert_ens160([(MONDAY + d * DAY + 60, 400.0 + d, 150.0, 2.0, "OK")])
+        store.insert_ens160([(MONDAY + 365 * DAY, 999.0, 150.0, 2.0, "OK")])
+
+        StoreMaintenance(store, autostart=False).run_once(now=MONDAY + 3 * DAY)
+        assert [r[1] for r in store.readings("ens160", 0, MONDAY + 3 * DAY)] == [400.0, 401.0, 402.0]
+
+    def test_retention_applies_to_rollups(self, store):
+        """The 1-minute buckets would otherwise outgrow the raw data the disk cap is about."""
+        store.insert_dht22([(MONDAY + 60, 21.0, 50.0, 40.0, "OK"), (MONDAY + 4 * DAY + 60, 25.0, 50.0, 40.0, "OK")])
+        store.prune(now=MONDAY + 5 * DAY + 60)
+
+        assert store.readings("dht22", 0, MONDAY + DAY) == []
+        assert store.history("dht22", "temperature", MONDAY, MONDAY + DAY)["mean"] == []
+        assert store.history("dht22", "temperature", MONDAY + 4 * DAY, MONDAY + 5 * DAY)["mean"] == [25.0]
+        oldest = store.db.fetchone("SELECT MIN(bucket) FROM reading_rollups")[0]
+        assert oldest >= MONDAY + 2 * DAY + 60 - 86400  # no bucket ends before the cutoff
+
+    def test_unpartitioned_rows_are_migrated_once(self, store):
+        """A database from before partition="day": its single tables are moved into partitions."""
+        ReadingStore(store.db).insert_dht22([(MONDAY + 60, 21.0, 50.0, 40.0, "OK"),
+                                             (MONDAY + DAY + 60, 22.0, 50.0, 40.0, "OK")])
+        store.insert_dht22([(MONDAY + DAY + 120, 23.0, 50.0, 40.0, "OK")])
+
+        result = store.maintain(now=MONDAY + DAY + 180)
+        assert result["migrated"] == 2
+        assert [r[1] for r in store.readings("dht22", MONDAY, MONDAY + 2 * DAY)] == [21.0, 22.0, 23.0]
+        assert store.columns("dht22", ("temperature",), MONDAY, MONDAY + 2 * DAY)["temperature"].tolist() == [
+            21.0, 22.0, 23.0]
+        assert store.db.fetchone("SELECT COUNT(*) FROM sqlite_master WHERE name = 'dht22_readings'") == (0,)
+        assert store.maintain(now=MONDAY + DAY + 180)["migrated"] == 0
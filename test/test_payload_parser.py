@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from sensor_manager.payload_parser import (DHT22_SCHEMA, ENS160_SCHEMA, PayloadError, Status, parse_block,
+                                           parse_reading)
+
+
+class TestParseReading:
+    """Test suite for the single-reading fast path."""
+
+    def test_values_are_typed(self):
+        ts, temperature, humidity, average, status = parse_reading(DHT22_SCHEMA, "22.5,60,41.2,OK")
+        assert ts is None
+        assert (temperature, humidity, average) == (22.5, 60.0, 41.2)
+        assert status is Status.OK
+
+    def test_timestamped_reading(self):
+        ts, *_ = parse_reading(ENS160_SCHEMA, "1717000000,400,150,2,ok", timestamped=True)
+        assert ts == 1717000000.0
+
+    def test_unknown_status_maps_to_unknown(self):
+        assert parse_reading(DHT22_SCHEMA, "22.5,60,41.2,SPICY")[-1] is Status.UNKNOWN
+
+    @pytest.mark.parametrize("payload", ["temp=25.5,humidity=60.2", "22.5,60,OK", "22.5,nan,41.2,OK", ""])
+    def test_malformed_payload_raises(self, payload):
+        with pytest.raises(PayloadError):
+            parse_reading(DHT22_SCHEMA, payload)
+
+
+class TestParseBlock:
+    """Test suite for the vectorized block parser."""
+
+    def test_block_becomes_typed_columns(self):
+        block = parse_block(ENS160_SCHEMA, "1717000000,400,150,2,OK\n1717000001,410,155,3,WARNING\n",
+                            now=1717000000)
+        assert len(block) == 2
+        assert block.errors == []
+        assert block.columns["timestamp"].dtype == np.float64
+        assert block.columns["eco2"].dtype == np.float32
+        assert block.columns["eco2"].tolist() == [400.0, 410.0]
+        assert block.columns["status"].tolist() == [0, 1]
+        assert block.rows()[1] == (1717000001.0, 410.0, 155.0, 3.0, "WARNING")
+
+    def test_malformed_lines_are_reported_not_dropped(self):
+        text = "1,22.5,60,41.2,OK\n2,22.5,60\n3,abc,60,41.2,OK\n\n5,22.5,inf,41.2,OK\n6,23.0,61,42,OK"
+        block = parse_block(DHT22_SCHEMA, text, now=0)
+        assert block.columns["timestamp"].tolist() == [1.0, 6.0]
+        assert [e["index"] for e in block.errors] == [1, 2, 4]
+
+    def test_implausible_timestamps_are_rejected(self):
+        """A year ahead, milliseconds or older than the spool window: reported, never stored."""
+        now = 1717000000
+        text = (f"{now + 365 * 86400},22.5,60,41.2,OK\n{now * 1000},22.5,60,41.2,OK\n"
+                f"{now - 30 * 86400},22.5,60,41.2,OK\n{now - 3600},22.5,60,41.2,OK\n{now + 600},22.5,60,41.2,OK")
+        block = parse_block(DHT22_SCHEMA, text, now=now)
+        assert block.columns["timestamp"].tolist() == [now - 3600, now + 600]
+        assert [e["index"] for e in block.errors] == [0, 1, 2]
+        assert "milliseconds" in block.errors[1]["error"]
+
+    def test_batch_rows_store_the_same_values_as_single_readings(self):
+        """float32 is for the analytic columns only: 22.6 must not be stored as 22.600000381469727."""
+        block = parse_block(DHT22_SCHEMA, "1717000000,22.6,60.3,41.7,OK", now=1717000000)
+        assert block.columns["temperature"].dtype == np.float32
+        _, *values, status = parse_reading(DHT22_SCHEMA, "22.6,60.3,41.7,OK")
+        assert block.rows() == [(1717000000.0, *values, status.value)] == [(1717000000.0, 22.6, 60.3, 41.7, "OK")]
+
+    def test_empty_block(self):
+        block = parse_block(DHT22_SCHEMA, "")
+        assert len(block) == 0
+        assert block.rows() == []
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app_logging import request_timing
+from app_logging.decorators.log_decorator import LogDecorator
+from app_logging.metrics import MetricsRegistry
+from app_logging.profiler import ProfilerBusyError, SamplingProfiler, collapse
+from configbox.configuration import Configuration
+
+
+class TestRequestTiming:
+    """Test suite for the per-request phase timings."""
+
+    def test_phases_only_recorded_inside_a_request(self):
+        metrics = MetricsRegistry()
+        decorator = LogDecorator(debug_enabled=False, metrics=metrics)
+        store = decorator.time_this(lambda: time.sleep(0.002), phase="storage")
+
+        store()  # no request open: metrics only
+        token = request_timing.begin()
+        store()
+        store()
+        phases = request_timing.finish(token)
+
+        assert set(phases) == {"storage"}
+        assert phases["storage"] >= 0.004
+        assert metrics.function_histogram("TestRequestTiming.test_phases_only_recorded_inside_a_request.<locals>.<lambda>").count == 3
+
+    def test_log_this_phase_and_logging_time(self):
+        decorator = LogDecorator(debug_enabled=False, metrics=MetricsRegistry())
+
+        @decorator.log_this(phase="parsing")
+        def parse():
+            return 1
+
+        token = request_timing.begin()
+        parse()
+        phases = request_timing.finish(token)
+        assert {"parsing", "logging"} <= set(phases)
+
+    def test_server_timing_header_and_metrics(self):
+        client = create_app().test_client()
+        response = client.post("/dht22/batch", data=f"{time.time():.0f},22.5,60.0,41.2,OK", content_type="text/plain")
+        timing = response.headers["Server-Timing"]
+        names = [entry.split(";")[0] for entry in timing.split(", ")]
+        assert names[0] == "parsing"
+        assert "storage" in names
+        assert names[-1] == "total"
+
+        body = client.get("/metrics").get_data(as_text=True)
+        assert 'localedge_http_request_phase_seconds_count{route="/dht22/batch",phase="parsing"}' in body
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfiler:
+    """Test suite for the sampling profiler and its admin endpoint."""
+
+    def test_samples_other_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            stacks = SamplingProfiler(interval=0.002).profile(0.2)
+        finally:
+            stop.set()
+            worker.join()
+
+        busy = {stack: count for stack, count in stacks.items() if stack.startswith("busy-worker;")}
+        assert sum(busy.values()) > 10
+        assert all("test_profiling.busy_loop" in stack for stack in busy)
+        assert collapse({"a;b": 2, "a;c": 5}) == "a;c 5\na;b 2\n"
+
+    def test_one_profile_at_a_time(self):
+        results = []
+        first = threading.Thread(target=lambda: results.append(SamplingProfiler().profile(0.3)))
+        first.start()
+        time.sleep(0.05)
+        with pytest.raises(ProfilerBusyError):
+            SamplingProfiler().profile(0.1)
+        first.join()
+        assert len(results) == 1
+
+    def test_admin_endpoint_requires_token(self, monkeypatch):
+        client = create_app().test_client()
+        monkeypatch.setattr(Configuration, "_cache", {})
+
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        Configuration.reload()
+        assert client.get("/admin/profile?seconds=0.1").status_code == 403
+
+        monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+        Configuration.reload()
+        response = client.get("/admin/profile?seconds=0.1", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+        assert client.get("/admin/profile?seconds=600", headers={"Authorization": "Bearer s3cret"}).status_code == 400
+
+        response = client.get("/admin/profile?seconds=0.1&interval=0.005&format=json",
+                              headers={"Authorization": "Bearer s3cret"})
+        profile = response.get_json()
+        assert response.status_code == 200
+        assert profile["samples"] == sum(profile["stacks"].values())
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
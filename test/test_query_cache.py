@@ -0,0 +1,173 @@
+import importlib
+import os
+import tempfile
+import time
+
+import numpy as np
+import pytest
+
+from app import create_app
+from sensor_manager.sensor_pipeline import SensorPipeline
+from storage.archive import ColumnarArchive
+from storage.query_cache import QueryCache, estimate_size
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+
+DAY = 1717027200  # 2024-05-30 00:00 UTC
+TODAY = int(time.time()) // 86400 * 86400  # uploads through the API must be near the server clock
+
+
+class Counter:
+    def __init__(self, value=None):
+        self.calls = 0
+        self.value = value
+
+    def __call__(self):
+        self.calls += 1
+        return self.value if self.value is not None else {"n": self.calls}
+
+
+class TestQueryCache:
+    """LRU + TTL cache with per-sensor, per-range invalidation."""
+
+    def test_second_read_is_a_hit(self):
+        cache, compute = QueryCache(), Counter()
+        assert cache.get_or_compute(("q",), ("dht22",), 0, 100, compute) == {"n": 1}
+        assert cache.get_or_compute(("q",), ("dht22",), 0, 100, compute) == {"n": 1}
+        assert compute.calls == 1
+        assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache, compute = QueryCache(ttl=0.05), Counter()
+        cache.get_or_compute(("q",), ("dht22",), 0, 100, compute)
+        time.sleep(0.1)
+        assert cache.get_or_compute(("q",), ("dht22",), 0, 100, compute) == {"n": 2}
+
+    def test_invalidation_is_targeted(self):
+        cache = QueryCache()
+        for key, sensor, start, end in (("a", "dht22", 0, 100), ("b", "dht22", 200, 300), ("c", "ens160", 0, 100)):
+            cache.get_or_compute((key,), (sensor,), start, end, Counter())
+
+        assert cache.invalidate("dht22", 50, 60) == 1
+        assert cache.invalidate("dht22", 100, 150) == 0  # end is exclusive
+        compute = Counter()
+        for key, sensor, start, end in (("b", "dht22", 200, 300), ("c", "ens160", 0, 100)):
+            cache.get_or_compute((key,), (sensor,), start, end, compute)
+        assert compute.calls == 0
+        cache.get_or_compute(("a",), ("dht22",), 0, 100, compute)
+        assert compute.calls == 1
+
+    def test_least_recently_used_is_evicted_above_the_cap(self):
+        value = np.zeros(1000)  # ~8 kB each
+        cache = QueryCache(max_bytes=3 * estimate_size(value))
+        for key in "abc":
+            cache.get_or_compute((key,), ("dht22",), 0, 1, Counter(value))
+        cache.get_or_compute(("a",), ("dht22",), 0, 1, Counter(value))  # a is now the most recent
+        cache.get_or_compute(("d",), ("dht22",), 0, 1, Counter(value))
+
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] <= cache.max_bytes
+        compute = Counter(value)
+        cache.get_or_compute(("a",), ("dht22",), 0, 1, compute)
+        assert compute.calls == 0
+        cache.get_or_compute(("b",), ("dht22",), 0, 1, compute)
+        assert compute.calls == 1
+
+    def test_result_computed_across_a_write_is_not_kept(self):
+        cache = QueryCache()
+
+        def racing_compute():
+            cache.invalidate("dht22", 10, 10)  # a write commits while the query runs
+            return {"stale": True}
+
+        assert cache.get_or_compute(("q",), ("dht22",), 0, 100, racing_compute) == {"stale": True}
+        assert cache.stats()["entries"] == 0
+
+    def test_align_rounds_up_to_the_bucket(self):
+        assert QueryCache(bucket_seconds=60).align(DAY + 1) == DAY + 60
+        assert QueryCache(bucket_seconds=60).align(DAY) == DAY
+
+
+class TestCachedReadingStore:
+    """ReadingStore serves history / resample from the cache until an ingest lands in range."""
+
+    @pytest.fixture
+    def store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "cache.db"), pooled=True)
+            yield ReadingStore(db, partition="day", cache=QueryCache())
+            db.close()
+
+    def test_ingest_invalidates_only_overlapping_history(self, store):
+        store.insert_dht22([(DAY + 30, 22.0, 60.0, 41.0, "OK")])
+        today = store.history("dht22", "temperature", DAY, DAY + 3600)
+        tomorrow = store.history("dht22", "temperature", DAY + 86400, DAY + 90000)
+        assert today["mean"] == [22.0]
+
+        store.insert_dht22([(DAY + 40, 24.0, 60.0, 41.0, "OK")])
+        assert store.history("dht22", "temperature", DAY, DAY + 3600)["mean"] == [23.0]
+        assert store.history("dht22", "temperature", DAY + 86400, DAY + 90000) is tomorrow
+        assert store.cache.stats()["invalidations"] == 1
+
+    def test_sequenced_duplicates_do_not_invalidate(self, store):
+        rows = [(DAY + 30, 22.0, 60.0, 41.0, "OK")]
+        store.insert_sequenced("dht22", rows, "kitchen", [1])
+        store.resample(["dht22.temperature"], DAY, DAY + 120, 60)
+        store.insert_sequenced("dht22", rows, "kitchen", [1])
+        assert store.cache.stats()["invalidations"] == 0
+        assert store.resample(["dht22.temperature"], DAY, DAY + 120, 60)["dht22.temperature"][0] == 22.0
+
+    def test_maintenance_invalidates_dropped_and_archived_ranges(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "cache.db"), pooled=True)
+            store = ReadingStore(db, partition="day", retention_days=3, cache=QueryCache(),
+                                 archive=ColumnarArchive(os.path.join(tmp_dir, "archive")), archive_after_days=1)
+            store.insert_dht22([(DAY + 30, 22.0, 60.0, 41.0, "OK")])
+            assert store.resample(["dht22.temperature"], DAY, DAY + 120, 60)["dht22.temperature"][0] == 22.0
+
+            assert store.compact(now=DAY + 2 * 86400 + 60)  # archived: the answer is recomputed from the archive
+            assert store.cache.stats()["invalidations"] == 1
+            assert store.resample(["dht22.temperature"], DAY, DAY + 120, 60)["dht22.temperature"][0] == 22.0
+
+            assert store.prune(now=DAY + 4 * 86400 + 60)  # expired: the cached answer must not outlive the data
+            assert np.isnan(store.resample(["dht22.temperature"], DAY, DAY + 120, 60)["dht22.temperature"][0])
+            db.close()
+
+
+class TestConditionalResponses:
+    """GET /history and /resample carry an ETag and answer If-None-Match with 304."""
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "etag.db"), pooled=True)
+            routes_module = importlib.import_module("app.routes.routes")
+            self.store = ReadingStore(db, cache=QueryCache())
+            monkeypatch.setattr(routes_module, "pipeline",
+                                SensorPipeline(api_key="test", server_url="http://localhost", store=self.store))
+            app = create_app()
+            app.config['TESTING'] = True
+            self.client = app.test_client()
+            yield
+            db.close()
+
+    @pytest.mark.parametrize("url", [f"/dht22/history?field=temperature&start={TODAY}&end={TODAY + 3600}",
+                                     f"/resample?series=dht22.temperature&start={TODAY}&end={TODAY + 300}&step=60",
+                                     f"/resample?series=dht22.temperature&start={TODAY}&end={TODAY + 300}&format=csv"])
+    def test_unchanged_data_returns_304(self, url):
+        self.client.post("/dht22/batch", data=f"{TODAY + 30},22.0,60.0,41.0,OK")
+        first = self.client.get(url)
+        assert first.status_code == 200 and first.headers["ETag"]
+
+        again = self.client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304
+        assert again.data == b""
+
+        self.client.post("/dht22/batch", data=f"{TODAY + 40},24.0,60.0,41.0,OK")
+        changed = self.client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != first.headers["ETag"]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
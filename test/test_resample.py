@@ -0,0 +1,123 @@
+import importlib
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from app import create_app
+from sensor_manager.sensor_pipeline import SensorPipeline
+from storage.archive import ColumnarArchive
+from storage.reading_store import ReadingStore
+from storage.resample import aggregate, fill_gaps, grid, resample
+from storage.sqlite_db import SqliteDB
+
+DAY = 86400
+MONDAY = 1716768000  # 2024-05-27 00:00 UTC
+
+
+class TestResample:
+    """Test suite for the vectorized grid aggregation and gap filling."""
+
+    TS = np.array([0.0, 10.0, 70.0, 130.0, 135.0, 400.0])
+    VALUES = np.array([1.0, 3.0, 5.0, 7.0, np.nan, 9.0])
+
+    def test_aggregations(self):
+        expected = {"mean": [2, 5, 7, 9], "min": [1, 5, 7, 9], "max": [3, 5, 7, 9], "last": [3, 5, 7, 9]}
+        for how, values in expected.items():
+            result = aggregate(self.TS, self.VALUES, 0, 60, 8, how)
+            assert result[[0, 1, 2, 6]].tolist() == values
+            assert np.isnan(result[[3, 4, 5, 7]]).all()  # empty steps, the NaN reading is ignored
+
+    def test_unsorted_input_and_out_of_range_readings(self):
+        result = aggregate(np.array([70.0, 10.0, 0.0, -5.0, 480.0]), np.array([5.0, 3.0, 1.0, 99.0, 99.0]),
+                           0, 60, 8, "last")
+        assert result[:2].tolist() == [3.0, 5.0]
+
+    def test_fills_respect_max_gap(self):
+        values = aggregate(self.TS, self.VALUES, 0, 60, 8, "mean")
+        assert fill_gaps(values, "ffill", 2)[3:].tolist()[:2] == [7.0, 7.0]
+        assert np.isnan(fill_gaps(values, "ffill", 2)[5])
+        assert fill_gaps(values, "linear", 5)[3:6].tolist() == [7.5, 8.0, 8.5]
+        assert np.isnan(fill_gaps(values, "linear", 3)[3:6]).all()  # 4 steps between the known values
+        assert np.isnan(fill_gaps(values, "linear")[7])  # never extrapolated
+
+    def test_series_share_one_grid(self):
+        result = resample({"a": (self.TS, self.VALUES), "b": (np.array([65.0]), np.array([1.0]))}, 0, 480, 60)
+        assert result["timestamp"].tolist() == grid(0, 480, 60).tolist() == [0, 60, 120, 180, 240, 300, 360, 420]
+        assert len(result["a"]) == len(result["b"]) == 8
+        with pytest.raises(ValueError):
+            resample({"a": (self.TS, self.VALUES)}, 0, 480, 60, how="median")
+
+
+class TestStoreResample:
+    """Bulk column reads across partitions and the archive."""
+
+    @pytest.fixture
+    def store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "store.db"), pooled=True)
+            archive = ColumnarArchive(os.path.join(tmp_dir, "archive"))
+            yield ReadingStore(db, partition="day", archive=archive, archive_after_days=1)
+            db.close()
+
+    def test_columns_merge_both_tiers(self, store):
+        for d in range(3):
+            store.insert_dht22([(MONDAY + d * DAY + 60, 20.0 + d, 50.0, None, "OK")])
+        store.compact(now=MONDAY + 2 * DAY + 60)
+        assert store.archive.periods("dht22") == [MONDAY]
+
+        columns = store.columns("dht22", ("temperature", "average"), MONDAY, MONDAY + 3 * DAY)
+        assert columns["temperature"].tolist() == [20.0, 21.0, 22.0]
+        assert np.isnan(columns["average"][1:]).all()  # NULL in SQLite
+        with pytest.raises(ValueError):
+            store.columns("dht22", ("eco2",), MONDAY, MONDAY + DAY)
+
+    def test_sensors_are_joined(self, store):
+        store.insert_dht22([(MONDAY + 10, 20.0, 50.0, 40.0, "OK"), (MONDAY + 130, 22.0, 52.0, 40.0, "OK")])
+        store.insert_ens160([(MONDAY + 70, 400.0, 100.0, 2.0, "OK")])
+
+        result = store.resample(["dht22.temperature", "ens160.eco2"], MONDAY, MONDAY + 180, 60, fill="linear")
+        assert result["dht22.temperature"].tolist() == [20.0, 21.0, 22.0]
+        assert np.isnan(result["ens160.eco2"][[0, 2]]).all() and result["ens160.eco2"][1] == 400.0
+
+
+class TestResampleApi:
+    """Tests for GET /resample."""
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, monkeypatch):
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        tmp.close()
+        store = ReadingStore(SqliteDB(db_path=tmp.name))
+        store.insert_dht22([(MONDAY + 10, 20.0, 50.0, 40.0, "OK"), (MONDAY + 250, 24.0, 50.0, 40.0, "OK")])
+        routes_module = importlib.import_module("app.routes.routes")
+        monkeypatch.setattr(routes_module, "pipeline",
+                            SensorPipeline(api_key="test", server_url="http://localhost", store=store))
+        self.client = create_app().test_client()
+        yield
+        os.unlink(tmp.name)
+
+    def test_json_with_gaps_as_null(self):
+        response = self.client.get(f"/resample?series=dht22.temperature&start={MONDAY}&end={MONDAY + 300}"
+                                   "&step=1m&fill=ffill&max_gap=1m")
+        assert response.status_code == 200
+        assert response.get_json()["series"]["dht22.temperature"] == [20.0, 20.0, None, None, 24.0]
+
+    def test_csv_export(self):
+        response = self.client.get(f"/resample?series=dht22.temperature,dht22.humidity&start={MONDAY}"
+                                   f"&end={MONDAY + 120}&step=60&format=csv")
+        assert response.mimetype == "text/csv"
+        assert response.get_data(as_text=True).splitlines() == [
+            "timestamp,dht22.temperature,dht22.humidity", f"{MONDAY}.0,20.0,50.0", f"{MONDAY + 60}.0,,"]
+
+    def test_bad_requests(self):
+        assert self.client.get("/resample").status_code == 400
+        assert self.client.get("/resample?series=dht22.temperature&step=soon").status_code == 400
+        assert self.client.get("/resample?series=dht22.temperature&step=1s&start=0&end=1e9").status_code == 400
+        assert self.client.get("/resample?series=dht22.nope").status_code == 400
+        assert self.client.get("/resample?series=dht22.temperature&fill=cubic").status_code == 400
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
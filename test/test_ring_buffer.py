@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from sensor_manager.ring_buffer import SensorRingBuffer
+
+
+class TestSensorRingBuffer:
+    """Test suite for the array-backed SensorRingBuffer."""
+
+    @pytest.fixture
+    def ring(self):
+        return SensorRingBuffer(("temperature", "humidity"), capacity=4)
+
+    def test_latest_empty_returns_none(self, ring):
+        assert ring.latest() is None
+        assert len(ring.window(60, now=100.0)["timestamp"]) == 0
+
+    def test_latest_returns_newest_reading(self, ring):
+        ring.append(1.0, (20.0, 50.0))
+        ring.append(2.0, (21.0, 51.0))
+        assert ring.latest() == {"timestamp": 2.0, "temperature": 21.0, "humidity": 51.0}
+
+    def test_window_after_wraparound_is_an_ordered_copy(self, ring):
+        """Once the ring wraps, the window still comes back in order, detached from the ring."""
+        for i in range(10):
+            ring.append(float(i), (float(i), float(i) * 2))
+
+        window = ring.window(seconds=100, now=9.0)
+        assert window["timestamp"].tolist() == [6.0, 7.0, 8.0, 9.0]
+        assert window["temperature"].tolist() == [6.0, 7.0, 8.0, 9.0]
+        assert window["humidity"].dtype == np.float32
+        assert not np.shares_memory(window["temperature"], ring._columns["temperature"])
+
+        ring.append(10.0, (10.0, 20.0))  # a later append can't tear a window already handed out
+        assert window["temperature"].tolist() == [6.0, 7.0, 8.0, 9.0]
+
+    def test_window_filters_by_seconds(self, ring):
+        for i in range(4):
+            ring.append(float(i), (float(i), 0.0))
+        assert ring.window(seconds=1.5, now=3.0)["timestamp"].tolist() == [2.0, 3.0]
+
+    def test_memory_is_constant(self, ring):
+        nbytes = ring._ts.nbytes
+        for i in range(1000):
+            ring.append(float(i), (1.0, 2.0))
+        assert len(ring) == 4
+        assert ring._ts.nbytes == nbytes
+
+    def test_out_of_order_reading_is_skipped(self, ring):
+        ring.append(5.0, (1.0, 1.0))
+        assert ring.append(4.0, (2.0, 2.0)) is False
+        assert ring.latest()["timestamp"] == 5.0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+import pytest
+
+from storage.reading_store import ReadingStore, DHT22_TABLE
+from storage.rollups import RollupStore
+from storage.sqlite_db import SqliteDB
+
+
+class TestRollupStore:
+    """Test suite for the incrementally maintained 1m/1h/1d rollups."""
+
+    @pytest.fixture
+    def store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "rollups.db"), pooled=True)
+            yield ReadingStore(db)
+            db.close()
+
+    def test_insert_updates_every_resolution(self, store):
+        """One insert fills the minute, hour and day buckets with min/max/mean/count/last."""
+        store.insert_dht22([(1717000020.0, 22.0, 60.0, 41.0, "OK"),
+                            (1717000050.0, 24.0, 61.0, 42.0, "OK")])
+
+        for resolution in (60, 3600, 86400):
+            result = store.rollups.query("dht22", "temperature", 1716940800, 1717027200, resolution=resolution)
+            assert result["min"] == [22.0]
+            assert result["max"] == [24.0]
+            assert result["mean"] == [23.0]
+            assert result["count"] == [2]
+            assert result["last"] == [24.0]
+
+    def test_later_batches_merge_into_existing_buckets(self, store):
+        """Buckets are updated in place; a late reading doesn't replace the newest "last"."""
+        store.insert_ens160([(1717000020.0, 400.0, 150.0, 2.0, "OK")])
+        store.insert_ens160([(1717000050.0, 500.0, 170.0, 3.0, "OK")])
+        store.insert_ens160([(1717000030.0, 300.0, 140.0, 1.0, "OK")])  # arrives late
+
+        result = store.rollups.query("ens160", "eco2", 1717000020, 1717000080, resolution=60)
+        assert result["min"] == [300.0]
+        assert result["max"] == [500.0]
+        assert result["count"] == [3]
+        assert result["mean"] == [400.0]
+        assert result["last"] == [500.0]
+
+    def test_query_picks_finest_resolution_within_budget(self):
+        day = 86400
+        assert RollupStore.pick_resolution(0, 3600, max_points=500) == 60
+        assert RollupStore.pick_resolution(0, day, max_points=500) == 3600
+        assert RollupStore.pick_resolution(0, 365 * day, max_points=500) == 86400
+        assert RollupStore.pick_resolution(0, 3650 * day, max_points=500) == 86400  # coarsest is the floor
+
+    def test_query_rejects_unknown_field(self, store):
+        with pytest.raises(ValueError):
+            store.history("dht22", "eco2", 0, 60)
+
+    def test_rebuild_matches_incremental_rollups(self, store):
+        """Recomputing from the raw table gives the same buckets the inserts produced."""
+        rows = [(1717000000.0 + i * 17, 20.0 + (i % 7), 50.0, 40.0, "OK") for i in range(500)]
+        store.insert_dht22(rows[:250])
+        store.insert_dht22(rows[250:])
+        incremental = store.rollups.query("dht22", "temperature", 1716940800, 1717027200, resolution=60)
+
+        assert store.rollups.rebuild("dht22", DHT22_TABLE, chunk_size=64) == 500
+        rebuilt = store.rollups.query("dht22", "temperature", 1716940800, 1717027200, resolution=60)
+        assert rebuilt == incremental
+        assert sum(rebuilt["count"]) == 500
@@ -0,0 +1,201 @@
+import io
+import json
+import os
+import sqlite3
+import tempfile
+
+import pytest
+from botocore.exceptions import ClientError
+
+from aws.s3_backup import SnapshotBackup
+from storage.archive import ColumnarArchive
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client calls SnapshotBackup makes."""
+
+    def __init__(self):
+        self.objects = {}  # (bucket, key) -> bytes
+        self.uploads = {}  # upload id -> {"key": ..., "parts": {n: bytes}}
+        self.calls = []
+        self.fail_after_parts = None  # raise after this many upload_part/upload_part_copy calls
+
+    def _part_call(self, name):
+        self.calls.append(name)
+        if self.fail_after_parts is not None:
+            if self.fail_after_parts == 0:
+                raise ConnectionError("uplink dropped")
+            self.fail_after_parts -= 1
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {"key": Key, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._part_call("upload_part")
+        self.uploads[UploadId]["parts"][PartNumber] = bytes(Body)
+        return {"ETag": f'"{PartNumber}-{len(Body)}"'}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange):
+        self._part_call("upload_part_copy")
+        start, end = (int(x) for x in CopySourceRange[len("bytes="):].split("-"))
+        data = self.objects[(CopySource["Bucket"], CopySource["Key"])][start:end + 1]
+        self.uploads[UploadId]["parts"][PartNumber] = data
+        return {"CopyPartResult": {"ETag": f'"{PartNumber}-{len(data)}"'}}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        if UploadId not in self.uploads:
+            raise ClientError({"Error": {"Code": "NoSuchUpload"}}, "ListParts")
+        parts = [{"PartNumber": n, "ETag": f'"{n}-{len(data)}"'}
+                 for n, data in sorted(self.uploads[UploadId]["parts"].items()) if n > PartNumberMarker]
+        return {"Parts": parts, "IsTruncated": False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(upload["parts"][p["PartNumber"]] for p in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+CHUNK = 16 * 1024  # tiny parts so a small test database spans many of them
+DAY = 86400
+MONDAY = 1716768000  # 2024-05-27 00:00 UTC
+
+
+class TestSnapshotBackup:
+    """Test suite for the incremental S3 snapshot backup."""
+
+    @pytest.fixture
+    def env(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "live.db")
+            db = SqliteDB(db_path=db_path, pooled=True)
+            db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, payload BLOB)")
+            db.executemany("INSERT INTO t (payload) VALUES (?)", [(os.urandom(200),) for _ in range(1000)])
+            s3 = FakeS3Client()
+            backup = SnapshotBackup(db_path, "bucket", "localedge/test", os.path.join(tmp_dir, "backup"),
+                                    s3=s3, chunk_bytes=CHUNK)
+            yield db, s3, backup, tmp_dir
+            db.close()
+
+    @staticmethod
+    def rows(path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_first_backup_uploads_everything_and_restores(self, env):
+        db, s3, backup, tmp_dir = env
+        summary = backup.run()
+
+        assert summary["copied"] == 0
+        assert summary["uploaded"] == summary["parts"] > 1
+        latest = json.loads(s3.objects[("bucket", "localedge/test/latest.json")])
+        assert latest["key"] == summary["key"]
+
+        restored = os.path.join(tmp_dir, "restored.db")
+        assert backup.restore(restored) == summary["key"]
+        assert self.rows(restored) == 1000
+
+    def test_second_backup_only_uploads_changed_chunks(self, env):
+        db, s3, backup, tmp_dir = env
+        first = backup.run()
+        db.executemany("INSERT INTO t (payload) VALUES (?)", [(os.urandom(200),) for _ in range(10)])
+        second = backup.run()
+
+        assert second["key"] != first["key"]
+        assert second["copied"] > 0
+        assert second["uploaded"] < first["uploaded"]
+
+        restored = os.path.join(tmp_dir, "restored.db")
+        backup.restore(restored)
+        assert self.rows(restored) == 1010
+
+    def test_interrupted_backup_resumes_without_resending_parts(self, env):
+        db, s3, backup, tmp_dir = env
+        s3.fail_after_parts = 3
+        with pytest.raises(ConnectionError):
+            backup.run()
+
+        s3.fail_after_parts = None
+        s3.calls.clear()
+        summary = backup.run()
+        assert len(s3.calls) == summary["parts"] - 3  # the three finished parts were not sent again
+        restored = os.path.join(tmp_dir, "restored.db")
+        backup.restore(restored)
+        assert self.rows(restored) == 1000
+
+    def test_expired_upload_starts_over(self, env):
+        db, s3, backup, tmp_dir = env
+        s3.fail_after_parts = 1
+        with pytest.raises(ConnectionError):
+            backup.run()
+        s3.uploads.clear()  # S3 lifecycle rule aborted the incomplete upload
+
+        s3.fail_after_parts = None
+        summary = backup.run()
+        restored = os.path.join(tmp_dir, "restored.db")
+        assert backup.restore(restored) == summary["key"]
+        assert self.rows(restored) == 1000
+
+
+class TestArchiveBackup:
+    """Closed partitions live in the column archive: the backup must carry them too."""
+
+    @pytest.fixture
+    def env(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            live = os.path.join(tmp_dir, "live")
+            db = SqliteDB(db_path=os.path.join(live, "localedge.db"), pooled=True)
+            store = ReadingStore(db, partition="day", archive=ColumnarArchive(os.path.join(live, "archive")))
+            s3 = FakeS3Client()
+            backup = SnapshotBackup(db.db_path, "bucket", "localedge/test", os.path.join(tmp_dir, "backup"),
+                                    s3=s3, chunk_bytes=CHUNK, archive_dir=store.archive.directory)
+            yield store, s3, backup, tmp_dir
+            db.close()
+
+    def test_compacted_store_restores_completely(self, env):
+        store, s3, backup, tmp_dir = env
+        for d in range(4):
+            store.insert_dht22([(MONDAY + d * DAY + 60 * i, 20.0 + d, 50.0, 40.0, "OK") for i in range(10)])
+        assert len(store.compact(now=MONDAY + 3 * DAY + 60)) == 2  # days 0 and 1 left SQLite
+        backup.run()
+
+        restored_dir = os.path.join(tmp_dir, "restored")
+        os.makedirs(os.path.join(restored_dir, "archive"))
+        backup.restore(os.path.join(restored_dir, "localedge.db"), archive_dir=os.path.join(restored_dir, "archive"))
+        restored_db = SqliteDB(db_path=os.path.join(restored_dir, "localedge.db"))
+        restored = ReadingStore(restored_db, partition="day",
+                                archive=ColumnarArchive(os.path.join(restored_dir, "archive")))
+        readings = store.readings("dht22", MONDAY, MONDAY + 4 * DAY)
+        assert len(readings) == 40
+        assert restored.readings("dht22", MONDAY, MONDAY + 4 * DAY) == readings
+
+    def test_archived_periods_are_uploaded_once(self, env):
+        store, s3, backup, tmp_dir = env
+        for d in range(3):
+            store.insert_dht22([(MONDAY + d * DAY + 60, 20.0 + d, 50.0, 40.0, "OK")])
+        store.compact(now=MONDAY + 2 * DAY + 60)
+        assert backup.run()["archive_periods_uploaded"] == 1
+
+        store.insert_dht22([(MONDAY + 3 * DAY + 60, 23.0, 50.0, 40.0, "OK")])
+        store.compact(now=MONDAY + 3 * DAY + 60)
+        assert backup.run()["archive_periods_uploaded"] == 1  # only day 1, day 0 is already off-site
+
+        store.insert_dht22([(MONDAY + 120, 20.5, 50.0, 40.0, "OK")])  # late upload, merged on compaction
+        store.compact(now=MONDAY + 3 * DAY + 60)
+        assert backup.run()["archive_periods_uploaded"] == 1
+        latest = json.loads(s3.objects[("bucket", "localedge/test/latest.json")])
+        assert sorted(latest["archive"]) == ["dht22/20240527", "dht22/20240528"]
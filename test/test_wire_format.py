@@ -0,0 +1,91 @@
+import importlib
+import struct
+import time
+
+import pytest
+
+from app import create_app
+from sensor_manager.sensor_pipeline import SensorPipeline
+from sensor_manager.wire_format import CONTENT_TYPE, FrameError, decode_frame, encode_frame
+
+
+class TestWireFormat:
+    """Test suite for the binary Pico -> Pi frame format."""
+
+    def test_roundtrip_dht22(self):
+        frame = encode_frame("dht22", 7, [(1, 1717000000.0, 22.5, 60.0, 41.2, 0),
+                                          (2, 1717000001.25, -3.7, 61.1, 41.5, 1)])
+        assert len(frame) == 8 + 2 * 17
+
+        decoded = decode_frame(frame, now=1717000000)
+        assert decoded.kind == "dht22"
+        assert decoded.device_id == 7
+        assert decoded.seqs == [1, 2]
+        assert decoded.rows[0] == pytest.approx((1717000000.0, 22.5, 60.0, 41.2, "OK"))
+        assert decoded.rows[1][0] == 1717000001.25
+        assert decoded.rows[1][1:4] == pytest.approx((-3.7, 61.1, 41.5))
+        assert decoded.rows[1][4] == "WARNING"
+
+    def test_ens160_uses_integer_fields(self):
+        frame = encode_frame("ens160", 1, [(9, 1717000000.0, 400, 150, 2, 0)])
+        assert len(frame) == 8 + 16
+        assert decode_frame(frame, now=1717000000).rows == [(1717000000.0, 400, 150, 2, "OK")]
+
+    def test_bad_records_are_reported(self):
+        frame = encode_frame("dht22", 1, [(1, 1.0, 20.0, 1.0, 1.0, 0), (2, 2.0, 1.0, 1.0, 1.0, 99)])
+        frame = frame[:8 + 8] + b"\xe8\x03" + frame[8 + 10:]  # millis = 1000 in the first record
+        decoded = decode_frame(frame, now=0)
+        assert decoded.rows == []
+        assert [e["index"] for e in decoded.errors] == [0, 1]
+
+    def test_implausible_timestamps_are_reported(self):
+        now = 1717000000
+        frame = encode_frame("ens160", 1, [(1, now + 365 * 86400, 400, 150, 2, 0), (2, now - 60, 410, 150, 2, 0)])
+        decoded = decode_frame(frame, now=now)
+        assert decoded.seqs == [2] and decoded.indices == [1]
+        assert [e["index"] for e in decoded.errors] == [0]
+
+    @pytest.mark.parametrize("frame", [
+        b"\x01",  # shorter than the header
+        struct.pack("<BBIH", 2, 1, 1, 0),  # unknown version
+        struct.pack("<BBIH", 1, 9, 1, 0),  # unknown sensor
+        struct.pack("<BBIH", 1, 1, 1, 2) + b"\x00" * 17,  # count says 2, only one record
+    ])
+    def test_broken_frames_raise(self, frame):
+        with pytest.raises(FrameError):
+            decode_frame(frame)
+
+    def test_kind_must_match_route(self):
+        with pytest.raises(FrameError):
+            decode_frame(encode_frame("ens160", 1, []), expected_kind="dht22")
+
+
+class TestBinaryUpload:
+    """Test suite for Content-Type based selection on the existing routes."""
+
+    @pytest.fixture(autouse=True)
+    def setup_app(self, monkeypatch):
+        routes_module = importlib.import_module("app.routes.routes")
+        self.pipeline = SensorPipeline(api_key="test", server_url="http://localhost")
+        monkeypatch.setattr(routes_module, "pipeline", self.pipeline)
+        self.client = create_app().test_client()
+
+    def test_binary_frame_is_accepted(self):
+        frame = encode_frame("dht22", 3, [(1, time.time() - 60, 22.5, 60.0, 41.0, 0)])
+        response = self.client.post("/dht22", data=frame, content_type=CONTENT_TYPE)
+        assert response.status_code == 200
+        assert response.get_json()["accepted"] == 1
+        assert self.pipeline.latest("dht22", device="3")["temperature"] == 22.5  # device id from the frame header
+        assert self.pipeline.latest("dht22") is None
+
+    def test_broken_frame_returns_400(self):
+        response = self.client.post("/ens160", data=b"\x01\x02", content_type=CONTENT_TYPE)
+        assert response.status_code == 400
+
+    def test_text_still_works(self):
+        response = self.client.post("/dht22", data="22.5,60,41.2,OK", content_type="text/plain")
+        assert response.get_json()["temperature"] == 22.5
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
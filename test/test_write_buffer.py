@@ -0,0 +1,89 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from storage.reading_store import ReadingStore
+from storage.sqlite_db import SqliteDB
+from storage.write_buffer import WriteBuffer, BufferFullError
+
+
+class TestWriteBuffer:
+    """Test suite for the group-commit WriteBuffer."""
+
+    @pytest.fixture
+    def store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = SqliteDB(db_path=os.path.join(tmp_dir, "buffer.db"), pooled=True)
+            yield ReadingStore(db)
+            db.close()
+
+    @staticmethod
+    def count(store, table):
+        return store.db.fetchone(f"SELECT COUNT(*) FROM {table}")[0]
+
+    def test_flush_writes_both_sensors_in_one_go(self, store):
+        """A manual flush persists every pending row and counts one flush."""
+        buffer = WriteBuffer(store, max_batch=100, autostart=False)
+        buffer.submit("dht22", (1.0, 22.5, 60.0, 41.2, "OK"))
+        buffer.submit("ens160", (1.0, 400.0, 150.0, 2.0, "OK"))
+
+        assert buffer.flush() == 2
+        assert self.count(store, "dht22_readings") == 1
+        assert self.count(store, "ens160_readings") == 1
+        assert buffer.stats()["flush_count"] == 1
+        assert buffer.stats()["queue_depth"] == 0
+
+    def test_size_triggers_background_flush(self, store):
+        """Reaching max_batch wakes the flusher without waiting for max_age."""
+        buffer = WriteBuffer(store, max_batch=5, max_age=60.0)
+        for i in range(5):
+            buffer.submit("dht22", (float(i), 22.0, 50.0, 40.0, "OK"))
+
+        deadline = time.monotonic() + 5
+        while buffer.stats()["rows_flushed"] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        buffer.close()
+        assert self.count(store, "dht22_readings") == 5
+
+    def test_age_triggers_background_flush(self, store):
+        """A lone reading is flushed once it is older than max_age."""
+        buffer = WriteBuffer(store, max_batch=1000, max_age=0.05)
+        buffer.submit("dht22", (1.0, 22.0, 50.0, 40.0, "OK"))
+
+        deadline = time.monotonic() + 5
+        while buffer.stats()["rows_flushed"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert buffer.stats()["rows_flushed"] == 1
+        buffer.close()
+
+    def test_full_queue_applies_backpressure(self, store):
+        """Once max_queue rows are pending, submit() refuses instead of growing."""
+        buffer = WriteBuffer(store, max_batch=2, max_queue=2, autostart=False)
+        buffer.submit("dht22", (1.0, 22.0, 50.0, 40.0, "OK"))
+        buffer.submit("dht22", (2.0, 22.0, 50.0, 40.0, "OK"))
+
+        with pytest.raises(BufferFullError):
+            buffer.submit("dht22", (3.0, 22.0, 50.0, 40.0, "OK"))
+        assert buffer.stats()["rejected"] == 1
+        assert buffer.stats()["max_queue_depth"] == 2
+
+    def test_close_flushes_remaining_rows(self, store):
+        """Shutdown drains the buffer."""
+        buffer = WriteBuffer(store, max_batch=1000, max_age=60.0)
+        buffer.submit("ens160", (1.0, 400.0, 150.0, 2.0, "OK"))
+        buffer.close()
+        assert self.count(store, "ens160_readings") == 1
+
+        with pytest.raises(RuntimeError):
+            buffer.submit("ens160", (2.0, 400.0, 150.0, 2.0, "OK"))
+
+    def test_unknown_kind_rejected(self, store):
+        buffer = WriteBuffer(store, autostart=False)
+        with pytest.raises(ValueError):
+            buffer.submit("bme280", (1.0, 0.0, 0.0, 0.0, "OK"))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,126 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+import pytest
+
+from storage.reading_store import ReadingStore, store_layout
+from storage.sqlite_db import SqliteDB
+from storage.write_buffer import WriteBuffer
+from storage.writer_process import RemoteStore, StorageWriter, WriterError, WriterUnavailableError
+
+DAY = 1717027200  # 2024-05-30 00:00 UTC
+
+
+class TestStorageWriter:
+    """Workers write through one writer process and read the database themselves."""
+
+    @pytest.fixture
+    def paths(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yield os.path.join(tmp_dir, "writer.db"), os.path.join(tmp_dir, "writer.sock")
+
+    @pytest.fixture
+    def writer(self, paths):
+        db_path, socket_path = paths
+        writer = StorageWriter(ReadingStore(SqliteDB(db_path=db_path, pooled=True), partition="day"),
+                               socket_path, authkey=b"secret")
+        writer.start()
+        yield writer
+        writer.close(drain_seconds=1)
+
+    @pytest.fixture
+    def remote(self, paths, writer):
+        db = SqliteDB(db_path=paths[0], pooled=True)
+        remote = RemoteStore(db, paths[1], authkey=b"secret", connect_timeout=2, partition="day")
+        yield remote
+        remote.close()
+        db.close()
+
+    def test_remote_inserts_are_committed_by_the_writer(self, remote, writer):
+        remote.wait_ready(timeout=2)
+        assert remote.insert_dht22([(DAY + 1, 22.5, 60.0, 41.2, "OK"), (DAY + 2, 22.6, 60.1, 41.3, "OK")]) == 2
+        assert remote.insert_batches({"ens160": [(DAY + 3, 400.0, 150.0, 2.0, "OK")], "dht22": []}) == 1
+
+        # the worker reads the partitions the writer created
+        assert [row[1] for row in remote.readings("dht22", DAY, DAY + 86400)] == [22.5, 22.6]
+        assert remote.readings("ens160", DAY, DAY + 86400)[0][1] == 400.0
+        assert writer.requests == 3  # ping + two inserts
+
+    def test_sequenced_retransmit_is_stored_once(self, remote):
+        rows = [(DAY + 1, 22.5, 60.0, 41.2, "OK"), (DAY + 2, 22.6, 60.1, 41.3, "OK")]
+        assert remote.insert_sequenced("dht22", rows, "kitchen", [7, 8]) == [0, 1]
+        assert remote.insert_sequenced("dht22", rows, "kitchen", [7, 8]) == []
+        assert len(remote.readings("dht22", DAY, DAY + 86400)) == 2
+
+    def test_requests_from_many_threads_are_group_committed(self, remote, writer):
+        def send(thread):
+            for i in range(20):
+                remote.insert_dht22([(DAY + thread * 100 + i, 20.0, 50.0, 40.0, "OK")])
+
+        threads = [threading.Thread(target=send, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(remote.readings("dht22", DAY, DAY + 86400)) == 80
+        assert writer.commits <= writer.requests
+
+    def test_failed_request_does_not_fail_its_group(self, remote):
+        with pytest.raises(WriterError):
+            remote.insert_batches({"co2": [(DAY, 1.0)]})
+        assert remote.insert_dht22([(DAY + 1, 22.5, 60.0, 41.2, "OK")]) == 1
+
+    def test_write_buffer_flushes_through_the_writer(self, remote):
+        buffer = WriteBuffer(remote, max_batch=100, autostart=False)
+        buffer.submit("dht22", (DAY + 1, 22.5, 60.0, 41.2, "OK"))
+        buffer.submit("ens160", (DAY + 1, 400.0, 150.0, 2.0, "OK"))
+        assert buffer.flush() == 2
+        assert len(remote.readings("ens160", DAY, DAY + 86400)) == 1
+
+    def test_no_writer_raises_unavailable(self, paths):
+        db = SqliteDB(db_path=paths[0])
+        remote = RemoteStore(db, paths[1], connect_timeout=0.2)
+        with pytest.raises(WriterUnavailableError):
+            remote.insert_dht22([(DAY, 22.5, 60.0, 41.2, "OK")])
+
+    def test_writer_going_away_raises_unavailable(self, remote, writer):
+        remote.wait_ready(timeout=2)
+        writer.close(drain_seconds=0)
+        remote.connect_timeout = 0.2
+        with pytest.raises(WriterUnavailableError):
+            remote.insert_dht22([(DAY, 22.5, 60.0, 41.2, "OK")])
+
+
+class TestWriterProcessMain:
+    """The writer as its own process: started from the command line, stopped with SIGTERM."""
+
+    def test_sigterm_drains_and_removes_socket(self):
+        app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path, socket_path = os.path.join(tmp_dir, "main.db"), os.path.join(tmp_dir, "main.sock")
+            env = dict(os.environ, SECRET_KEY="process-secret")
+            process = subprocess.Popen([sys.executable, "-m", "storage.writer_process", "--db", db_path,
+                                        "--socket", socket_path], cwd=app_dir, env=env)
+            db = SqliteDB(db_path=db_path)
+            remote = RemoteStore(db, socket_path, authkey=b"process-secret", connect_timeout=20,
+                                 **store_layout(db_path))  # the layout the writer opens
+            try:
+                remote.wait_ready()
+                assert remote.insert_dht22([(DAY + 1, 22.5, 60.0, 41.2, "OK")]) == 1
+                remote.close()
+                process.send_signal(signal.SIGTERM)
+                assert process.wait(timeout=20) == 0
+            finally:
+                if process.poll() is None:
+                    process.kill()
+            assert not os.path.exists(socket_path)
+            assert len(ReadingStore(db, **store_layout(db_path)).readings("dht22", DAY, DAY + 86400)) == 1
+            db.close()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])